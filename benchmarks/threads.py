@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+'''
+Measure the compilation throughput with an increasing number of threads
+
+On a free-threaded Python, the throughput should grow almost linearly with
+the number of threads up to the number of cores.
+The threads compile the same queries unless they build their own.
+'''
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+# Measure the sql package of the source tree
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql import Flavor, Table, compile  # noqa: E402
+from sql.aggregate import Count  # noqa: E402
+from sql.functions import Upper  # noqa: E402
+
+
+def queries(count):
+    "Return count queries to compile"
+    user = Table('user')
+    group = Table('user_group')
+    result = []
+    for i in range(count):
+        join = user.join(group, condition=group.user == user.id)
+        result.append(join.select(user.id, Upper(user.name),
+                Count(group.id),
+                where=(user.active == True)  # noqa: E712
+                & user.name.ilike('%%%s%%' % i)
+                & group.id.in_([i, i + 1, i + 2]),
+                group_by=[user.id, user.name],
+                order_by=[user.name.asc],
+                limit=10, offset=i))
+    return result
+
+
+def run(threads, shared, flavor, private=False):
+    '''
+    Return the number of queries compiled per second by threads
+
+    If private is set, each thread compiles its own copy of the shared
+    queries built before the measure.
+    '''
+    barrier = Barrier(threads + 1)
+
+    def work():
+        compiled = queries(len(shared)) if private else shared
+        barrier.wait()
+        for query in compiled:
+            compile(query, flavor)
+
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(work) for _ in range(threads)]
+        barrier.wait()
+        start = time.perf_counter()
+        for future in futures:
+            future.result()
+        duration = time.perf_counter() - start
+    return threads * len(shared) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-t', '--threads', type=int,
+        default=os.cpu_count() or 1, help="the maximum number of threads")
+    parser.add_argument('-n', '--number', type=int, default=2000,
+        help="the number of queries compiled by each thread")
+    parser.add_argument('-p', '--private', action='store_true',
+        help="build the queries in each thread instead of sharing them")
+    args = parser.parse_args()
+
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)
+    print("Python %s, GIL %s, %s queries" % (
+            sys.version.split()[0],
+            'enabled' if is_gil_enabled() else 'disabled',
+            'private' if args.private else 'shared'))
+    flavor = Flavor.postgresql()
+    compiled = queries(args.number)
+    base = None
+    threads = 1
+    while threads <= args.threads:
+        throughput = run(threads, compiled, flavor, args.private)
+        if base is None:
+            base = throughput
+        print("%3i threads: %10.0f queries/s, speedup %5.2f" % (
+                threads, throughput, throughput / base))
+        threads *= 2
+
+
+if __name__ == '__main__':
+    main()
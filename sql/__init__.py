@@ -1,11 +1,93 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import copy
+import datetime
+import hashlib
 import numbers
+import os
+import re
 import string
+import uuid
 import warnings
-from collections import defaultdict
-from itertools import chain
-from threading import current_thread, local
+import weakref
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial
+from itertools import chain, count, islice, repeat
+from threading import local
+from types import MappingProxyType
+
+try:
+    from contextvars import ContextVar, copy_context
+except ImportError:
+    # Python 3.6
+    _variables = []
+
+    class ContextVar(object):
+        "Context variable stored per thread"
+        __slots__ = ('name', '_default', '_local')
+        _missing = object()
+
+        def __init__(self, name, default=_missing):
+            self.name = name
+            self._default = default
+            self._local = local()
+            _variables.append(self)
+
+        def _swap(self, value):
+            "Set the value of the thread and return the previous one"
+            previous = getattr(self._local, 'value', self._missing)
+            if value is self._missing:
+                if previous is not self._missing:
+                    del self._local.value
+            else:
+                self._local.value = value
+            return previous
+
+        def get(self, default=_missing):
+            try:
+                return self._local.value
+            except AttributeError:
+                if default is not self._missing:
+                    return default
+                elif self._default is not self._missing:
+                    return self._default
+                raise LookupError(self.name)
+
+        def set(self, value):
+            token = getattr(self._local, 'value', self._missing)
+            self._local.value = value
+            return token
+
+        def reset(self, token):
+            if token is self._missing:
+                del self._local.value
+            else:
+                self._local.value = token
+
+    class _Context(object):
+        '''
+        Copy of the values of the context variables of the current thread
+
+        The values are swapped with those of the thread while running.
+        '''
+        __slots__ = ('_values',)
+
+        def __init__(self):
+            self._values = {
+                v: getattr(v._local, 'value', v._missing) for v in _variables}
+
+        def run(self, func, *args, **kwargs):
+            values = {v: v._swap(value) for v, value in self._values.items()}
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for variable, value in values.items():
+                    self._values[variable] = variable._swap(value)
+
+    def copy_context():
+        return _Context()
 
 __version__ = '1.7.1'
 __all__ = [
@@ -13,7 +95,7 @@ __all__ = [
     'Matched', 'MatchedUpdate', 'MatchedDelete',
     'NotMatched', 'NotMatchedInsert',
     'Rollup', 'Cube', 'Excluded', 'Join', 'Asc', 'Desc', 'NullsFirst',
-    'NullsLast', 'format2numeric']
+    'NullsLast', 'Param', 'Template', 'format2numeric']
 
 
 def _escape_identifier(name):
@@ -42,6 +124,62 @@ def alias(i, letters=string.ascii_lowercase):
     return s
 
 
+# The versions of the flavors are unique across all the flavors
+_versions = count()
+
+
+class _FunctionMapping(dict):
+    "Function mapping which changes the version of its flavor when modified"
+    __slots__ = ('_flavor',)
+
+    def __init__(self, flavor, *args):
+        super().__init__(*args)
+        self._flavor = weakref.ref(flavor)
+
+    def _changed(self):
+        flavor = self._flavor()
+        if flavor is not None:
+            flavor._changed()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
 class Flavor(object):
     '''
     Contains the flavor of SQL
@@ -57,11 +195,13 @@ class Flavor(object):
         function_mapping - dictionary with Function to replace
         filter_ - support filter on aggregate functions
         escape_empty - support empty escape
+        deduplicate - reuse the numbered or named marker of equal parameters
     '''
 
     def __init__(self, limitstyle='limit', max_limit=None, paramstyle='format',
             ilike=False, no_as=False, no_boolean=False, null_ordering=True,
-            function_mapping=None, filter_=False, escape_empty=False):
+            function_mapping=None, filter_=False, escape_empty=False,
+            deduplicate=False):
         if limitstyle not in {'fetch', 'limit', 'rownum'}:
             raise ValueError("unsupported limitstyle: %r" % limitstyle)
         self.limitstyle = limitstyle
@@ -69,7 +209,8 @@ class Flavor(object):
                 and not isinstance(max_limit, numbers.Integral)):
             raise ValueError("unsupported max_limit: %r" % max_limit)
         self.max_limit = max_limit
-        if paramstyle not in {'format', 'qmark'}:
+        if paramstyle not in {
+                'format', 'qmark', 'numeric', 'dollar', 'named', 'pyformat'}:
             raise ValueError("unsupported paramstyle: %r" % paramstyle)
         self.paramstyle = paramstyle
         self.ilike = bool(ilike)
@@ -79,33 +220,214 @@ class Flavor(object):
         self.function_mapping = dict(function_mapping or {})
         self.filter_ = bool(filter_)
         self.escape_empty = bool(escape_empty)
+        self.deduplicate = bool(deduplicate)
+
+    def __setattr__(self, name, value):
+        if (name == 'function_mapping'
+                and not isinstance(value, MappingProxyType)):
+            value = _FunctionMapping(self, value)
+        super().__setattr__(name, value)
+        self._changed()
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        self._changed()
+
+    def __setstate__(self, state):
+        # The copies have their own version and function mapping
+        for name, value in state.items():
+            if name != '_version':
+                setattr(self, name, value)
+        self._changed()
+
+    def _changed(self):
+        "Give a new version to the flavor after a modification"
+        object.__setattr__(self, '_version', next(_versions))
 
     @property
     def param(self):
+        '''
+        The parameter marker
+
+        For the numbered and named paramstyles, it is the template to
+        format with the number or the name of the parameter.
+        '''
         if self.paramstyle == 'format':
             return '%s'
         elif self.paramstyle == 'qmark':
             return '?'
+        elif self.paramstyle == 'numeric':
+            return ':%i'
+        elif self.paramstyle == 'dollar':
+            return '$%i'
+        elif self.paramstyle == 'named':
+            return ':%s'
+        elif self.paramstyle == 'pyformat':
+            return '%%(%s)s'
+
+    @staticmethod
+    def postgresql(**options):
+        '''
+        Return the immutable flavor of PostgreSQL updated with options
+
+        >>> Flavor.postgresql() is Flavor.postgresql()
+        True
+        '''
+        return _preset(dict(ilike=True, filter_=True), options)
+
+    @staticmethod
+    def sqlite(**options):
+        "Return the immutable flavor of SQLite updated with options"
+        return _preset(dict(
+                paramstyle='qmark', null_ordering=False, max_limit=-1),
+            options)
+
+    @staticmethod
+    def mysql(**options):
+        '''
+        Return the immutable flavor of MySQL updated with options
+
+        The identifiers are quoted so the ANSI_QUOTES SQL mode is needed.
+        '''
+        return _preset(dict(
+                null_ordering=False, max_limit=18446744073709551615),
+            options)
+
+    @staticmethod
+    def oracle(**options):
+        "Return the immutable flavor of Oracle updated with options"
+        return _preset(dict(
+                limitstyle='rownum', paramstyle='numeric', no_as=True,
+                no_boolean=True),
+            options)
+
+    @staticmethod
+    def mssql(**options):
+        "Return the immutable flavor of SQL Server updated with options"
+        return _preset(dict(
+                limitstyle='fetch', paramstyle='qmark', no_boolean=True,
+                null_ordering=False),
+            options)
 
     @staticmethod
     def set(flavor):
-        '''Set this thread's flavor to flavor.'''
-        current_thread().__sql_flavor__ = flavor
+        '''Set the flavor of the current context to flavor.'''
+        _flavor.set(flavor)
 
     @staticmethod
     def get():
         '''
-        Return this thread's flavor.
+        Return the flavor of the current context.
 
-        If this thread does not yet have a flavor, returns a new flavor and
-        sets this thread's flavor.
+        If the context does not yet have a flavor, returns a new flavor and
+        sets the flavor of the context.
         '''
-        try:
-            return current_thread().__sql_flavor__
-        except AttributeError:
+        flavor = _flavor.get()
+        if flavor is None:
             flavor = Flavor()
-            current_thread().__sql_flavor__ = flavor
-            return flavor
+            _flavor.set(flavor)
+        return flavor
+
+    @staticmethod
+    @contextmanager
+    def use(flavor):
+        '''
+        Use flavor in the current context until the end of the block
+
+        >>> with Flavor.use(Flavor(paramstyle='qmark')):
+        ...     Flavor.get().paramstyle
+        'qmark'
+        '''
+        token = _flavor.set(flavor)
+        try:
+            yield flavor
+        finally:
+            _flavor.reset(token)
+
+
+class _Preset(Flavor):
+    '''
+    Immutable and hashable flavor
+
+    The copies are modifiable flavors.
+    '''
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        key = []
+        for name, value in sorted(vars(self).items()):
+            if name == '_version':
+                continue
+            elif name == 'function_mapping':
+                value = frozenset(value.items())
+            key.append((name, value))
+        self.function_mapping = MappingProxyType(self.function_mapping)
+        self._key = tuple(key)
+
+    def __setattr__(self, name, value):
+        if '_key' in vars(self):
+            raise AttributeError("preset flavor is immutable")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError("preset flavor is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, _Preset):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __copy__(self):
+        flavor = Flavor.__new__(Flavor)
+        vars(flavor).update(vars(self))
+        del vars(flavor)['_key']
+        flavor.function_mapping = dict(self.function_mapping)
+        return flavor
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        options = dict(self._key)
+        options['function_mapping'] = dict(options['function_mapping'])
+        return _preset, (options, {})
+
+
+_presets = {}
+
+
+def _preset(defaults, options):
+    "Return the unique preset flavor of the defaults updated with options"
+    flavor = _Preset(**dict(defaults, **options))
+    return _presets.setdefault(flavor, flavor)
+
+
+# Each thread and asyncio task has its own context
+_flavor = ContextVar('sql_flavor', default=None)
+# Set to False to skip the validation of the items of the sequences
+_validate = ContextVar('sql_validate', default=True)
+
+
+class _AliasState(object):
+    "The aliases of a context"
+    __slots__ = ('alias', 'nested', 'exclude', 'token')
+
+    def __init__(self):
+        self.alias = None
+        self.nested = 0
+        self.exclude = None
+        self.token = None
+
+
+class _LocalState(object):
+    "Descriptor of the alias state of the current context"
+    __slots__ = ()
+
+    def __get__(self, instance, owner):
+        return owner._state(create=True)
 
 
 class AliasManager(object):
@@ -114,57 +436,101 @@ class AliasManager(object):
     '''
     __slots__ = ()
 
-    local = local()
-    local.alias = None
-    local.nested = 0
-    local.exclude = None
+    _local = ContextVar('sql_alias', default=None)
+    # The tokens of this variable identify the context owning the state
+    _owner = ContextVar('sql_alias_owner', default=None)
+    local = _LocalState()
 
     def __init__(self, exclude=None):
         if exclude:
-            if getattr(self.local, 'exclude', None) is None:
-                self.local.exclude = []
-            self.local.exclude.extend(exclude)
+            local = self._state(create=True)
+            if local.exclude is None:
+                local.exclude = []
+            local.exclude.extend(exclude)
+
+    @classmethod
+    def _state(cls, create=False):
+        '''
+        Return the state of the current context
+
+        The state inherited from the context from which the current context
+        was copied is replaced by a new state.
+        '''
+        local = cls._local.get()
+        if local is not None:
+            try:
+                # A token can be reset only in the context which created it
+                cls._owner.reset(local.token)
+            except (ValueError, RuntimeError):
+                state = _AliasState()
+                if local.exclude is not None:
+                    state.exclude = list(local.exclude)
+                local = state
+                cls._local.set(local)
+        elif create:
+            local = _AliasState()
+            cls._local.set(local)
+        else:
+            return None
+        local.token = cls._owner.set(local)
+        return local
+
+    @classmethod
+    def _active(cls):
+        "Test if aliases are generated in the current context"
+        local = cls._local.get()
+        return local is not None and local.alias is not None
 
     @classmethod
     def __enter__(cls):
-        if getattr(cls.local, 'alias', None) is None:
-            cls.local.alias = defaultdict(cls.alias_factory)
-            cls.local.nested = 0
-        if getattr(cls.local, 'exclude', None) is None:
-            cls.local.exclude = []
-        cls.local.nested += 1
+        local = cls._state()
+        if local is None or local.alias is None:
+            # Use new aliases to not share them with the copied contexts
+            state = _AliasState()
+            if local is not None:
+                state.exclude = local.exclude
+            local = state
+            local.alias = defaultdict(cls.alias_factory)
+            cls._local.set(local)
+            local.token = cls._owner.set(local)
+        if local.exclude is None:
+            local.exclude = []
+        local.nested += 1
 
     @classmethod
     def __exit__(cls, type, value, traceback):
-        cls.local.nested -= 1
-        if not cls.local.nested:
-            cls.local.alias = None
-            cls.local.exclude = None
+        local = cls._local.get()
+        local.nested -= 1
+        if not local.nested:
+            cls._local.set(None)
 
     @classmethod
     def get(cls, from_):
-        if getattr(cls.local, 'alias', None) is None:
+        local = cls._local.get()
+        if local is None or local.alias is None:
             return ''
-        if from_ in cls.local.exclude:
+        if from_ in local.exclude:
             return ''
-        return cls.local.alias[id(from_)]
+        return local.alias[id(from_)]
 
     @classmethod
     def contains(cls, from_):
-        if getattr(cls.local, 'alias', None) is None:
+        local = cls._local.get()
+        if local is None or local.alias is None:
             return False
-        if from_ in cls.local.exclude:
+        if from_ in local.exclude:
             return False
-        return id(from_) in cls.local.alias
+        return id(from_) in local.alias
 
     @classmethod
     def set(cls, from_, alias):
-        assert cls.local.alias.get(from_) is None
-        cls.local.alias[id(from_)] = alias
+        local = cls._local.get()
+        assert local.alias.get(from_) is None
+        local.alias[id(from_)] = alias
 
     @classmethod
     def alias_factory(cls):
-        i = len(cls.local.alias)
+        i = len(cls._local.get().alias)
         return alias(i)
 
 
@@ -181,16 +547,959 @@ def format2numeric(query, params):
     return (query % tuple(':%i' % i for i, _ in enumerate(params)), params)
 
 
-class Query(object):
-    __slots__ = ('__weakref__',)
+@contextmanager
+def trusted():
+    '''
+    Skip the validation of the items of the sequences set on the queries
+    until the end of the block
+
+    The types of the items must be guaranteed by the caller.
+
+    >>> table = Table('t')
+    >>> with trusted():
+    ...     query = table.select(*[table.c] * 3)
+    >>> tuple(query)
+    ('SELECT "a"."c", "a"."c", "a"."c" FROM "t" AS "a"', ())
+    '''
+    token = _validate.set(False)
+    try:
+        yield
+    finally:
+        _validate.reset(token)
+
+
+def compile(query, flavor=None, encoding=None):
+    '''
+    Compile query into SQL and parameters in a single pass
+
+    If encoding is set, the SQL is returned as bytes.
+
+    >>> table = Table('t')
+    >>> compile(table.select(where=table.c == 1), Flavor(paramstyle='qmark'))
+    ('SELECT * FROM "t" AS "a" WHERE "a"."c" = ?', (1,))
+    >>> compile(table.select(), encoding='utf-8')
+    (b'SELECT * FROM "t" AS "a"', ())
+    '''
+    if flavor is None:
+        ctx = Compiler()
+        ctx.compile(query)
+    else:
+        # Nodes compiled with __str__ and params use the context's flavor
+        with Flavor.use(flavor):
+            ctx = Compiler(flavor)
+            ctx.compile(query)
+    sql, params = ctx._join(ctx._sql, ctx._params)
+    if encoding is not None:
+        # Encoding the joined SQL is faster than joining encoded fragments
+        sql = sql.encode(encoding)
+    return sql, params
+
+
+def compile_multi(query, flavors, encoding=None):
+    '''
+    Compile query into SQL and parameters for each flavor
+
+    The query is compiled once for the flavors which differ only by the
+    parameter markers or by attributes not used by the query.
+
+    >>> table = Table('t')
+    >>> compile_multi(table.select(where=table.c == 1),
+    ...     [Flavor.postgresql(), Flavor.sqlite()])
+    [('SELECT * FROM "t" AS "a" WHERE "a"."c" = %s', (1,)), \
+('SELECT * FROM "t" AS "a" WHERE "a"."c" = ?', (1,))]
+    '''
+    compiled = []
+    result = []
+    for flavor in flavors:
+        for used, sql, params in compiled:
+            if all(getattr(flavor, name) == value
+                    for name, value in used.items()):
+                break
+        else:
+            ctx = _Tracer(flavor)
+            with Flavor.use(ctx.flavor):
+                ctx.compile(query)
+            used, sql, params = ctx.used, ctx._sql, ctx._params
+            compiled.append((used, sql, params))
+        if flavor.paramstyle in {'format', 'qmark'}:
+            param = flavor.param
+            sql_ = ''.join(param if f is _placeholder else f for f in sql)
+            params_ = tuple(params)
+        else:
+            sql_, params_ = _placeholders(flavor, sql, params)
+        if encoding is not None:
+            sql_ = sql_.encode(encoding)
+        result.append((sql_, params_))
+    return result
+
+
+def compile_parallel(
+        queries, workers=None, flavor=None, encoding=None, chunksize=64):
+    '''
+    Compile the queries into SQL and parameters in a pool of processes
+
+    The queries are sent to the workers by chunks of chunksize and the
+    results are yielded in the order of the queries.
+    The flavor defaults to the flavor of the context.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive: %r" % chunksize)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    elif workers < 1:
+        raise ValueError("workers must be positive: %r" % workers)
+    if flavor is None:
+        flavor = Flavor.get()
+    queries = iter(queries)
+    pending = deque()
+    with ProcessPoolExecutor(workers) as executor:
+        try:
+            while True:
+                # Keep the workers busy without reading all the queries
+                while len(pending) < 2 * workers:
+                    chunk = list(islice(queries, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(
+                            _compile_chunk, chunk, flavor, encoding))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _compile_chunk(queries, flavor, encoding):
+    "Return the compiled queries"
+    return [compile(q, flavor, encoding) for q in queries]
+
+
+# Marker of the parameters numbered or named when the SQL is joined
+_placeholder = object()
+
+
+def _placeholders(flavor, sql, values):
+    '''
+    Return the SQL with the placeholders replaced by the numbered or named
+    parameter markers of flavor and the parameters
+    '''
+    markers = _Markers(flavor)
+    sql = markers.replace(sql, values)
+    return sql, markers.result()
+
+
+class _Markers(object):
+    '''
+    Replace the placeholders by the numbered or named parameter markers
+
+    The numbering continues between the calls to replace.
+    The generated names skip the names of the Param replaced by the same
+    call and a Param named as a name generated before raises a ValueError.
+    '''
+    __slots__ = ('template', 'named', 'deduplicate', 'params', '_markers',
+        '_n', '_names', '_generated')
+
+    def __init__(self, flavor):
+        self.template = flavor.param
+        self.named = flavor.paramstyle in {'named', 'pyformat'}
+        self.deduplicate = flavor.deduplicate
+        self.params = {} if self.named else []
+        self._markers = {}
+        self._n = 0
+        self._names = set()
+        self._generated = set()
+
+    def replace(self, sql, values):
+        "Return the SQL of the fragments with the values of the placeholders"
+        template, named, deduplicate = (
+            self.template, self.named, self.deduplicate)
+        params, markers, n = self.params, self._markers, self._n
+        if named:
+            self._names.update(
+                v.name for v in values if isinstance(v, Param))
+        values = iter(values)
+        fragments = []
+        for fragment in sql:
+            if fragment is _placeholder:
+                value = next(values)
+                if deduplicate:
+                    key = _identity(value)
+                    if key in markers:
+                        fragments.append(markers[key])
+                        continue
+                n += 1
+                if named:
+                    if isinstance(value, Param):
+                        name = value.name
+                        if name in self._generated:
+                            raise ValueError(
+                                "parameter name already used: %r" % name)
+                    else:
+                        name = 'p%i' % n
+                        while name in params or name in self._names:
+                            name += '_'
+                        self._generated.add(name)
+                    params[name] = value
+                    fragment = template % name
+                else:
+                    params.append(value)
+                    fragment = template % n
+                if deduplicate:
+                    markers[key] = fragment
+            fragments.append(fragment)
+        self._n = n
+        return ''.join(fragments)
+
+    def result(self):
+        "Return the parameters"
+        return self.params if self.named else tuple(self.params)
+
+
+# The types for which equal values are the same parameter
+_EQUAL_TYPES = {int, str, bytes, bool, datetime.date, uuid.UUID}
+
+
+def _identity(value):
+    "Return the key of identical parameters"
+    cls = value.__class__
+    if cls in _EQUAL_TYPES:
+        return (cls, value)
+    return id(value)
+
+
+def _split_format(sql, flavor):
+    "Split SQL of format paramstyle into fragments and placeholders"
+    fragments = []
+    for part in re.split('(%%|%s)', sql):
+        if part == '%s':
+            fragments.append(_placeholder)
+        elif part == '%%':
+            fragments.append('%%' if flavor.paramstyle == 'pyformat' else '%')
+        elif part:
+            fragments.append(part)
+    return fragments
+
+
+def _close(children):
+    "Close the generator children"
+    close = getattr(children, 'close', None)
+    if close is not None:
+        close()
+
+
+class Compiler(object):
+    '''
+    Context to compile SQL and parameters in a single pass
+
+    With the numbered and named paramstyles, the parameter markers are
+    placeholders replaced when the SQL is joined.
+
+    The _compile method of the nodes may be a generator yielding the
+    children to compile in place.
+
+    Contains:
+        flavor - the flavor used to compile
+        param - the parameter marker of the flavor or the placeholder
+        streaming - the fragments are consumed in order while compiling
+        memoize - the frozen nodes may reuse their compilation
+    '''
+    __slots__ = ('flavor', 'param', '_sql', '_params')
+    streaming = False
+    memoize = True
+
+    def __init__(self, flavor=None):
+        if flavor is None:
+            flavor = Flavor.get()
+        self.flavor = flavor
+        if flavor.paramstyle in {'format', 'qmark'}:
+            self.param = flavor.param
+        else:
+            self.param = _placeholder
+        self._sql = []
+        self._params = []
+
+    @property
+    def sql(self):
+        return self._join(self._sql, self._params)[0]
+
+    @property
+    def params(self):
+        if self.param is _placeholder:
+            return self._join(self._sql, self._params)[1]
+        return tuple(self._values(self._params))
+
+    def _values(self, params):
+        "Return the values of the parameters"
+        return params
+
+    def _join(self, sql, params):
+        params = self._values(params)
+        if self.param is _placeholder:
+            return _placeholders(self.flavor, sql, params)
+        return ''.join(sql), tuple(params)
+
+    def write(self, sql):
+        self._sql.append(sql)
+
+    def add_param(self, value):
+        self._sql.append(self.param)
+        self._params.append(value)
+
+    def add_params(self, params):
+        "Add the parameters of SQL already written"
+        self._params.extend(params)
+
+    def compile(self, node):
+        self.run(self._children(node))
+
+    def _children(self, node):
+        "Compile node and return the generator of its children if any"
+        cls = node.__class__
+        try:
+            compile_ = _compilers[cls]
+        except KeyError:
+            compile_ = _compilers[cls] = _get_compiler(cls)
+        return compile_(node, self)
+
+    def run(self, children):
+        '''
+        Compile the nodes yielded by the generator or the iterable children
+
+        The nodes are compiled with an explicit stack of generators so the
+        depth of the tree is not limited by the recursion.
+        '''
+        if children is None:
+            return
+        children = iter(children)
+        stack = []
+        push, pop, compile_ = stack.append, stack.pop, self._children
+        try:
+            while True:
+                for node in children:
+                    grandchildren = compile_(node)
+                    if grandchildren is not None:
+                        push(children)
+                        children = grandchildren
+                        break
+                else:
+                    if not stack:
+                        break
+                    children = pop()
+        except BaseException:
+            stack.append(children)
+            while stack:
+                _close(pop())
+            raise
+
+    def join(self, separator, nodes, func=None):
+        "Compile each node with func separated by separator"
+        if func is None:
+            func = self.compile
+        for i, node in enumerate(nodes):
+            if i:
+                self._sql.append(separator)
+            func(node)
+
+    def iter_join(self, separator, nodes, func=None):
+        '''
+        Yield each node or the children returned by func separated by
+        separator to compile them in place
+        '''
+        for i, node in enumerate(nodes):
+            if i:
+                self.write(separator)
+            if func is None:
+                yield node
+            else:
+                children = func(node)
+                if children is not None:
+                    yield from children
+
+    @contextmanager
+    def capture(self, enabled=True):
+        '''
+        Redirect the compilation into a fragment to extend later
+
+        If not enabled, the compilation is written and the fragment is empty.
+        '''
+        fragment = ([], [])
+        if not enabled:
+            yield fragment
+            return
+        sql, params = self._sql, self._params
+        self._sql, self._params = fragment
+        try:
+            yield fragment
+        finally:
+            self._sql, self._params = sql, params
+
+    def extend(self, fragment):
+        sql, params = fragment
+        self._sql.extend(sql)
+        self._params.extend(params)
+
+    def render(self, node):
+        "Return the SQL and parameters of node without writing them"
+        with self.capture() as (sql, params):
+            self.compile(node)
+        return self._join(sql, params)
+
+
+class _Writer(Compiler):
+    '''
+    Compiler writing the SQL in chunks while compiling
+
+    The fragments are written when their number reaches size and they are
+    not captured.
+    '''
+    __slots__ = ('_output', '_top', '_markers', '_flushed', 'size')
+    streaming = True
+
+    def __init__(self, output, flavor=None, size=1024):
+        super().__init__(flavor)
+        self._output = output
+        self._top = self._sql
+        if self.param is _placeholder:
+            self._markers = _Markers(self.flavor)
+        else:
+            self._markers = None
+        self._flushed = []
+        self.size = size
+
+    def write(self, sql):
+        self._sql.append(sql)
+        if len(self._sql) >= self.size and self._sql is self._top:
+            self.flush()
+
+    def add_param(self, value):
+        self._sql.append(self.param)
+        self._params.append(value)
+        if len(self._sql) >= self.size and self._sql is self._top:
+            self.flush()
+
+    def flush(self):
+        "Write the fragments compiled"
+        sql, params = self._top, self._params
+        if self._markers is not None:
+            chunk = self._markers.replace(sql, params)
+        else:
+            chunk = ''.join(sql)
+            self._flushed.extend(params)
+        del sql[:]
+        del params[:]
+        if chunk:
+            self._output(chunk)
+
+    def close(self):
+        "Write the remaining fragments and return the parameters"
+        self.flush()
+        if self._markers is not None:
+            return self._markers.result()
+        return tuple(self._flushed)
+
+    def steps(self, node):
+        '''
+        Compile node and yield after each node compiled
+
+        The compilation can be suspended between the nodes to consume the
+        chunks written.
+        '''
+        children = self._children(node)
+        if children is None:
+            return
+        stack = []
+        push, pop, compile_ = stack.append, stack.pop, self._children
+        try:
+            while True:
+                for node in children:
+                    grandchildren = compile_(node)
+                    yield
+                    if grandchildren is not None:
+                        push(children)
+                        children = grandchildren
+                        break
+                else:
+                    if not stack:
+                        break
+                    children = pop()
+        finally:
+            stack.append(children)
+            while stack:
+                _close(pop())
+
+
+class _Chunks(object):
+    '''
+    Iterator over the chunks of the SQL of a query
+
+    The query is compiled in its own context while the chunks are consumed.
+
+    Contains:
+        params - the parameters once all the chunks are consumed
+    '''
+    __slots__ = ('_iterator', '_params')
+
+    def __init__(self, query, flavor=None, encoding=None):
+        self._params = _unset
+        self._iterator = self._iterate(query, flavor, encoding)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
 
     @property
     def params(self):
+        if self._params is _unset:
+            raise ValueError("chunks not consumed")
+        return self._params
+
+    def _iterate(self, query, flavor, encoding):
+        chunks = deque()
+        output = chunks.append
+        if encoding is not None:
+            def output(chunk, output=output):
+                return output(chunk.encode(encoding))
+        # The flavor and the aliases must not leak between the chunks
+        context = copy_context()
+
+        def start():
+            token = None
+            if flavor is not None:
+                token = _flavor.set(flavor)
+            ctx = _Writer(output, flavor)
+            return token, ctx, ctx.steps(query)
+        token, ctx, steps = context.run(start)
+        try:
+            for _ in iter(partial(context.run, next, steps, _unset), _unset):
+                while chunks:
+                    yield chunks.popleft()
+            params = context.run(ctx.close)
+        finally:
+            context.run(steps.close)
+            if token is not None:
+                context.run(_flavor.reset, token)
+        yield from chunks
+        self._params = params
+
+
+class _TracedFlavor(Flavor):
+    "Flavor recording the value of the attributes read"
+
+    def __init__(self, flavor):
+        vars(self).update(vars(flavor))
+        self._used = {}
+
+    def __getattribute__(self, name):
+        value = super().__getattribute__(name)
+        if not name.startswith('_'):
+            super().__getattribute__('_used')[name] = value
+        return value
+
+
+class _Tracer(Compiler):
+    "Compiler recording the attributes of the flavor used"
+    __slots__ = ()
+    # The memoized nodes do not read the flavor
+    memoize = False
+
+    def __init__(self, flavor):
+        super().__init__(flavor)
+        self.flavor = flavor = _TracedFlavor(flavor)
+        self.param = _placeholder
+
+    @property
+    def used(self):
+        "The attributes of the flavor used"
+        return self.flavor._used
+
+
+def _write(query, output, flavor=None, encoding=None):
+    "Compile query by calling output with chunks of SQL"
+    if encoding is not None:
+        def output(chunk, output=output):
+            return output(chunk.encode(encoding))
+    if flavor is None:
+        ctx = _Writer(output)
+        ctx.compile(query)
+    else:
+        with Flavor.use(flavor):
+            ctx = _Writer(output, flavor)
+            ctx.compile(query)
+    return ctx.close()
+
+
+def _pause(node, ctx):
+    "Compile nothing, None is yielded to suspend the streaming compilation"
+
+
+_compilers = {type(None): _pause}
+
+
+def _get_compiler(cls):
+    '''
+    Return the function to compile instances of cls
+
+    The classes which override __str__ or params instead of _compile are
+    compiled by calling them.
+    '''
+    compile_ = getattr(cls, '_compile', None)
+
+    def overrides(name):
+        for klass in cls.__mro__:
+            attrs = vars(klass)
+            if '_compile' in attrs:
+                return False
+            elif name in attrs:
+                return True
+        return False
+
+    overrides_str = compile_ is None or overrides('__str__')
+    overrides_params = compile_ is None or overrides('params')
+    if not overrides_str and not overrides_params:
+        return compile_
+
+    def compile_legacy(node, ctx):
+        if not overrides_str or not overrides_params:
+            with ctx.capture() as (sql, params):
+                ctx.run(compile_(node, ctx))
+        with Flavor.use(_legacy_flavor(ctx)):
+            if overrides_str:
+                sql = _legacy_split(ctx, str(node))
+            if overrides_params:
+                legacy_params = node.params
+        if overrides_params:
+            ctx.extend((sql, []))
+            ctx.add_params(legacy_params)
+        else:
+            ctx.extend((sql, params))
+    return compile_legacy
+
+
+def _legacy_flavor(ctx):
+    "Return the flavor to call the legacy methods"
+    if ctx.param is _placeholder:
+        # Call the legacy methods with positional parameters
+        flavor = copy.copy(ctx.flavor)
+        flavor.paramstyle = 'format'
+        return flavor
+    return Flavor.get()
+
+
+def _legacy_split(ctx, sql):
+    "Return the fragments of the SQL returned by a legacy method"
+    if ctx.param is _placeholder:
+        return _split_format(sql, ctx.flavor)
+    return [sql]
+
+
+def _legacy_format(cls):
+    '''
+    Compile the operands of cls with its _format if it overrides it
+
+    The parameters are those of the operands compiled by the parent.
+    '''
+    if ('_format' not in vars(cls)
+            or '_compile_operand' in vars(cls)
+            or getattr(cls._compile_operand, 'legacy', False)):
+        return
+
+    def compile_operand(self, ctx, operand):
+        with ctx.capture() as (_, params):
+            ctx.run(super(cls, self)._compile_operand(ctx, operand))
+        with Flavor.use(_legacy_flavor(ctx)):
+            sql = self._format(operand)
+        ctx.extend((_legacy_split(ctx, sql), params))
         return ()
+    compile_operand.legacy = True
+    cls._compile_operand = compile_operand
+
+
+class _Array(list):
+    "Values passed as a single array parameter"
+    __slots__ = ()
+
+
+class _Unset(object):
+    "Marker of the slots not set"
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_unset'
+
+
+_unset = _Unset()
+_slots = {}
+
+
+def _get_slots(cls):
+    "Return the names of the slots of cls except the hidden slots"
+    try:
+        return _slots[cls]
+    except KeyError:
+        pass
+    names = []
+    hidden = {'__weakref__', '__dict__'}.union(
+        getattr(cls, '_hidden_slots', ()))
+    for klass in reversed(cls.__mro__):
+        slots = vars(klass).get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in hidden and name not in names:
+                names.append(name)
+    names = _slots[cls] = tuple(names)
+    return names
+
+
+_NUMBERS = {int, float, bool}
+_STRINGS = {str, bytes}
+# The slots of the classes with whether they contain parameters
+_fields = {}
+
+
+def _slot(node, name):
+    "Return the value of the slot name of node or None if not set"
+    try:
+        return object.__getattribute__(node, name)
+    except AttributeError:
+        return None
+
+
+def _walk(node):
+    '''
+    Return the shape of the tree of node and its leaves
+
+    The shape contains the type of the nodes, how they are shared, the
+    length of the sequences and the type, the sign and the emptiness of
+    the leaves. The leaves are the values which are not nodes.
+    For each leaf are also returned the index of its token in the shape,
+    whether it is the value of a parameter and the index of the node
+    owning it.
+    '''
+    shape, leaves, positions, parameters, owners, nodes = (
+        [], [], [], [], [], {})
+    append, leaf, position, flag, own = (shape.append, leaves.append,
+        positions.append, parameters.append, owners.append)
+    # The values are walked with an explicit stack of iterators
+    stack = []
+    push, pop = stack.append, stack.pop
+    get = object.__getattribute__
+    values, owner = iter(((node, False),)), None
+    while True:
+        for value, parameter in values:
+            cls = value.__class__
+            if isinstance(value, _Compilable):
+                index = nodes.get(id(value))
+                if index is not None:
+                    append(('ref', index))
+                    continue
+                index = nodes[id(value)] = len(nodes)
+                append(cls)
+                fields = _fields.get(cls)
+                if fields is None:
+                    fields = _fields[cls] = tuple(
+                        (n, n in cls._parameters) for n in _get_slots(cls))
+                # Do not create the attributes computed on access
+                try:
+                    children = [(get(value, n), p) for n, p in fields]
+                except AttributeError:
+                    children = [(_slot(value, n), p) for n, p in fields]
+                if isinstance(value, (list, tuple)):
+                    append(len(value))
+                    children[:0] = zip(value, repeat(True))
+                if cls.__dictoffset__:
+                    attributes = sorted(vars(value).items())
+                    append(tuple(n for n, _ in attributes))
+                    children.extend((v, False) for _, v in attributes)
+                push((values, owner))
+                values, owner = iter(children), index
+                break
+            elif cls is _Array:
+                # The arrays are single parameters
+                parameter = True
+            elif isinstance(value, (list, tuple)):
+                append(cls)
+                append(len(value))
+                push((values, owner))
+                values = zip(value, repeat(parameter))
+                break
+            position(len(shape))
+            if value is None:
+                append((cls,))
+            elif cls in _NUMBERS:
+                append((cls, value < 0, not value))
+            elif cls in _STRINGS:
+                append((cls, not value))
+            elif cls is Decimal:
+                append((cls, value.is_signed(), value.is_zero()))
+            else:
+                append((cls,))
+            leaf(value)
+            flag(parameter)
+            own(owner)
+        else:
+            if not stack:
+                break
+            values, owner = pop()
+    return shape, leaves, positions, parameters, owners, nodes
+
+
+def _structure(node):
+    '''
+    Return the structure of node as a list of tokens
+
+    The values of the parameters are replaced by their marker.
+    '''
+    tokens, leaves, positions, parameters, _, _ = _walk(node)
+    for value, position, parameter in zip(leaves, positions, parameters):
+        if parameter:
+            tokens[position] = ('param',) + tokens[position]
+        else:
+            tokens[position] = ('value', value.__class__, value)
+    return tokens
+
+
+def _canonical(token):
+    if isinstance(token, type):
+        return '%s.%s' % (token.__module__, token.__qualname__)
+    elif isinstance(token, tuple):
+        return tuple(_canonical(t) for t in token)
+    return token
+
+
+class _Compilable(object):
+    __slots__ = ()
+    # The attributes containing values of parameters
+    _parameters = ()
+
+    def _compile(self, ctx):
+        raise NotImplementedError
+
+    def fingerprint(self):
+        '''
+        Return a stable digest of the structure
+
+        The values of the parameters are excluded, only their type, sign
+        and emptiness are kept as they may change the SQL.
+
+        >>> table = Table('t')
+        >>> (table.select(where=table.c == 1).fingerprint()
+        ...     == table.select(where=table.c == 2).fingerprint())
+        True
+        '''
+        tokens = tuple(_canonical(t) for t in _structure(self))
+        return hashlib.sha256(repr(tokens).encode('utf-8')).hexdigest()
+
+    def structurally_equal(self, other):
+        "Test if other has the same structure ignoring the parameters"
+        return (isinstance(other, _Compilable)
+            and _structure(self) == _structure(other))
+
+    def __str__(self):
+        ctx = Compiler()
+        ctx.run(self._compile(ctx))
+        return ctx.sql
+
+    @property
+    def params(self):
+        ctx = Compiler()
+        ctx.run(self._compile(ctx))
+        return ctx.params
+
+
+class _Rendered(object):
+    '''
+    Mixin of the nodes which memoize the SQL of their clauses
+
+    The classes declare the _rendered slot and the setters forget the
+    memoized clause.
+    '''
+    __slots__ = ()
+    # The SQL of the clauses of frozen expressions
+    _hidden_slots = ('_rendered',)
+
+    def __getstate__(self):
+        # The memoized SQL is not copied nor pickled
+        state = {}
+        for name in _get_slots(self.__class__):
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return None, state
+
+    def __setstate__(self, state):
+        _, state = state
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        self._rendered = {}
+
+    def _compile_clause(self, ctx, name, values, func):
+        '''
+        Compile the clause name of values by calling func
+
+        The SQL of the frozen values is reused until the setter of the clause
+        is called.
+        '''
+        from sql.frozen import _compile_clause
+        return _compile_clause(ctx, self._rendered, name, tuple(values), func)
+
+
+class Query(_Compilable):
+    __slots__ = ('__weakref__',)
+
+    def _compile(self, ctx):
+        pass
 
     def __iter__(self):
-        yield str(self)
-        yield self.params
+        sql, params = compile(self)
+        yield sql
+        yield params
+
+    def write_to(self, fp, flavor=None, encoding=None):
+        '''
+        Write the SQL into the file-like fp and return the parameters
+
+        The SQL is written in chunks while compiling. If encoding is set, the
+        chunks are written as bytes.
+        '''
+        return _write(self, fp.write, flavor, encoding)
+
+    def iter_sql_chunks(self, flavor=None, encoding=None):
+        '''
+        Return an iterator over the chunks of the SQL
+
+        The chunks are compiled while iterating. The parameters are the
+        params attribute of the iterator once consumed.
+        '''
+        return _Chunks(self, flavor, encoding)
+
+    def _derive(self, **values):
+        '''
+        Return a copy of the query with the values set
+
+        The other attributes are shared with the query except the lists
+        and the dictionaries which are copied.
+        '''
+        cls = self.__class__
+        query = cls.__new__(cls)
+        if isinstance(self, list):
+            list.extend(query, self)
+        for name in _get_slots(cls) + getattr(cls, '_hidden_slots', ()):
+            try:
+                value = object.__getattribute__(self, name)
+            except AttributeError:
+                continue
+            if value.__class__ in {list, dict, From}:
+                value = copy.copy(value)
+            object.__setattr__(query, name, value)
+        for name, value in values.items():
+            setattr(query, name, value)
+        return query
 
     def __or__(self, other):
         return Union(self, other)
@@ -202,8 +1511,8 @@ class Query(object):
         return Except(self, other)
 
 
-class WithQuery(Query):
-    __slots__ = ('_with',)
+class WithQuery(_Rendered, Query):
+    __slots__ = ('_with', '_rendered')
 
     def __init__(self, **kwargs):
         self._with = None
@@ -219,30 +1528,33 @@ class WithQuery(Query):
         if value is not None:
             if isinstance(value, With):
                 value = [value]
-            if any(not isinstance(w, With) for w in value):
+            if _validate.get() and any(not isinstance(w, With) for w in value):
                 raise ValueError("invalid with: %r" % value)
         self._with = value
 
-    def _with_str(self):
+    def _compile_with(self, ctx):
         if not self.with_:
-            return ''
-        recursive = (' RECURSIVE' if any(w.recursive for w in self.with_)
-            else '')
-        with_ = ('WITH%s ' % recursive
-            + ', '.join(w.statement() for w in self.with_)
-            + ' ')
-        return with_
+            return
+        if any(w.recursive for w in self.with_):
+            ctx.write('WITH RECURSIVE ')
+        else:
+            ctx.write('WITH ')
+        yield from ctx.iter_join(
+            ', ', self.with_, lambda w: w._compile_statement(ctx))
+        ctx.write(' ')
+
+    def _with_str(self):
+        ctx = Compiler()
+        ctx.run(self._compile_with(ctx))
+        return ctx.sql
 
     def _with_params(self):
-        if not self.with_:
-            return ()
-        params = []
-        for w in self.with_:
-            params.extend(w.statement_params())
-        return tuple(params)
+        ctx = Compiler()
+        ctx.run(self._compile_with(ctx))
+        return ctx.params
 
 
-class FromItem(object):
+class FromItem(_Compilable):
     __slots__ = ('__weakref__',)
 
     @property
@@ -300,11 +1612,14 @@ class Lateral(FromItem):
     def __init__(self, from_item):
         self._from_item = from_item
 
-    def __str__(self):
-        template = '%s'
+    def _compile(self, ctx):
+        ctx.write('LATERAL ')
         if isinstance(self._from_item, Query):
-            template = '(%s)'
-        return 'LATERAL ' + template % self._from_item
+            ctx.write('(')
+            yield self._from_item
+            ctx.write(')')
+        else:
+            yield self._from_item
 
     def __getattr__(self, name):
         return getattr(self._from_item, name)
@@ -319,26 +1634,34 @@ class With(FromItem):
         self.query = kwargs.pop('query', None)
         super(With, self).__init__(**kwargs)
 
+    def _compile_statement(self, ctx):
+        ctx.write('"%s"' % self.alias)
+        if self.columns:
+            ctx.write(' (%s)' % ', '.join('"%s"' % c for c in self.columns))
+        ctx.write(' AS (')
+        yield self.query
+        ctx.write(')')
+
     def statement(self):
-        columns = (' (%s)' % ', '.join('"%s"' % c for c in self.columns)
-            if self.columns else '')
-        return '"%s"%s AS (%s)' % (self.alias, columns, self.query)
+        ctx = Compiler()
+        ctx.run(self._compile_statement(ctx))
+        return ctx.sql
 
     def statement_params(self):
-        return self.query.params
+        ctx = Compiler()
+        ctx.run(self._compile_statement(ctx))
+        return ctx.params
 
-    def __str__(self):
-        return '"%s"' % self.alias
-
-    @property
-    def params(self):
-        return tuple()
+    def _compile(self, ctx):
+        ctx.write('"%s"' % self.alias)
 
 
 class SelectQuery(WithQuery):
     __slots__ = ('_order_by', '_limit', '_offset')
+    _parameters = ('_limit', '_offset')
 
     def __init__(self, *args, **kwargs):
+        self._rendered = {}
         self._order_by = None
         self._limit = None
         self._offset = None
@@ -356,16 +1679,17 @@ class SelectQuery(WithQuery):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid order by: %r" % value)
         self._order_by = value
+        self._rendered.pop('order_by', None)
 
-    @property
-    def _order_by_str(self):
-        order_by = ''
+    def _compile_order_by(self, ctx):
         if self.order_by:
-            order_by = ' ORDER BY ' + ', '.join(map(str, self.order_by))
-        return order_by
+            ctx.write(' ORDER BY ')
+            yield from self._compile_clause(ctx, 'order_by', self.order_by,
+                lambda: ctx.iter_join(', ', self.order_by))
 
     @property
     def limit(self):
@@ -389,44 +1713,41 @@ class SelectQuery(WithQuery):
                 raise ValueError("invalid offset: %r" % value)
         self._offset = value
 
-    @property
-    def _limit_offset_str(self):
-        param = Flavor.get().param
-        if Flavor.get().limitstyle == 'limit':
-            offset = ''
-            if self.offset:
-                offset = ' OFFSET %s' % param
-            limit = ''
-            if self.limit is not None:
-                limit = ' LIMIT %s' % param
-            elif self.offset:
-                max_limit = Flavor.get().max_limit
-                if max_limit:
-                    limit = ' LIMIT %s' % max_limit
-            return limit + offset
-        else:
-            offset = ''
-            if self.offset:
-                offset = ' OFFSET (%s) ROWS' % param
-            fetch = ''
-            if self.limit is not None:
-                fetch = ' FETCH FIRST (%s) ROWS ONLY' % param
-            return offset + fetch
-
-    @property
-    def _limit_offset_params(self):
-        p = []
-        if Flavor.get().limitstyle == 'limit':
+    def _compile_limit_offset(self, ctx):
+        # Rendering is cheaper than checking a memoized clause
+        if self.limit is None and not self.offset:
+            return
+        flavor = ctx.flavor
+        if flavor.limitstyle == 'limit':
             if self.limit is not None:
-                p.append(self.limit)
+                ctx.write(' LIMIT ')
+                ctx.add_param(self.limit)
+            elif self.offset and flavor.max_limit:
+                ctx.write(' LIMIT %s' % flavor.max_limit)
             if self.offset:
-                p.append(self.offset)
+                ctx.write(' OFFSET ')
+                ctx.add_param(self.offset)
         else:
             if self.offset:
-                p.append(self.offset)
+                ctx.write(' OFFSET (')
+                ctx.add_param(self.offset)
+                ctx.write(') ROWS')
             if self.limit is not None:
-                p.append(self.limit)
-        return tuple(p)
+                ctx.write(' FETCH FIRST (')
+                ctx.add_param(self.limit)
+                ctx.write(') ROWS ONLY')
+
+    def with_order_by(self, value):
+        "Return a copy of the query with order_by set to value"
+        return self._derive(order_by=value)
+
+    def with_limit(self, value):
+        "Return a copy of the query with limit set to value"
+        return self._derive(limit=value)
+
+    def with_offset(self, value):
+        "Return a copy of the query with offset set to value"
+        return self._derive(offset=value)
 
     def as_(self, output_name):
         return As(self, output_name)
@@ -475,7 +1796,8 @@ class Select(FromItem, SelectQuery):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid distinct on: %r" % value)
         self._distinct_on = value
 
@@ -485,11 +1807,12 @@ class Select(FromItem, SelectQuery):
 
     @columns.setter
     def columns(self, value):
-        if any(
+        if _validate.get() and any(
                 not isinstance(col, (Expression, SelectQuery))
                 for col in value):
             raise ValueError("invalid columns: %r" % value)
         self._columns = tuple(value)
+        self._rendered.pop('columns', None)
 
     @property
     def where(self):
@@ -502,6 +1825,7 @@ class Select(FromItem, SelectQuery):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid where: %r" % value)
         self._where = value
+        self._rendered.pop('where', None)
 
     @property
     def group_by(self):
@@ -512,9 +1836,11 @@ class Select(FromItem, SelectQuery):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid group by: %r" % value)
         self._group_by = value
+        self._rendered.pop('group_by', None)
 
     @property
     def having(self):
@@ -527,6 +1853,7 @@ class Select(FromItem, SelectQuery):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid having: %r" % value)
         self._having = value
+        self._rendered.pop('having', None)
 
     @property
     def for_(self):
@@ -537,7 +1864,7 @@ class Select(FromItem, SelectQuery):
         if value is not None:
             if isinstance(value, For):
                 value = [value]
-            if any(not isinstance(f, For) for f in value):
+            if _validate.get() and any(not isinstance(f, For) for f in value):
                 raise ValueError("invalid for: %r" % value)
         self._for_ = value
 
@@ -566,28 +1893,82 @@ class Select(FromItem, SelectQuery):
     @windows.setter
     def windows(self, value):
         if value is not None:
-            if any(not isinstance(w, Window) for w in value):
+            if _validate.get() and any(
+                    not isinstance(w, Window) for w in value):
                 raise ValueError("invalid windows: %r" % value)
         self._windows = value
 
+    def with_columns(self, *columns):
+        "Return a copy of the query with columns set to columns"
+        return self._derive(columns=columns)
+
+    def with_from(self, value):
+        "Return a copy of the query with from_ set to value"
+        return self._derive(from_=value)
+
+    def with_where(self, value):
+        "Return a copy of the query with where set to value"
+        return self._derive(where=value)
+
+    def with_group_by(self, value):
+        "Return a copy of the query with group_by set to value"
+        return self._derive(group_by=value)
+
+    def with_having(self, value):
+        "Return a copy of the query with having set to value"
+        return self._derive(having=value)
+
     @staticmethod
-    def _format_column(column):
+    def _compile_column(ctx, column):
         if isinstance(column, As):
             if isinstance(column.expression, Select):
-                expression = '(%s)' % column.expression
+                ctx.write('(')
+                yield column.expression
+                ctx.write(')')
             else:
-                expression = column.expression
-            if Flavor.get().no_as:
-                return '%s %s' % (expression, column)
+                yield column.expression
+            if ctx.flavor.no_as:
+                ctx.write(' ')
             else:
-                return '%s AS %s' % (expression, column)
+                ctx.write(' AS ')
+            yield column
+        elif isinstance(column, Select):
+            ctx.write('(')
+            yield column
+            ctx.write(')')
         else:
-            if isinstance(column, Select):
-                return '(%s)' % column
-            else:
-                return str(column)
+            yield column
+
+    def _rownum(self):
+        '''
+        Return the query emulating the limit and the offset with ROWNUM
+
+        The query does not modify self and it is cached until an attribute
+        is replaced.
+        '''
+        cls = self.__class__
+        slots = _get_slots(cls)
+        values = []
+        for name in slots:
+            try:
+                values.append(object.__getattribute__(self, name))
+            except AttributeError:
+                values.append(_unset)
+        values = tuple(values)
+        rownum = self._rendered.get('rownum')
+        if (rownum is not None
+                and all(a is b for a, b in zip(rownum[0], values))):
+            return rownum[1]
+
+        # The inner query shares the attributes without the pagination
+        unpaginated = cls.__new__(cls)
+        for name, value in zip(slots, values):
+            if value is not _unset:
+                object.__setattr__(unpaginated, name, value)
+        unpaginated._rendered = {}
+        unpaginated._limit = unpaginated._offset = unpaginated._for_ = None
+        inner = _Aliased(unpaginated, self)
 
-    def _rownum(self, func):
         aliases = [c.output_name if isinstance(c, As) else None
             for c in self.columns]
 
@@ -597,7 +1978,7 @@ class Select(FromItem, SelectQuery):
             else:
                 return [Column(table, '*')]
 
-        limitselect = self.select(*columns(self))
+        limitselect = inner.select(*columns(inner))
         if self.limit is not None:
             max_row = self.limit
             if self.offset is not None:
@@ -611,23 +1992,15 @@ class Select(FromItem, SelectQuery):
             query = offsetselect
         else:
             query = limitselect
+        query.for_ = self.for_
+        self._rendered['rownum'] = (values, query)
+        return query
 
-        self.limit, limit = None, self.limit
-        self.offset, offset = None, self.offset
-        query.for_, self.for_ = self.for_, None
-
-        try:
-            value = func(query)
-        finally:
-            self.limit = limit
-            self.offset = offset
-            self.for_ = query.for_
-        return value
-
-    def __str__(self):
-        if (Flavor.get().limitstyle == 'rownum'
-                and (self.limit is not None or self.offset is not None)):
-            return self._rownum(str)
+    def _compile(self, ctx):
+        if ((self.limit is not None or self.offset is not None)
+                and ctx.flavor.limitstyle == 'rownum'):
+            yield self._rownum()
+            return
 
         ordinals = {}
         for expression in chain(
@@ -640,97 +2013,104 @@ class Select(FromItem, SelectQuery):
                     continue
                 if column.output_name != expression.output_name:
                     continue
-                if (str(column.expression) != str(expression.expression)
-                        or column.params != expression.params):
+                if (ctx.render(column.expression)
+                        != ctx.render(expression.expression)):
                     raise ValueError("%r != %r" % (expression, column))
                 ordinals[column.output_name] = i
 
-        def str_or_ordinal(expression):
-            if isinstance(expression, As):
-                expression = ordinals.get(expression.output_name, expression)
-            return str(expression)
+        def compile_or_ordinal(expression):
+            if (isinstance(expression, As)
+                    and expression.output_name in ordinals):
+                ctx.write(str(ordinals[expression.output_name]))
+            else:
+                yield expression
 
         with AliasManager():
             if self.from_ is not None:
-                from_ = ' FROM %s' % self.from_
-            else:
-                from_ = ''
-
-            # format window before expressions to set alias
-            window = ', '.join(
-                '"%s" AS (%s)' % (w.alias, w) for w in self.windows)
-            if window:
-                window = ' WINDOW ' + window
-
-            if self.distinct:
-                distinct = 'DISTINCT '
-                if self.distinct_on:
-                    distinct += ('ON (%s) '
-                        % ', '.join(map(str, self.distinct_on)))
-            else:
-                distinct = ''
-            if self.columns:
-                columns = ', '.join(map(self._format_column, self.columns))
-            else:
-                columns = '*'
-            where = ''
-            if self.where:
-                where = ' WHERE ' + str(self.where)
-            group_by = ''
-            if self.group_by:
-                group_by = ' GROUP BY ' + ', '.join(
-                    map(str_or_ordinal, self.group_by))
-            having = ''
-            if self.having:
-                having = ' HAVING ' + str(self.having)
-            for_ = ''
+                with ctx.capture() as from_:
+                    yield self.from_
+
+            # compile window before expressions to set alias
+            with ctx.capture() as window:
+                for i, w in enumerate(self.windows):
+                    ctx.write(', ' if i else ' WINDOW ')
+                    ctx.write('"%s" AS (' % w.alias)
+                    yield w
+                    ctx.write(')')
+
+            # without WITH the select is written in order
+            with ctx.capture(bool(self.with_)) as select:
+                ctx.write('SELECT ')
+                if self.distinct:
+                    ctx.write('DISTINCT ')
+                    if self.distinct_on:
+                        ctx.write('ON (')
+                        yield from ctx.iter_join(', ', self.distinct_on)
+                        ctx.write(') ')
+                if self.columns:
+                    yield from self._compile_clause(
+                        ctx, 'columns', self.columns,
+                        lambda: ctx.iter_join(', ', self.columns,
+                            lambda c: self._compile_column(ctx, c)))
+                else:
+                    ctx.write('*')
+                if self.from_ is not None:
+                    ctx.write(' FROM ')
+                    ctx.extend(from_)
+                if self.where:
+                    ctx.write(' WHERE ')
+                    yield from self._compile_clause(
+                        ctx, 'where', [self.where], lambda: (self.where,))
+                if self.group_by:
+                    ctx.write(' GROUP BY ')
+                    yield from self._compile_clause(
+                        ctx, 'group_by', self.group_by,
+                        lambda: ctx.iter_join(
+                            ', ', self.group_by, compile_or_ordinal))
+                if self.having:
+                    ctx.write(' HAVING ')
+                    yield from self._compile_clause(
+                        ctx, 'having', [self.having], lambda: (self.having,))
+                ctx.extend(window)
+            yield from self._compile_with(ctx)
+            ctx.extend(select)
+            yield from self._compile_order_by(ctx)
+            self._compile_limit_offset(ctx)
             if self.for_ is not None:
-                for_ = ' ' + ' '.join(map(str, self.for_))
-            return (self._with_str()
-                + 'SELECT %s%s%s' % (distinct, columns, from_)
-                + where + group_by + having + window + self._order_by_str
-                + self._limit_offset_str + for_)
+                for f in self.for_:
+                    ctx.write(' ')
+                    yield f
+
+
+class _Aliased(Query, FromItem):
+    "Query compiled in place of from_ and sharing its alias"
+    __slots__ = ('_query', '_from')
+
+    def __init__(self, query, from_):
+        super().__init__()
+        self._query = query
+        self._from = from_
 
     @property
-    def params(self):
-        if (Flavor.get().limitstyle == 'rownum'
-                and (self.limit is not None or self.offset is not None)):
-            return self._rownum(lambda q: q.params)
-        p = []
-        with AliasManager():
-            # Set alias to window function to skip their params
-            for window in self.windows:
-                window.alias
-
-            p.extend(self._with_params())
-            for column in chain(self.distinct_on or (), self.columns):
-                if isinstance(column, As):
-                    p.extend(column.expression.params)
-                p.extend(column.params)
-            if self.from_ is not None:
-                p.extend(self.from_.params)
-            if self.where:
-                p.extend(self.where.params)
-            if self.group_by:
-                for expression in self.group_by:
-                    p.extend(expression.params)
-            if self.having:
-                p.extend(self.having.params)
-            for window in self.windows:
-                p.extend(window.params)
-            if self.order_by:
-                for expression in self.order_by:
-                    p.extend(expression.params)
-            p.extend(self._limit_offset_params)
-        return tuple(p)
+    def alias(self):
+        return AliasManager.get(self._from)
+
+    @property
+    def has_alias(self):
+        return AliasManager.contains(self._from)
+
+    def _compile(self, ctx):
+        yield self._query
 
 
 class Insert(WithQuery):
     __slots__ = ('_table', '_columns', '_values', '_on_conflict', '_returning')
+    _parameters = ('_values',)
 
     def __init__(
             self, table, columns=None, values=None, returning=None,
             on_conflict=None, **kwargs):
+        self._rendered = {}
         self._table = None
         self._columns = None
         self._values = None
@@ -760,11 +2140,12 @@ class Insert(WithQuery):
     @columns.setter
     def columns(self, value):
         if value is not None:
-            if any(
+            if _validate.get() and any(
                     not isinstance(col, Column) or col.table != self.table
                     for col in value):
                 raise ValueError("invalid columns: %r" % value)
         self._columns = value
+        self._rendered.pop('values', None)
 
     @property
     def values(self):
@@ -800,19 +2181,91 @@ class Insert(WithQuery):
             if not isinstance(value, list):
                 raise ValueError("invalid returning: %r" % value)
         self._returning = value
+        self._rendered.pop('returning', None)
+
+    def executemany_form(self, rows, flavor=None):
+        '''
+        Return the SQL of a single row and an iterator of the parameters of
+        the rows for executemany
+
+        The rows are sequences of the values of the columns followed by the
+        values of the other Param of the query in order of appearance.
+        The column values are bound to Param named by the columns.
+
+        >>> table = Table('t')
+        >>> sql, params = table.insert([table.c1, table.c2]).executemany_form(
+        ...     [[1, 'foo'], [2, 'bar']])
+        >>> sql
+        'INSERT INTO "t" ("c1", "c2") VALUES (%s, %s)'
+        >>> list(params)
+        [(1, 'foo'), (2, 'bar')]
+        '''
+        if not self.columns:
+            raise ValueError("missing columns")
+        params = [Param(c.name) for c in self.columns]
+        template = Template(
+            self._derive(values=self._executemany_values(params)), flavor)
+        names = [p.name for p in params]
+        for _, name in template._binds:
+            if name not in names:
+                names.append(name)
+        indexes = {n: i for i, n in enumerate(names)}
+        binds = [(key, indexes[name]) for key, name in template._binds]
+        if binds == [(i, i) for i in range(len(template._params))]:
+            # The rows are the parameters
+            return template.sql, map(tuple, rows)
+        return template.sql, _bind_rows(template._params, binds, rows)
+
+    def _executemany_values(self, params):
+        "Return the values of a single row of params"
+        return [params]
+
+    def chunked(
+            self, max_params=None, max_rows=None, max_bytes=None,
+            flavor=None, encoding=None):
+        '''
+        Return an iterator of the SQL and parameters of the insert split
+        into statements of at most max_params parameters, max_rows rows
+        and max_bytes of SQL
+
+        The statements of the same number of rows of values share the same
+        SQL. With deduplicate, each statement is compiled with its values as
+        the markers depend on their equality.
+
+        >>> table = Table('t')
+        >>> list(table.insert([table.c], [[1], [2], [3]]).chunked(max_rows=2))
+        [('INSERT INTO "t" ("c") VALUES (%s), (%s)', (1, 2)), \
+('INSERT INTO "t" ("c") VALUES (%s)', (3,))]
+        '''
+        if not isinstance(self.values, Values):
+            raise ValueError("invalid values to chunk: %r" % self.values)
+        for name, value in [
+                ('max_params', max_params),
+                ('max_rows', max_rows),
+                ('max_bytes', max_bytes),
+                ]:
+            if value is not None and value < 1:
+                raise ValueError("invalid %s: %r" % (name, value))
+        if not self.values:
+            return iter(())
+        if flavor is None:
+            flavor = Flavor.get()
+        chunker = _Chunker(
+            self, max_params, max_rows, max_bytes, flavor, encoding)
+        return chunker.run(chunker.size())
 
     @staticmethod
-    def _format(value, param=None):
-        if param is None:
-            param = Flavor.get().param
+    def _compile_value(ctx, value):
         if isinstance(value, Expression):
-            return str(value)
+            yield value
         elif isinstance(value, Select):
-            return '(%s)' % value
+            ctx.write('(')
+            yield value
+            ctx.write(')')
         else:
-            return param
+            ctx.add_param(value)
 
-    def __str__(self):
+    def _compile(self, ctx):
         columns = ''
         if self.columns:
             assert all(col.table == self.table for col in self.columns)
@@ -820,48 +2273,218 @@ class Insert(WithQuery):
             columns = ', '.join(c.column_name for c in self.columns)
             columns = ' (' + columns + ')'
         with AliasManager():
-            if isinstance(self.values, Query):
-                values = ' %s' % str(self.values)
-                # TODO manage DEFAULT
-            elif self.values is None:
-                values = ' DEFAULT VALUES'
-            on_conflict = ''
-            if self.on_conflict:
-                on_conflict = ' %s' % self.on_conflict
-            returning = ''
-            if self.returning:
-                returning = ' RETURNING ' + ', '.join(
-                    map(self._format, self.returning))
-            if on_conflict or returning:
+            # the values without expressions do not use alias
+            # so they can be written after the header while streaming
+            ordered = (ctx.streaming and isinstance(self.values, Values)
+                and not any(isinstance(v, _Compilable)
+                    for v in chain.from_iterable(self.values)))
+            with ctx.capture() as insert:
+                if isinstance(self.values, Query) and not ordered:
+                    ctx.write(' ')
+                    yield self.values
+                    # TODO manage DEFAULT
+                elif self.values is None:
+                    ctx.write(' DEFAULT VALUES')
+                if self.on_conflict:
+                    ctx.write(' ')
+                    yield self.on_conflict
+                if self.returning:
+                    ctx.write(' RETURNING ')
+                    yield from self._compile_clause(
+                        ctx, 'returning', self.returning,
+                        lambda: ctx.iter_join(', ', self.returning,
+                            lambda r: self._compile_value(ctx, r)))
+            if self.on_conflict or self.returning:
                 table = '%s AS "%s"' % (self.table, self.table.alias)
             else:
                 table = str(self.table)
-            return (self._with_str()
-                + 'INSERT INTO %s' % table
-                + columns + values + on_conflict + returning)
+            yield from self._compile_with(ctx)
+            ctx.write('INSERT INTO ' + table + columns)
+            if ordered:
+                ctx.write(' ')
+                yield self.values
+            ctx.extend(insert)
 
-    @property
-    def params(self):
-        p = []
-        p.extend(self._with_params())
-        if isinstance(self.values, Query):
-            p.extend(self.values.params)
-        if self.on_conflict:
-            p.extend(self.on_conflict.params)
-        if self.returning:
-            for exp in self.returning:
-                p.extend(exp.params)
-        return tuple(p)
-
-
-class Conflict(object):
+
+class _Chunker(object):
+    '''
+    Split the rows of values of an insert into statements
+
+    The plain rows contain only parameters and the SQL of their statements
+    is compiled once per number of rows.
+    For the named paramstyles, the names of the parameters of the rows are
+    also computed once per number of rows.
+    '''
+    __slots__ = ('query', 'max_params', 'max_rows', 'max_bytes', 'flavor',
+        'encoding', 'width', 'fixed', 'prefix', 'suffix', 'named', '_sql',
+        '_names')
+
+    def __init__(
+            self, query, max_params, max_rows, max_bytes, flavor, encoding):
+        self.query = query
+        self.max_params = max_params
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.flavor = flavor
+        self.encoding = encoding
+        self._sql = {}
+        self._names = {}
+        if query.columns:
+            self.width = len(query.columns)
+        else:
+            self.width = len(query.values[0])
+        # The parameters of the statement around the values
+        cells = [object() for _ in range(self.width)]
+        _, params = compile(query._derive(values=[cells]), flavor)
+        self.fixed = len(params) - self.width
+        self.named = flavor.paramstyle in {'named', 'pyformat'}
+        if self.named or flavor.deduplicate or not cells:
+            # The parameters are not a sequence of the values
+            self.prefix = self.suffix = None
+        else:
+            index = params.index(cells[0])
+            self.prefix = params[:index]
+            self.suffix = params[index + self.width:]
+
+    def is_plain(self, rows):
+        "Test if the rows contain only parameters"
+        return (set(map(len, rows)) <= {self.width}
+            and not any(issubclass(t, _Compilable)
+                for t in set(map(type, chain.from_iterable(rows)))))
+
+    def sql(self, n):
+        "Return the SQL of the statement of n plain rows"
+        sql = self._sql.get(n)
+        if sql is None:
+            sql, _ = compile(
+                self.query._derive(values=[[None] * self.width] * n),
+                self.flavor, self.encoding)
+            self._sql[n] = sql
+        return sql
+
+    def names(self, n):
+        '''
+        Return the SQL, the fixed parameters and the names of the
+        parameters of the values of the statement of n plain rows
+        '''
+        names = self._names.get(n)
+        if names is None:
+            cells = [[object() for _ in range(self.width)] for _ in range(n)]
+            sql, params = compile(self.query._derive(values=cells),
+                self.flavor, self.encoding)
+            index = {id(v): k for k, v in params.items()}
+            cells = [index.pop(id(c)) for c in chain.from_iterable(cells)]
+            fixed = {k: params[k] for k in index.values()}
+            names = self._names[n] = sql, fixed, cells
+        return names
+
+    def size(self):
+        "Return the maximal number of plain rows per statement"
+        size = len(self.query.values)
+        if self.max_rows is not None:
+            size = min(size, self.max_rows)
+        if self.max_params is not None and self.width:
+            size = min(size, (self.max_params - self.fixed) // self.width)
+        if self.max_bytes is not None and size > 0:
+            # Each row adds at least the size of the second row
+            length = self.length(self.sql(1))
+            if size > 1:
+                row = self.length(self.sql(2)) - length
+                size = max(min(size, (self.max_bytes - length) // row + 1), 1)
+            if self.length(self.sql(size)) > self.max_bytes:
+                low, high = 0, size - 1
+                while low < high:
+                    middle = (low + high + 1) // 2
+                    if self.length(self.sql(middle)) <= self.max_bytes:
+                        low = middle
+                    else:
+                        high = middle - 1
+                size = low
+        if size < 1:
+            raise ValueError("the limits can not fit a row")
+        return size
+
+    def length(self, sql):
+        "Return the number of bytes of sql"
+        if isinstance(sql, str):
+            sql = sql.encode('utf-8')
+        return len(sql)
+
+    def compile(self, rows, plain):
+        "Return the SQL and parameters of the statement of rows"
+        if plain and self.prefix is not None:
+            return self.sql(len(rows)), (
+                self.prefix + tuple(chain.from_iterable(rows)) + self.suffix)
+        elif plain and self.named and not self.flavor.deduplicate:
+            sql, params, names = self.names(len(rows))
+            params = dict(params)
+            params.update(zip(names, chain.from_iterable(rows)))
+            return sql, params
+        return compile(
+            self.query._derive(values=list(rows)), self.flavor, self.encoding)
+
+    def split(self, rows):
+        "Yield the statements of rows which do not exceed max_bytes"
+        sql, params = self.compile(rows, False)
+        if (self.max_bytes is not None
+                and self.length(sql) > self.max_bytes
+                and len(rows) > 1):
+            middle = len(rows) // 2
+            yield from self.split(rows[:middle])
+            yield from self.split(rows[middle:])
+        else:
+            yield sql, params
+
+    def run(self, size):
+        "Yield the statements of at most size rows"
+        values = self.query.values
+        for start in range(0, len(values), size):
+            rows = values[start:start + size]
+            if self.is_plain(rows):
+                yield self.compile(rows, True)
+            else:
+                yield from self.mixed(rows)
+
+    def mixed(self, values):
+        "Yield the statements of the values containing expressions"
+        rows, count, plain = [], self.fixed, True
+        for row in values:
+            row_plain = self.is_plain([row])
+            if row_plain:
+                params = len(row)
+            else:
+                params = len(compile(Values([row]), self.flavor)[1])
+            if (self.max_params is not None
+                    and self.fixed + params > self.max_params):
+                raise ValueError(
+                    "the limits can not fit the row: %r" % (row,))
+            if (rows and self.max_params is not None
+                    and count + params > self.max_params):
+                yield from self.flush(rows, plain)
+                rows, count, plain = [], self.fixed, True
+            rows.append(row)
+            count += params
+            plain = plain and row_plain
+        yield from self.flush(rows, plain)
+
+    def flush(self, rows, plain):
+        "Yield the statements of the rows"
+        if plain:
+            yield self.compile(rows, True)
+        else:
+            yield from self.split(rows)
+
+
+class Conflict(_Rendered, _Compilable):
     __slots__ = (
         '_table', '_indexed_columns', '_index_where', '_columns', '_values',
-        '_where')
+        '_where', '_rendered')
+    _parameters = ('_values',)
 
     def __init__(
             self, table, indexed_columns=None, index_where=None,
             columns=None, values=None, where=None):
+        self._rendered = {}
         self._table = None
         self._indexed_columns = None
         self._index_where = None
@@ -892,7 +2515,7 @@ class Conflict(object):
     @indexed_columns.setter
     def indexed_columns(self, value):
         if value is not None:
-            if any(
+            if _validate.get() and any(
                     not isinstance(col, Column) or col.table != self.table
                     for col in value):
                 raise ValueError("invalid indexed columns: %r" % value)
@@ -909,6 +2532,7 @@ class Conflict(object):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid index where: %r" % value)
         self._index_where = value
+        self._rendered.pop('index_where', None)
 
     @property
     def columns(self):
@@ -917,11 +2541,12 @@ class Conflict(object):
     @columns.setter
     def columns(self, value):
         if value is not None:
-            if any(
+            if _validate.get() and any(
                     not isinstance(col, Column) or col.table != self.table
                     for col in value):
                 raise ValueError("invalid columns: %r" % value)
         self._columns = value
+        self._rendered.pop('values', None)
 
     @property
     def values(self):
@@ -935,6 +2560,7 @@ class Conflict(object):
         if isinstance(value, list):
             value = Values([value])
         self._values = value
+        self._rendered.pop('values', None)
 
     @property
     def where(self):
@@ -947,54 +2573,50 @@ class Conflict(object):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid where: %r" % value)
         self._where = value
+        self._rendered.pop('where', None)
 
-    def __str__(self):
-        indexed_columns = ''
+    def _compile(self, ctx):
+        ctx.write('ON CONFLICT')
         if self.indexed_columns:
             assert all(c.table == self.table for c in self.indexed_columns)
             # Get columns without alias
-            indexed_columns = ', '.join(
-                c.column_name for c in self.indexed_columns)
-            indexed_columns = ' (' + indexed_columns + ')'
+            ctx.write(' (%s)' % ', '.join(
+                    c.column_name for c in self.indexed_columns))
             if self.index_where:
-                indexed_columns += ' WHERE ' + str(self.index_where)
+                ctx.write(' WHERE ')
+                yield from self._compile_clause(
+                    ctx, 'index_where', [self.index_where],
+                    lambda: (self.index_where,))
         else:
             assert not self.index_where
-        do = ''
+        ctx.write(' DO ')
         if not self.columns:
             assert not self.values
             assert not self.where
-            do = 'NOTHING'
+            ctx.write('NOTHING')
         else:
             assert all(c.table == self.table for c in self.columns)
             # Get columns without alias
-            do = ', '.join(c.column_name for c in self.columns)
-            # TODO manage DEFAULT
-            values = str(self.values)
-            if values.startswith('VALUES'):
-                values = values[len('VALUES'):]
-            else:
-                values = ' (' + values + ')'
+            columns = ', '.join(c.column_name for c in self.columns)
             if len(self.columns) == 1:
                 # PostgreSQL would require ROW expression
                 # with single column with parenthesis
-                do = 'UPDATE SET ' + do + ' =' + values
+                ctx.write('UPDATE SET ' + columns + ' =')
+            else:
+                ctx.write('UPDATE SET (' + columns + ') =')
+            # TODO manage DEFAULT
+            if isinstance(self.values, Values):
+                yield from self._compile_clause(
+                    ctx, 'values', chain.from_iterable(self.values),
+                    lambda: self.values._compile_rows(ctx))
             else:
-                do = 'UPDATE SET (' + do + ') =' + values
+                ctx.write(' (')
+                yield self.values
+                ctx.write(')')
             if self.where:
-                do += ' WHERE %s' % self.where
-        return 'ON CONFLICT' + indexed_columns + ' DO ' + do
-
-    @property
-    def params(self):
-        p = []
-        if self.index_where:
-            p.extend(self.index_where.params)
-        if self.values:
-            p.extend(self.values.params)
-        if self.where:
-            p.extend(self.where.params)
-        return p
+                ctx.write(' WHERE ')
+                yield from self._compile_clause(
+                    ctx, 'where', [self.where], lambda: (self.where,))
 
 
 class Update(Insert):
@@ -1019,6 +2641,10 @@ class Update(Insert):
         if not isinstance(value, list):
             raise ValueError("invalid values: %r" % value)
         self._values = value
+        self._rendered.pop('values', None)
+
+    def _executemany_values(self, params):
+        return params
 
     @property
     def where(self):
@@ -1031,50 +2657,49 @@ class Update(Insert):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid where: %r" % value)
         self._where = value
+        self._rendered.pop('where', None)
 
-    @staticmethod
-    def _format_column(value):
-        return Select._format_column(value)
+    def with_where(self, value):
+        "Return a copy of the query with where set to value"
+        return self._derive(where=value)
 
-    def __str__(self):
+    def _compile(self, ctx):
         assert all(col.table == self.table for col in self.columns)
         # Get columns without alias
         columns = [c.column_name for c in self.columns]
 
+        def compile_value(item):
+            column, value = item
+            ctx.write(column + ' = ')
+            return self._compile_value(ctx, value)
+
         with AliasManager():
-            from_ = ''
             if self.from_:
-                from_ = ' FROM %s' % str(self.from_)
-            values = ', '.join('%s = %s' % (c, self._format(v))
-                for c, v in zip(columns, self.values))
-            where = ''
-            if self.where:
-                where = ' WHERE ' + str(self.where)
-            returning = ''
-            if self.returning:
-                returning = ' RETURNING ' + ', '.join(
-                    map(self._format_column, self.returning))
-            return (self._with_str()
-                + 'UPDATE %s AS "%s" SET ' % (self.table, self.table.alias)
-                + values + from_ + where + returning)
-
-    @property
-    def params(self):
-        p = []
-        p.extend(self._with_params())
-        for value in self.values:
-            if isinstance(value, (Expression, Select)):
-                p.extend(value.params)
-            else:
-                p.append(value)
-        if self.from_:
-            p.extend(self.from_.params)
-        if self.where:
-            p.extend(self.where.params)
-        if self.returning:
-            for exp in self.returning:
-                p.extend(exp.params)
-        return tuple(p)
+                with ctx.capture() as from_:
+                    yield self.from_
+            with ctx.capture() as update:
+                # The names detect the columns modified in place
+                yield from self._compile_clause(ctx, 'values',
+                    chain((c.name for c in self.columns), self.values),
+                    lambda: ctx.iter_join(
+                        ', ', zip(columns, self.values), compile_value))
+                if self.from_:
+                    ctx.write(' FROM ')
+                    ctx.extend(from_)
+                if self.where:
+                    ctx.write(' WHERE ')
+                    yield from self._compile_clause(
+                        ctx, 'where', [self.where], lambda: (self.where,))
+                if self.returning:
+                    ctx.write(' RETURNING ')
+                    yield from self._compile_clause(
+                        ctx, 'returning', self.returning,
+                        lambda: ctx.iter_join(', ', self.returning,
+                            lambda r: Select._compile_column(ctx, r)))
+            yield from self._compile_with(ctx)
+            ctx.write('UPDATE %s AS "%s" SET ' % (
+                    self.table, self.table.alias))
+            ctx.extend(update)
 
 
 class Delete(WithQuery):
@@ -1082,6 +2707,7 @@ class Delete(WithQuery):
 
     def __init__(self, table, only=False, using=None, where=None,
             returning=None, **kwargs):
+        self._rendered = {}
         self._table = None
         self._where = None
         self._returning = None
@@ -1113,6 +2739,11 @@ class Delete(WithQuery):
             if not isinstance(value, (Expression, And, Or)):
                 raise ValueError("invalid where: %r" % value)
         self._where = value
+        self._rendered.pop('where', None)
+
+    def with_where(self, value):
+        "Return a copy of the query with where set to value"
+        return self._derive(where=value)
 
     @property
     def returning(self):
@@ -1121,46 +2752,37 @@ class Delete(WithQuery):
     @returning.setter
     def returning(self, value):
         if value is not None:
-            if any(
+            if _validate.get() and any(
                     not isinstance(col, (Expression, SelectQuery))
                     for col in value):
                 raise ValueError("invalid returning: %r" % value)
         self._returning = value
+        self._rendered.pop('returning', None)
 
-    @staticmethod
-    def _format(value):
-        return Select._format_column(value)
-
-    def __str__(self):
+    def _compile(self, ctx):
         with AliasManager(exclude=[self.table]):
-            only = ' ONLY' if self.only else ''
-            where = ''
-            if self.where:
-                where = ' WHERE ' + str(self.where)
-            returning = ''
-            if self.returning:
-                returning = ' RETURNING ' + ', '.join(
-                    map(self._format, self.returning))
-            return (self._with_str()
-                + 'DELETE FROM%s %s' % (only, self.table)
-                + where + returning)
-
-    @property
-    def params(self):
-        p = []
-        p.extend(self._with_params())
-        if self.where:
-            p.extend(self.where.params)
-        if self.returning:
-            for exp in self.returning:
-                p.extend(exp.params)
-        return tuple(p)
+            with ctx.capture() as delete:
+                if self.where:
+                    ctx.write(' WHERE ')
+                    yield from self._compile_clause(
+                        ctx, 'where', [self.where], lambda: (self.where,))
+                if self.returning:
+                    ctx.write(' RETURNING ')
+                    yield from self._compile_clause(
+                        ctx, 'returning', self.returning,
+                        lambda: ctx.iter_join(', ', self.returning,
+                            lambda r: Select._compile_column(ctx, r)))
+            yield from self._compile_with(ctx)
+            ctx.write('DELETE FROM%s %s' % (
+                    ' ONLY' if self.only else '', self.table))
+            ctx.extend(delete)
 
 
 class Merge(WithQuery):
     __slots__ = ('_target', '_source', '_condition', '_whens')
 
     def __init__(self, target, source, condition, *whens, **kwargs):
+        self._rendered = {}
         self._target = None
         self._source = None
         self._condition = None
@@ -1200,6 +2822,7 @@ class Merge(WithQuery):
         if not isinstance(value, Expression):
             raise ValueError("invalid condition: %r" % value)
         self._condition = value
+        self._rendered.pop('condition', None)
 
     @property
     def whens(self):
@@ -1207,36 +2830,36 @@ class Merge(WithQuery):
 
     @whens.setter
     def whens(self, value):
-        if any(not isinstance(w, Matched) for w in value):
+        if _validate.get() and any(not isinstance(w, Matched) for w in value):
             raise ValueError("invalid whens: %r" % value)
         self._whens = tuple(value)
 
-    def __str__(self):
+    def _compile(self, ctx):
         with AliasManager():
-            if isinstance(self.source, (Select, Values)):
-                source = '(%s)' % self.source
-            else:
-                source = self.source
-            condition = 'ON %s' % self.condition
-            return (self._with_str()
-                + 'MERGE INTO %s AS "%s" ' % (self.target, self.target.alias)
-                + 'USING %s AS "%s" ' % (source, self.source.alias)
-                + condition + ' ' + ' '.join(map(str, self.whens)))
-
-    @property
-    def params(self):
-        p = []
-        p.extend(self._with_params())
-        if isinstance(self.source, (SelectQuery, Values)):
-            p.extend(self.source.params)
-        if self.condition:
-            p.extend(self.condition.params)
-        for match in self.whens:
-            p.extend(match.params)
-        return tuple(p)
-
-
-class Matched(object):
+            with ctx.capture() as source:
+                if isinstance(self.source, (Select, Values)):
+                    ctx.write('(')
+                    yield self.source
+                    ctx.write(')')
+                else:
+                    yield self.source
+            with ctx.capture() as condition:
+                ctx.write('ON ')
+                yield from self._compile_clause(
+                    ctx, 'condition', [self.condition],
+                    lambda: (self.condition,))
+            yield from self._compile_with(ctx)
+            ctx.write('MERGE INTO %s AS "%s" USING ' % (
+                    self.target, self.target.alias))
+            ctx.extend(source)
+            ctx.write(' AS "%s" ' % self.source.alias)
+            ctx.extend(condition)
+            for when in self.whens:
+                ctx.write(' ')
+                yield when
+
+
+class Matched(_Compilable):
     __slots__ = ('_condition',)
     _when = 'MATCHED'
 
@@ -1255,26 +2878,23 @@ class Matched(object):
                 raise ValueError("invalid condition: %r" % value)
         self._condition = value
 
-    def _then_str(self):
-        return 'DO NOTHING'
+    def _compile_then(self, ctx):
+        ctx.write('DO NOTHING')
 
-    def __str__(self):
+    def _compile(self, ctx):
+        ctx.write('WHEN ' + self._when)
         if self.condition is not None:
-            condition = ' AND ' + str(self.condition)
-        else:
-            condition = ''
-        return 'WHEN ' + self._when + condition + ' THEN ' + self._then_str()
-
-    @property
-    def params(self):
-        p = []
-        if self.condition:
-            p.extend(self.condition.params)
-        return tuple(p)
+            ctx.write(' AND ')
+            yield self.condition
+        ctx.write(' THEN ')
+        children = self._compile_then(ctx)
+        if children is not None:
+            yield from children
 
 
 class _MatchedValues(Matched):
     __slots__ = ('_columns', '_values')
+    _parameters = ('_values',)
 
     def __init__(self, columns, values, **kwargs):
         self._columns = columns
@@ -1289,7 +2909,8 @@ class _MatchedValues(Matched):
 
     @columns.setter
     def columns(self, value):
-        if any(not isinstance(col, Column) for col in value):
+        if _validate.get() and any(
+                not isinstance(col, Column) for col in value):
             raise ValueError("invalid columns: %r" % value)
         self._columns = value
 
@@ -1305,28 +2926,22 @@ class MatchedUpdate(_MatchedValues, Matched):
     def values(self, value):
         self._values = value
 
-    def _then_str(self):
+    def _compile_then(self, ctx):
         columns = [c.column_name for c in self.columns]
-        return 'UPDATE SET ' + ', '.join(
-            '%s = %s' % (c, Update._format(v))
-            for c, v in zip(columns, self.values))
 
-    @property
-    def params(self):
-        p = list(super().params)
-        for value in self.values:
-            if isinstance(value, (Expression, Select)):
-                p.extend(value.params)
-            else:
-                p.append(value)
-        return tuple(p)
+        def compile_value(item):
+            column, value = item
+            ctx.write(column + ' = ')
+            return Update._compile_value(ctx, value)
+        ctx.write('UPDATE SET ')
+        return ctx.iter_join(', ', zip(columns, self.values), compile_value)
 
 
 class MatchedDelete(Matched):
     __slots__ = ()
 
-    def _then_str(self):
-        return 'DELETE'
+    def _compile_then(self, ctx):
+        ctx.write('DELETE')
 
 
 class NotMatched(Matched):
@@ -1347,21 +2962,14 @@ class NotMatchedInsert(_MatchedValues, NotMatched):
             value = Values([value])
         self._values = value
 
-    def _then_str(self):
+    def _compile_then(self, ctx):
         columns = ', '.join(c.column_name for c in self.columns)
-        columns = '(' + columns + ')'
+        ctx.write('INSERT (' + columns + ')')
         if self.values is None:
-            values = ' DEFAULT VALUES'
+            ctx.write(' DEFAULT VALUES')
         else:
-            values = ' ' + str(self.values)
-        return 'INSERT ' + columns + values
-
-    @property
-    def params(self):
-        p = list(super().params)
-        if self.values:
-            p.extend(self.values.params)
-        return tuple(p)
+            ctx.write(' ')
+            yield self.values
 
 
 class CombiningQuery(FromItem, SelectQuery):
@@ -1369,31 +2977,40 @@ class CombiningQuery(FromItem, SelectQuery):
     _operator = ''
 
     def __init__(self, *queries, **kwargs):
-        if any(not isinstance(q, Query) for q in queries):
+        if _validate.get() and any(not isinstance(q, Query) for q in queries):
             raise ValueError("invalid queries: %r" % (queries,))
         self.queries = queries
         self.all_ = kwargs.pop('all_', False)
         super(CombiningQuery, self).__init__(**kwargs)
 
-    def __str__(self):
-        with AliasManager():
-            operator = ' %s %s' % (self._operator, 'ALL ' if self.all_ else '')
-            return (
-                self._with_str()
-                + operator.join(map(str, self.queries)) + self._order_by_str
-                + self._limit_offset_str)
-
-    @property
-    def params(self):
-        p = []
+    def _combine(self, query):
+        "Test if the queries of query can be combined in place of it"
+        return (query.__class__ is self.__class__
+            and query.all_ == self.all_
+            and not query.with_
+            and not query.order_by
+            and query.limit is None
+            and query.offset is None)
+
+    def _compile(self, ctx):
+        separator = ' %s %s' % (self._operator, 'ALL ' if self.all_ else '')
         with AliasManager():
-            p.extend(self._with_params())
-            for q in self.queries:
-                p.extend(q.params)
-            if self.order_by:
-                for expression in self.order_by:
-                    p.extend(expression.params)
-        return tuple(p)
+            yield from self._compile_with(ctx)
+            # The queries of the same combination are flattened
+            stack, first = [iter(self.queries)], True
+            while stack:
+                for query in stack[-1]:
+                    if self._combine(query):
+                        stack.append(iter(query.queries))
+                        break
+                    if not first:
+                        ctx.write(separator)
+                    first = False
+                    yield query
+                else:
+                    stack.pop()
+            yield from self._compile_order_by(ctx)
+            self._compile_limit_offset(ctx)
 
 
 class Union(CombiningQuery):
@@ -1427,13 +3044,9 @@ class Table(FromItem):
         self._schema = schema
         self._database = database
 
-    def __str__(self):
-        return '.'.join(map(_escape_identifier, filter(None,
-                    (self._database, self._schema, self._name))))
-
-    @property
-    def params(self):
-        return ()
+    def _compile(self, ctx):
+        ctx.write('.'.join(map(_escape_identifier, filter(None,
+                        (self._database, self._schema, self._name)))))
 
     def insert(
             self, columns=None, values=None, returning=None, with_=None,
@@ -1441,6 +3054,45 @@ class Table(FromItem):
         return Insert(self, columns=columns, values=values,
             on_conflict=on_conflict, returning=returning, with_=with_)
 
+    def bulk_insert(
+            self, columns, values, types=None, columnar=False,
+            returning=None, with_=None, on_conflict=None):
+        '''
+        Return an insert of the values passed as one array per column and
+        expanded by UNNEST
+
+        The values are rows or, if columnar is set, the values of each
+        column. The types are the SQL types of the columns used to cast the
+        arrays. The SQL and the number of parameters do not depend on the
+        number of rows.
+
+        >>> table = Table('t')
+        >>> tuple(table.bulk_insert([table.c1, table.c2],
+        ...         [[1, 'foo'], [2, 'bar']], types=['INTEGER', 'TEXT']))
+        ('INSERT INTO "t" ("c1", "c2") SELECT * FROM \
+UNNEST(CAST(%s AS INTEGER[]), CAST(%s AS TEXT[])) AS "a"', \
+([1, 2], ['foo', 'bar']))
+        '''
+        from sql.functions import Unnest
+        if columnar:
+            arrays = [_Array(v) for v in values]
+        else:
+            arrays = [_Array(v) for v in zip(*values)]
+            if not arrays:
+                arrays = [_Array() for _ in columns]
+        if len(arrays) != len(columns):
+            raise ValueError("invalid values: %r" % values)
+        if types is not None:
+            if len(types) != len(columns):
+                raise ValueError("invalid types: %r" % types)
+            arrays = [Cast(a, t + '[]') for a, t in zip(arrays, types)]
+        return self.insert(columns, Unnest(*arrays).select(),
+            returning=returning, with_=with_, on_conflict=on_conflict)
+
+    def copy_from(self, columns=None, format='text', types=None):
+        from sql.pgcopy import Copy
+        return Copy(self, columns=columns, format=format, types=types)
+
     def update(self, columns, values, from_=None, where=None, returning=None,
             with_=None):
         return Update(self, columns=columns, values=values, from_=from_,
@@ -1529,23 +3181,13 @@ class Join(FromItem):
             raise ValueError("invalid type: %r" % value)
         self._type_ = value
 
-    def __str__(self):
-        join = '%s %s JOIN %s' % (From([self.left]), self.type_,
-            From([self.right]))
-        if self.condition:
-            condition = ' ON %s' % self.condition
-        else:
-            condition = ''
-        return join + condition
-
-    @property
-    def params(self):
-        p = []
-        for item in (self.left, self.right):
-            p.extend(item.params)
+    def _compile(self, ctx):
+        yield from From._compile_item(ctx, self.left)
+        ctx.write(' %s JOIN ' % self.type_)
+        yield from From._compile_item(ctx, self.right)
         if self.condition:
-            p.extend(self.condition.params)
-        return tuple(p)
+            ctx.write(' ON ')
+            yield self.condition
 
     @property
     def alias(self):
@@ -1562,42 +3204,36 @@ class Join(FromItem):
         return super(Join, self).select(*args, **kwargs)
 
 
-class From(list):
+class From(list, _Compilable):
     __slots__ = ()
 
     def select(self, *args, **kwargs):
         return Select(args, from_=self, **kwargs)
 
-    def __str__(self):
-        def format(from_):
-            template = '%s'
-            if isinstance(from_, Query):
-                template = '(%s)'
-            alias = getattr(from_, 'alias', None)
+    @staticmethod
+    def _compile_item(ctx, from_):
+        alias = getattr(from_, 'alias', None)
+        if isinstance(from_, Query):
+            ctx.write('(')
+            yield from_
+            ctx.write(')')
+        else:
+            yield from_
+        if alias:
+            if ctx.flavor.no_as:
+                ctx.write(' "%s"' % alias)
+            else:
+                ctx.write(' AS "%s"' % alias)
             # TODO column_alias
             columns_definitions = getattr(from_, 'columns_definitions',
                 None)
-            if Flavor.get().no_as:
-                alias_template = ' "%s"'
-            else:
-                alias_template = ' AS "%s"'
             # XXX find a better test for __getattr__ which returns Column
-            if (alias and columns_definitions
+            if (columns_definitions
                     and not isinstance(columns_definitions, Column)):
-                return (template + alias_template + ' (%s)') % (from_, alias,
-                    columns_definitions)
-            elif alias:
-                return (template + alias_template) % (from_, alias)
-            else:
-                return template % from_
-        return ', '.join(map(format, self))
+                ctx.write(' (%s)' % columns_definitions)
 
-    @property
-    def params(self):
-        p = []
-        for from_ in self:
-            p.extend(from_.params)
-        return tuple(p)
+    def _compile(self, ctx):
+        return ctx.iter_join(', ', self, lambda f: self._compile_item(ctx, f))
 
     def __add__(self, other):
         if not isinstance(other, FromItem):
@@ -1612,39 +3248,30 @@ class Values(list, Query, FromItem):
 
     # TODO order, fetch
 
-    def __str__(self):
-        param = Flavor.get().param
-
-        def format_(value):
-            if isinstance(value, Expression):
-                return str(value)
-            else:
-                return param
-        return 'VALUES ' + ', '.join(
-            '(%s)' % ', '.join(map(format_, v))
-            for v in self)
-
-    @property
-    def params(self):
-        p = list(super().params)
-        for values in self:
-            for value in values:
+    def _compile_rows(self, ctx):
+        "Yield the expressions of the rows and a pause after each row"
+        streaming = ctx.streaming
+        ctx.write(' ')
+        for i, row in enumerate(self):
+            ctx.write(', (' if i else '(')
+            for j, value in enumerate(row):
+                if j:
+                    ctx.write(', ')
                 if isinstance(value, Expression):
-                    p.extend(value.params)
+                    yield value
                 else:
-                    p.append(value)
-        return tuple(p)
-
+                    ctx.add_param(value)
+            ctx.write(')')
+            if streaming:
+                yield None
 
-class Expression(object):
-    __slots__ = ('__weakref__',)
+    def _compile(self, ctx):
+        ctx.write('VALUES')
+        yield from self._compile_rows(ctx)
 
-    def __str__(self):
-        raise NotImplementedError
 
-    @property
-    def params(self):
-        raise NotImplementedError
+class Expression(_Compilable):
+    __slots__ = ('__weakref__',)
 
     def __and__(self, other):
         from sql.operators import And
@@ -1775,6 +3402,7 @@ class Expression(object):
 
 class Literal(Expression):
     __slots__ = ('_value')
+    _parameters = ('_value',)
 
     def __init__(self, value):
         super(Literal, self).__init__()
@@ -1784,34 +3412,104 @@ class Literal(Expression):
     def value(self):
         return self._value
 
-    def __str__(self):
-        flavor = Flavor.get()
-        if flavor.no_boolean:
+    def _compile(self, ctx):
+        if ctx.flavor.no_boolean:
             if self._value is True:
-                return '(1 = 1)'
+                ctx.write('(1 = 1)')
+                return
             elif self._value is False:
-                return '(1 != 1)'
-        return flavor.param
+                ctx.write('(1 != 1)')
+                return
+        ctx.add_param(self._value)
+
+
+Null = None
+
+
+class Param(Expression):
+    '''
+    Placeholder for a value bound by a Template
+
+    >>> table = Table('t')
+    >>> tuple(table.select(where=table.id == Param('id')))
+    ('SELECT * FROM "t" AS "a" WHERE "a"."id" = %s', (Param('id'),))
+    '''
+    __slots__ = ('_name',)
+
+    def __init__(self, name):
+        super(Param, self).__init__()
+        self._name = name
 
     @property
-    def params(self):
-        if Flavor.get().no_boolean:
-            if self._value is True or self._value is False:
-                return ()
-        return (self._value,)
+    def name(self):
+        return self._name
 
+    def _compile(self, ctx):
+        ctx.add_param(self)
 
-Null = None
+    def __repr__(self):
+        return 'Param(%r)' % self._name
 
 
-class _Rownum(Expression):
+class Template(object):
+    '''
+    Query compiled once to bind the values of its Param many times
 
-    def __str__(self):
-        return 'ROWNUM'
+    >>> table = Table('t')
+    >>> template = Template(table.select(where=table.id == Param('id')))
+    >>> template.sql
+    'SELECT * FROM "t" AS "a" WHERE "a"."id" = %s'
+    >>> template.bind(id=43)
+    (43,)
+
+    Contains:
+        sql - the compiled SQL
+        names - the names of the parameters to bind
+    '''
+    __slots__ = ('sql', '_params', '_binds')
+
+    def __init__(self, query, flavor=None):
+        self.sql, params = compile(query, flavor)
+        if isinstance(params, dict):
+            self._params = params
+            items = params.items()
+        else:
+            self._params = list(params)
+            items = enumerate(params)
+        self._binds = tuple(
+            (key, p.name) for key, p in items if isinstance(p, Param))
 
     @property
-    def params(self):
-        return ()
+    def names(self):
+        return {name for _, name in self._binds}
+
+    def bind(self, **values):
+        "Return the parameters with the values bound to Param"
+        params = self._params.copy()
+        try:
+            for key, name in self._binds:
+                params[key] = values[name]
+        except KeyError as exception:
+            raise ValueError("missing param: %r" % exception.args[0])
+        if isinstance(params, dict):
+            return params
+        return tuple(params)
+
+
+def _bind_rows(params, binds, rows):
+    "Yield the parameters with the values of each row bound"
+    named = isinstance(params, dict)
+    for row in rows:
+        values = params.copy()
+        for key, index in binds:
+            values[key] = row[index]
+        yield values if named else tuple(values)
+
+
+class _Rownum(Expression):
+
+    def _compile(self, ctx):
+        ctx.write('ROWNUM')
 
 
 _rownum = _Rownum()
@@ -1839,16 +3537,12 @@ class Column(Expression):
             self._name if self._name == '*'
             else _escape_identifier(self._name))
 
-    def __str__(self):
+    def _compile(self, ctx):
         alias = self._from.alias
         if alias:
-            return '%s.%s' % (_escape_identifier(alias), self.column_name)
+            ctx.write('%s.%s' % (_escape_identifier(alias), self.column_name))
         else:
-            return self.column_name
-
-    @property
-    def params(self):
-        return ()
+            ctx.write(self.column_name)
 
 
 class As(Expression):
@@ -1859,39 +3553,31 @@ class As(Expression):
         self.expression = expression
         self.output_name = output_name
 
-    def __str__(self):
-        return '%s' % _escape_identifier(self.output_name)
-
-    @property
-    def params(self):
-        return ()
+    def _compile(self, ctx):
+        ctx.write(_escape_identifier(self.output_name))
 
 
 class Cast(Expression):
     __slots__ = ('expression', 'typename')
+    _parameters = ('expression',)
 
     def __init__(self, expression, typename):
         super(Cast, self).__init__()
         self.expression = expression
         self.typename = typename
 
-    def __str__(self):
-        if isinstance(self.expression, Expression):
-            value = self.expression
-        else:
-            value = Flavor.get().param
-        return 'CAST(%s AS %s)' % (value, self.typename)
-
-    @property
-    def params(self):
+    def _compile(self, ctx):
+        ctx.write('CAST(')
         if isinstance(self.expression, Expression):
-            return self.expression.params
+            yield self.expression
         else:
-            return (self.expression,)
+            ctx.add_param(self.expression)
+        ctx.write(' AS %s)' % self.typename)
 
 
 class Collate(Expression):
     __slots__ = ('_expression', '_collation')
+    _parameters = ('_expression',)
 
     def __init__(self, expression, collation):
         super(Collate, self).__init__()
@@ -1914,19 +3600,12 @@ class Collate(Expression):
     def collation(self, value):
         self._collation = value
 
-    def __str__(self):
-        if isinstance(self.expression, Expression):
-            value = self.expression
-        else:
-            value = Flavor.get().param
-        return '%s COLLATE %s' % (value, _escape_identifier(self.collation))
-
-    @property
-    def params(self):
+    def _compile(self, ctx):
         if isinstance(self.expression, Expression):
-            return self.expression.params
+            yield self.expression
         else:
-            return (self.expression,)
+            ctx.add_param(self.expression)
+        ctx.write(' COLLATE %s' % _escape_identifier(self.collation))
 
 
 class Grouping(Expression):
@@ -1942,22 +3621,21 @@ class Grouping(Expression):
 
     @sets.setter
     def sets(self, value):
-        if any(
+        if _validate.get() and any(
                 not isinstance(col, Expression)
                 for cols in value
                 for col in cols):
             raise ValueError("invalid sets: %r" % value)
         self._sets = tuple(tuple(cols) for cols in value)
 
-    def __str__(self):
-        return 'GROUPING SETS (%s)' % (
-            ', '.join(
-                '(%s)' % ', '.join(str(col) for col in cols)
-                for cols in self.sets))
-
-    @property
-    def params(self):
-        return sum((col.params for cols in self.sets for col in cols), ())
+    def _compile(self, ctx):
+        def compile_set(cols):
+            ctx.write('(')
+            yield from ctx.iter_join(', ', cols)
+            ctx.write(')')
+        ctx.write('GROUPING SETS (')
+        yield from ctx.iter_join(', ', self.sets, compile_set)
+        ctx.write(')')
 
 
 class Rollup(Expression):
@@ -1973,47 +3651,39 @@ class Rollup(Expression):
 
     @expressions.setter
     def expressions(self, value):
-        if not all(
+        if _validate.get() and not all(
                 isinstance(col, Expression)
                 or all(isinstance(c, Expression) for c in col)
                 for col in value):
             raise ValueError("invalid expressions: %r" % value)
         self._expressions = tuple(value)
 
-    def __str__(self):
-        def format(col):
-            if isinstance(col, Expression):
-                return str(col)
-            else:
-                return '(%s)' % ', '.join(str(c) for c in col)
-        return '%s (%s)' % (
-            self.__class__.__name__.upper(),
-            ', '.join(format(col) for col in self.expressions))
-
-    @property
-    def params(self):
-        p = []
-        for col in self.expressions:
+    def _compile(self, ctx):
+        def compile_(col):
             if isinstance(col, Expression):
-                p.extend(col.params)
+                yield col
             else:
-                for c in col:
-                    p.extend(c.params)
-        return tuple(p)
+                ctx.write('(')
+                yield from ctx.iter_join(', ', col)
+                ctx.write(')')
+        ctx.write('%s (' % self.__class__.__name__.upper())
+        yield from ctx.iter_join(', ', self.expressions, compile_)
+        ctx.write(')')
 
 
 class Cube(Rollup):
     pass
 
 
-class Window(object):
+class Window(_Rendered, _Compilable):
     __slots__ = (
         '_partition', '_order_by', '_frame', '_start', '_end', '_exclude',
-        '__weakref__')
+        '_rendered', '__weakref__')
 
     def __init__(self, partition, order_by=None,
             frame=None, start=None, end=0, exclude=None):
         super(Window, self).__init__()
+        self._rendered = {}
         self._partition = None
         self._order_by = None
         self._frame = None
@@ -2032,9 +3702,11 @@ class Window(object):
 
     @partition.setter
     def partition(self, value):
-        if any(not isinstance(e, Expression) for e in value):
+        if _validate.get() and any(
+                not isinstance(e, Expression) for e in value):
             raise ValueError("invalid partition: %r" % value)
         self._partition = value
+        self._rendered.pop('partition', None)
 
     @property
     def order_by(self):
@@ -2045,9 +3717,11 @@ class Window(object):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid order by: %r" % value)
         self._order_by = value
+        self._rendered.pop('order_by', None)
 
     @property
     def frame(self):
@@ -2101,54 +3775,42 @@ class Window(object):
     def has_alias(self):
         return AliasManager.contains(self)
 
-    def __str__(self):
-        param = Flavor.get().param
-        partition = ''
+    def _compile(self, ctx):
         if self.partition:
-            partition = 'PARTITION BY ' + ', '.join(map(str, self.partition))
-        order_by = ''
+            ctx.write('PARTITION BY ')
+            yield from self._compile_clause(
+                ctx, 'partition', self.partition,
+                lambda: ctx.iter_join(', ', self.partition))
         if self.order_by:
-            order_by = ' ORDER BY ' + ', '.join(map(str, self.order_by))
+            ctx.write(' ORDER BY ')
+            yield from self._compile_clause(
+                ctx, 'order_by', self.order_by,
+                lambda: ctx.iter_join(', ', self.order_by))
 
-        def format(frame, direction):
+        def compile_frame(frame, direction):
             if frame is None:
-                return 'UNBOUNDED %s' % direction
+                ctx.write('UNBOUNDED %s' % direction)
             elif not frame:
-                return 'CURRENT ROW'
-            elif frame < 0:
-                return '%s PRECEDING' % param
-            elif frame > 0:
-                return '%s FOLLOWING' % param
+                ctx.write('CURRENT ROW')
+            else:
+                ctx.add_param(abs(frame))
+                if frame < 0:
+                    ctx.write(' PRECEDING')
+                else:
+                    ctx.write(' FOLLOWING')
 
-        frame = ''
         if self.frame:
-            start = format(self.start, 'PRECEDING')
-            end = format(self.end, 'FOLLOWING')
-            frame = ' %s BETWEEN %s AND %s' % (self.frame, start, end)
-        exclude = ''
+            ctx.write(' %s BETWEEN ' % self.frame)
+            compile_frame(self.start, 'PRECEDING')
+            ctx.write(' AND ')
+            compile_frame(self.end, 'FOLLOWING')
         if self.exclude:
-            exclude = ' EXCLUDE %s' % self.exclude
-        return partition + order_by + frame + exclude
-
-    @property
-    def params(self):
-        p = []
-        if self.partition:
-            for expression in self.partition:
-                p.extend(expression.params)
-        if self.order_by:
-            for expression in self.order_by:
-                p.extend(expression.params)
-        if self.frame:
-            if self.start:
-                p.append(abs(self.start))
-            if self.end:
-                p.append(abs(self.end))
-        return tuple(p)
+            ctx.write(' EXCLUDE %s' % self.exclude)
 
 
 class Order(Expression):
     __slots__ = ('_expression')
+    _parameters = ('_expression',)
     _sql = ''
 
     def __init__(self, expression):
@@ -2167,14 +3829,14 @@ class Order(Expression):
             raise ValueError("invalid expression: %r" % value)
         self._expression = value
 
-    def __str__(self):
+    def _compile(self, ctx):
         if isinstance(self.expression, SelectQuery):
-            return '(%s) %s' % (self.expression, self._sql)
-        return '%s %s' % (self.expression, self._sql)
-
-    @property
-    def params(self):
-        return self.expression.params
+            ctx.write('(')
+            yield self.expression
+            ctx.write(')')
+        else:
+            yield self.expression
+        ctx.write(' ' + self._sql)
 
 
 class Asc(Order):
@@ -2195,19 +3857,14 @@ class NullOrder(Expression):
         super(NullOrder, self).__init__()
         self.expression = expression
 
-    def __str__(self):
-        if not Flavor.get().null_ordering:
-            return '%s, %s' % (self._case, self.expression)
-        return '%s NULLS %s' % (self.expression, self._sql)
-
-    @property
-    def params(self):
-        p = []
-        if not Flavor.get().null_ordering:
-            p.extend(self.expression.params)
-            p.extend(self._case_values())
-        p.extend(self.expression.params)
-        return tuple(p)
+    def _compile(self, ctx):
+        if not ctx.flavor.null_ordering:
+            yield self._case
+            ctx.write(', ')
+            yield self.expression
+        else:
+            yield self.expression
+            ctx.write(' NULLS ' + self._sql)
 
     @property
     def _case(self):
@@ -2239,7 +3896,7 @@ class NullsLast(NullOrder):
         return (1, 0)
 
 
-class For(object):
+class For(_Compilable):
     __slots__ = ('_tables', '_type_', 'nowait')
 
     def __init__(self, type_, *tables, **kwargs):
@@ -2271,11 +3928,10 @@ class For(object):
             raise ValueError("invalid type: %r" % value)
         self._type_ = value
 
-    def __str__(self):
-        tables = ''
+    def _compile(self, ctx):
+        ctx.write('FOR %s' % self.type_)
         if self.tables:
-            tables = ' OF ' + ', '.join(map(str, self.tables))
-        nowait = ''
+            ctx.write(' OF ')
+            yield from ctx.iter_join(', ', self.tables)
         if self.nowait:
-            nowait = ' NOWAIT'
-        return ('FOR %s' % self.type_) + tables + nowait
+            ctx.write(' NOWAIT')
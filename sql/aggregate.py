@@ -1,6 +1,6 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-from sql import Expression, Flavor, Literal, Window
+from sql import Expression, Literal, Window, _validate
 
 __all__ = ['Avg', 'BitAnd', 'BitOr', 'BoolAnd', 'BoolOr', 'Count', 'Every',
     'Max', 'Min', 'Stddev', 'Sum', 'Variance']
@@ -9,6 +9,7 @@ __all__ = ['Avg', 'BitAnd', 'BitOr', 'BoolAnd', 'BoolOr', 'Count', 'Every',
 class Aggregate(Expression):
     __slots__ = ('_expression', '_distinct', '_order_by', '_within',
         '_filter', '_window')
+    _parameters = ('_expression',)
     _sql = ''
 
     def __init__(self, expression, distinct=False, order_by=None, within=None,
@@ -50,7 +51,8 @@ class Aggregate(Expression):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid order by: %r" % value)
         self._order_by = value
 
@@ -63,7 +65,8 @@ class Aggregate(Expression):
         if value is not None:
             if isinstance(value, Expression):
                 value = [value]
-            if any(not isinstance(col, Expression) for col in value):
+            if _validate.get() and any(
+                    not isinstance(col, Expression) for col in value):
                 raise ValueError("invalid within: %r" % value)
         self._within = value
 
@@ -94,53 +97,35 @@ class Aggregate(Expression):
     def _case_expression(self):
         return self.expression
 
-    def __str__(self):
-        quantifier = 'DISTINCT ' if self.distinct else ''
-        has_filter = Flavor.get().filter_
+    def _compile(self, ctx):
+        has_filter = ctx.flavor.filter_
         expression = self.expression
         if self.filter_ and not has_filter:
             from sql.conditionals import Case
             expression = Case((self.filter_, self._case_expression))
-        order_by = ''
+        ctx.write(self._sql + '(')
+        if self.distinct:
+            ctx.write('DISTINCT ')
+        yield expression
         if self.order_by:
-            order_by = ' ORDER BY %s' % ', '.join(map(str, self.order_by))
-        aggregate = '%s(%s%s%s)' % (
-            self._sql, quantifier, expression, order_by)
-        within = ''
+            ctx.write(' ORDER BY ')
+            yield from ctx.iter_join(', ', self.order_by)
+        ctx.write(')')
         if self.within:
-            within = (' WITHIN GROUP (ORDER BY %s)'
-                % ', '.join(map(str, self.within)))
-        filter_ = ''
+            ctx.write(' WITHIN GROUP (ORDER BY ')
+            yield from ctx.iter_join(', ', self.within)
+            ctx.write(')')
         if self.filter_ and has_filter:
-            filter_ = ' FILTER (WHERE %s)' % self.filter_
-        window = ''
+            ctx.write(' FILTER (WHERE ')
+            yield self.filter_
+            ctx.write(')')
         if self.window:
             if self.window.has_alias:
-                window = ' OVER "%s"' % self.window.alias
+                ctx.write(' OVER "%s"' % self.window.alias)
             else:
-                window = ' OVER (%s)' % self.window
-        return aggregate + within + filter_ + window
-
-    @property
-    def params(self):
-        has_filter = Flavor.get().filter_
-        p = []
-        if self.filter_ and not has_filter:
-            p.extend(self.filter_.params)
-            p.extend(self._case_expression.params)
-        else:
-            p.extend(self.expression.params)
-        if self.order_by:
-            for expression in self.order_by:
-                p.extend(expression.params)
-        if self.within:
-            for expression in self.within:
-                p.extend(expression.params)
-        if self.filter_ and has_filter:
-            p.extend(self.filter_.params)
-        if self.window and not self.window.has_alias:
-            p.extend(self.window.params)
-        return tuple(p)
+                ctx.write(' OVER (')
+                yield self.window
+                ctx.write(')')
 
 
 class Avg(Aggregate):
@@ -171,12 +156,8 @@ class BoolOr(Aggregate):
 class _Star(Expression):
     __slots__ = ()
 
-    def __str__(self):
-        return '*'
-
-    @property
-    def params(self):
-        return ()
+    def _compile(self, ctx):
+        ctx.write('*')
 
 
 class Count(Aggregate):
@@ -0,0 +1,403 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import numbers
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+from operator import itemgetter
+from threading import Lock
+
+from sql import (
+    _NUMBERS, _STRINGS, AliasManager, Compiler, Flavor, _Compilable,
+    _get_slots, _Preset, _walk, compile)
+
+__all__ = ['StatementCache']
+
+_UNCACHEABLE = object()
+
+
+def _flavor_key(flavor):
+    # The preset flavors are hashable
+    if isinstance(flavor, _Preset):
+        return flavor
+    return tuple(
+        (name, frozenset(value.items()) if isinstance(value, dict) else value)
+        for name, value in sorted(vars(flavor).items())
+        if name != '_version')
+
+
+class _Recorder(Compiler):
+    '''
+    Compiler which records the index of the node owning each parameter
+
+    The temporary nodes created during the compilation are owned by their
+    nearest walked parent.
+    '''
+    __slots__ = ('_nodes', '_owner', 'dependent')
+    # The parameters must be added by their owner
+    memoize = False
+
+    def __init__(self, flavor, nodes):
+        super(_Recorder, self).__init__(flavor)
+        self._nodes = nodes
+        self._owner = None
+        # Set when the SQL depends on the value of the parameters
+        self.dependent = False
+
+    def add_param(self, value):
+        self._sql.append(self.param)
+        self._params.append((self._owner, value))
+
+    def add_params(self, params):
+        self._params.extend((self._owner, p) for p in params)
+
+    def _children(self, node):
+        previous = self._owner
+        owner = self._owner = self._nodes.get(id(node), previous)
+        try:
+            children = super(_Recorder, self)._children(node)
+        finally:
+            self._owner = previous
+        if children is not None:
+            children = self._owned(owner, children)
+        return children
+
+    def _owned(self, owner, children):
+        "Resume children with owner as owner"
+        previous = self._owner
+        while True:
+            self._owner = owner
+            for child in children:
+                break
+            else:
+                self._owner = previous
+                return
+            yield child
+
+    def _values(self, params):
+        return [v for _, v in params]
+
+    def render(self, node):
+        self.dependent = True
+        return super(_Recorder, self).render(node)
+
+
+def _getter(indexes):
+    "Return a function returning the tuple of the items at indexes"
+    if len(indexes) == 1:
+        index, = indexes
+        return lambda items: (items[index],)
+    elif indexes:
+        return itemgetter(*indexes)
+    else:
+        return lambda items: ()
+
+
+def _specialize(query, leaves, structure, indexes):
+    '''
+    Return a function returning the parameters of a query with the same
+    shape and structure as query or None for any other query
+
+    The function is generated with an accessor for each value of the query.
+    Returns None if the query can not be specialized.
+    '''
+    lines, constants, nodes, values, keep = [], {}, {}, [], []
+    structural = set(structure)
+
+    def constant(value):
+        name = 'c%i' % len(constants)
+        constants[name] = value
+        return name
+
+    def check(condition):
+        lines.append('    if %s: return' % condition)
+
+    def generate(value, accessor):
+        var = 'v%i' % len(lines)
+        lines.append('    %s = %s' % (var, accessor))
+        cls = value.__class__
+        if isinstance(value, _Compilable):
+            if id(value) in nodes:
+                check('%s is not %s' % (var, nodes[id(value)]))
+                return
+            elif cls.__dictoffset__:
+                raise TypeError
+            nodes[id(value)] = var
+            keep.append(value)
+            check('%s.__class__ is not %s' % (var, constant(cls)))
+            if isinstance(value, (list, tuple)):
+                check('len(%s) != %i' % (var, len(value)))
+                for i, item in enumerate(value):
+                    generate(item, '%s[%i]' % (var, i))
+            for name in _get_slots(cls):
+                if not name.isidentifier() or name.startswith('__'):
+                    raise TypeError
+                # The accessor can not read an unset slot
+                generate(object.__getattribute__(value, name),
+                    '%s.%s' % (var, name))
+            return
+        elif isinstance(value, (list, tuple)):
+            check('%s.__class__ is not %s or len(%s) != %i'
+                % (var, constant(cls), var, len(value)))
+            for i, item in enumerate(value):
+                generate(item, '%s[%i]' % (var, i))
+            return
+        elif value is None:
+            check('%s is not None' % var)
+        else:
+            check('%s.__class__ is not %s' % (var, constant(cls)))
+            if len(values) in structural:
+                check('%s != %s' % (var, constant(value)))
+            elif cls in _NUMBERS:
+                check('(%s < 0) is not %s or (not %s) is not %s'
+                    % (var, value < 0, var, not value))
+            elif cls is Decimal:
+                check('%s.is_signed() is not %s or %s.is_zero() is not %s'
+                    % (var, value.is_signed(), var, value.is_zero()))
+            elif cls in _STRINGS:
+                check('(not %s) is not %s' % (var, not value))
+        values.append(var)
+
+    try:
+        generate(query, 'query')
+    except (TypeError, AttributeError, RecursionError):
+        return
+    # Nodes shared by the query must not be shared by another query
+    check('len({%s}) != %i'
+        % (', '.join('id(%s)' % v for v in nodes.values()), len(nodes)))
+    if indexes:
+        lines.append(
+            '    return (%s,)' % ', '.join(values[i] for i in indexes))
+    else:
+        lines.append('    return ()')
+    source = 'def specialized(query):\n%s\n' % '\n'.join(lines)
+    namespace = dict(constants)
+    exec(source, namespace)
+    return namespace['specialized']
+
+
+def _match(params, leaves, owners):
+    '''
+    Return the indexes of the leaves used as parameters
+
+    Returns None if a parameter matches many leaves of its owner and
+    _UNCACHEABLE if it matches none.
+    '''
+    candidates = defaultdict(list)
+    for i, owner in enumerate(owners):
+        candidates[owner].append(i)
+    used, indexes = set(), []
+    for owner, value in params:
+        found = [i for i in candidates[owner]
+            if i not in used and leaves[i] is value]
+        if not found:
+            return _UNCACHEABLE
+        elif len(found) > 1:
+            return None
+        used.add(found[0])
+        indexes.append(found[0])
+    return tuple(indexes)
+
+
+class _Statement(object):
+    __slots__ = ('sql', 'get_params', 'names', '_encoded')
+
+    def __init__(self, sql, get_params, names):
+        self.sql = sql
+        self.get_params = get_params
+        self.names = names
+        self._encoded = {}
+
+    def result(self, params, encoding):
+        "Return the SQL and the parameters"
+        if self.names is not None:
+            params = dict(zip(self.names, params))
+        if encoding is None:
+            return self.sql, params
+        try:
+            sql = self._encoded[encoding]
+        except KeyError:
+            sql = self._encoded[encoding] = self.sql.encode(encoding)
+        return sql, params
+
+
+class _Specialization(object):
+    __slots__ = ('statement', 'function', 'hits')
+
+    def __init__(self, statement, function):
+        self.statement = statement
+        self.function = function
+        self.hits = 0
+
+
+class StatementCache(object):
+    '''
+    Bounded LRU cache of compiled statements
+
+    The SQL is cached by the structure of the query and the settings of the
+    flavor. On a hit, only the parameters are collected from the query.
+
+    The first shapes compiled can be specialized into generated functions
+    which collect the parameters without walking the query.
+
+    Contains:
+        maxsize - the maximum number of entries (None for unbounded)
+        specialize - the maximum number of specialized shapes
+        hits - the number of statements found in the cache
+        misses - the number of statements compiled
+        evictions - the number of entries discarded
+    '''
+    __slots__ = ('_maxsize', 'specialize', 'hits', 'misses', 'evictions',
+        '_entries', '_specialized', '_lock')
+
+    def __init__(self, maxsize=128, specialize=0):
+        self._entries = OrderedDict()
+        self._specialized = {}
+        self._lock = Lock()
+        self.maxsize = maxsize
+        if not isinstance(specialize, numbers.Integral) or specialize < 0:
+            raise ValueError("invalid specialize: %r" % specialize)
+        self.specialize = specialize
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        if value is not None:
+            if not isinstance(value, numbers.Integral) or value < 0:
+                raise ValueError("invalid maxsize: %r" % value)
+        self._maxsize = value
+        with self._lock:
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def specialized(self):
+        "The SQL and the number of hits of the specialized shapes"
+        return [(s.statement.sql, s.hits)
+            for specializations in self._specialized.values()
+            for s in specializations]
+
+    def clear(self):
+        "Discard all the entries and reset the counters"
+        with self._lock:
+            self._entries.clear()
+            self._specialized.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def _get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        if self._maxsize is None:
+            return
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _add_specialization(self, key, query, statement, leaves, structure,
+            indexes):
+        count = sum(map(len, self._specialized.values()))
+        if count >= self.specialize:
+            return
+        function = _specialize(query, leaves, structure, indexes)
+        if function is not None:
+            self._specialized[key] = self._specialized.get(key, ()) + (
+                _Specialization(statement, function),)
+
+    def compile(self, query, flavor=None, encoding=None):
+        '''
+        Return the SQL and parameters of query
+
+        The SQL is reused from the cache if a query with the same
+        structure has already been compiled with the same flavor.
+        If encoding is set, the SQL is returned as bytes encoded once.
+        '''
+        if flavor is None:
+            flavor = Flavor.get()
+        if AliasManager._active():
+            # The aliases depend on the enclosing query
+            return compile(query, flavor, encoding)
+        elif flavor.deduplicate and flavor.paramstyle not in {
+                'format', 'qmark'}:
+            # The markers depend on the values of the parameters
+            return compile(query, flavor, encoding)
+        flavor_key = _flavor_key(flavor)
+        specialized_key = (flavor_key, query.__class__)
+        for specialization in self._specialized.get(specialized_key, ()):
+            try:
+                params = specialization.function(query)
+            except AttributeError:
+                params = None
+            if params is not None:
+                with self._lock:
+                    self.hits += 1
+                    specialization.hits += 1
+                return specialization.statement.result(params, encoding)
+
+        shape, leaves, _, _, owners, nodes = _walk(query)
+        key = (flavor_key, tuple(shape))
+        with self._lock:
+            structure = self._get(key)
+            statement = None
+            if structure is not None and structure is not _UNCACHEABLE:
+                try:
+                    statement = self._get((key, structure[1](leaves)))
+                except TypeError:
+                    # unhashable leaves
+                    structure = _UNCACHEABLE
+            if statement is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if statement is not None:
+            return statement.result(statement.get_params(leaves), encoding)
+        elif structure is _UNCACHEABLE:
+            return compile(query, flavor, encoding)
+
+        # Nodes compiled with __str__ and params use the context's flavor
+        with Flavor.use(flavor):
+            ctx = _Recorder(flavor, nodes)
+            ctx.compile(query)
+        sql, params = ctx._join(ctx._sql, ctx._params)
+        names = tuple(params) if isinstance(params, dict) else None
+        indexes = _match(ctx._params, leaves, owners)
+        if ctx.dependent:
+            indexes = _UNCACHEABLE
+        if indexes is _UNCACHEABLE:
+            with self._lock:
+                self._set(key, _UNCACHEABLE)
+        elif indexes is not None:
+            used = set(indexes)
+            learned = tuple(i for i in range(len(leaves)) if i not in used)
+            with self._lock:
+                if structure is None:
+                    structure = self._get(key)
+                if structure is None:
+                    structure = (learned, _getter(learned))
+                    self._set(key, structure)
+                if structure is not _UNCACHEABLE and structure[0] == learned:
+                    statement = _Statement(sql, _getter(indexes), names)
+                    try:
+                        self._set((key, structure[1](leaves)), statement)
+                    except TypeError:
+                        self._set(key, _UNCACHEABLE)
+                    else:
+                        self._add_specialization(
+                            specialized_key, query, statement, leaves,
+                            learned, indexes)
+        if encoding is not None:
+            sql = sql.encode(encoding)
+        return sql, params
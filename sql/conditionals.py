@@ -1,6 +1,6 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-from sql import CombiningQuery, Expression, Flavor, Select
+from sql import CombiningQuery, Expression, Flavor, Select, _legacy_format
 
 __all__ = ['Case', 'Coalesce', 'NullIf', 'Greatest', 'Least']
 
@@ -11,6 +11,21 @@ class Conditional(Expression):
     table = ''
     name = ''
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _legacy_format(cls)
+
+    @staticmethod
+    def _compile_operand(ctx, value):
+        if isinstance(value, Expression):
+            yield value
+        elif isinstance(value, (Select, CombiningQuery)):
+            ctx.write('(')
+            yield value
+            ctx.write(')')
+        else:
+            ctx.add_param(value)
+
     @staticmethod
     def _format(value):
         if isinstance(value, Expression):
@@ -18,66 +33,47 @@ class Conditional(Expression):
         elif isinstance(value, (Select, CombiningQuery)):
             return '(%s)' % value
         else:
-            return Flavor().get().param
+            return Flavor.get().param
 
 
 class Case(Conditional):
     __slots__ = ('whens', 'else_')
+    _parameters = ('whens', 'else_')
 
     def __init__(self, *whens, **kwargs):
         self.whens = whens
         self.else_ = kwargs.get('else_')
 
-    def __str__(self):
-        case = 'CASE '
-        for cond, result in self.whens:
-            case += 'WHEN %s THEN %s ' % (
-                self._format(cond), self._format(result))
-        if self.else_ is not None:
-            case += 'ELSE %s ' % self._format(self.else_)
-        case += 'END'
-        return case
-
-    @property
-    def params(self):
-        p = []
+    def _compile(self, ctx):
+        ctx.write('CASE ')
         for cond, result in self.whens:
-            if isinstance(cond, (Expression, Select, CombiningQuery)):
-                p.extend(cond.params)
-            else:
-                p.append(cond)
-            if isinstance(result, (Expression, Select, CombiningQuery)):
-                p.extend(result.params)
-            else:
-                p.append(result)
+            ctx.write('WHEN ')
+            yield from self._compile_operand(ctx, cond)
+            ctx.write(' THEN ')
+            yield from self._compile_operand(ctx, result)
+            ctx.write(' ')
         if self.else_ is not None:
-            if isinstance(self.else_, (Expression, Select, CombiningQuery)):
-                p.extend(self.else_.params)
-            else:
-                p.append(self.else_)
-        return tuple(p)
+            ctx.write('ELSE ')
+            yield from self._compile_operand(ctx, self.else_)
+            ctx.write(' ')
+        ctx.write('END')
 
 
 class Coalesce(Conditional):
     __slots__ = ('values')
+    _parameters = ('values',)
     _conditional = 'COALESCE'
 
     def __init__(self, *values):
         self.values = values
 
-    def __str__(self):
-        return (self._conditional
-            + '(' + ', '.join(map(self._format, self.values)) + ')')
-
-    @property
-    def params(self):
-        p = []
-        for value in self.values:
-            if isinstance(value, (Expression, Select, CombiningQuery)):
-                p.extend(value.params)
-            else:
-                p.append(value)
-        return tuple(p)
+    def _compile(self, ctx):
+        ctx.write(self._conditional + '(')
+        for i, value in enumerate(self.values):
+            if i:
+                ctx.write(', ')
+            yield from self._compile_operand(ctx, value)
+        ctx.write(')')
 
 
 class NullIf(Coalesce):
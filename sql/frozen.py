@@ -0,0 +1,353 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import copy
+from decimal import Decimal
+from threading import Lock
+from weakref import WeakValueDictionary
+
+from sql import Column, Literal, _Compilable, _get_slots, _unset
+from sql.functions import Function
+from sql.operators import Operator
+
+__all__ = ['freeze']
+
+# The classes which can be frozen
+_FREEZABLE = (Column, Literal, Operator, Function)
+# The leaves of these types are interned by their representation
+_REPRESENTED = {float, Decimal}
+# The maximum number of versions of flavors memoized per node
+_MEMO_SIZE = 8
+_classes = {}
+_interned = WeakValueDictionary()
+# The identical nodes frozen by concurrent threads must be the same object
+_lock = Lock()
+
+
+class _Frozen(object):
+    '''
+    Mixin of the immutable nodes
+
+    The nodes which do not contain columns memoize their SQL and
+    parameters per flavor.
+    The tables are the from items of the columns contained or None if a
+    mutable node is contained.
+    '''
+    __slots__ = ()
+    _hidden_slots = ('_memo', '_tables')
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%r is frozen" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%r is frozen" % self.__class__.__name__)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # The copy must reference the copies of the tables
+        if self._tables == ():
+            return self
+        func, args = self.__reduce__()
+        return func(*copy.deepcopy(args, memo))
+
+    def __reduce__(self):
+        # The frozen classes are created at runtime
+        cls = self._mutable_class
+        values = []
+        for name in _get_slots(cls):
+            try:
+                values.append(object.__getattribute__(self, name))
+            except AttributeError:
+                values.append(_unset)
+        items = tuple(self) if isinstance(self, list) else ()
+        return _unpickle, (cls, tuple(values), items)
+
+    def _compile(self, ctx):
+        if self._tables != () or not ctx.memoize:
+            return super()._compile(ctx)
+        # The version changes when the flavor is modified
+        version = ctx.flavor._version
+        memo = self._memo.get(version)
+        if memo is None:
+            with ctx.capture() as (sql, params):
+                ctx.run(super()._compile(ctx))
+            if len(self._memo) >= _MEMO_SIZE:
+                self._memo.clear()
+            memo = self._memo[version] = (sql, tuple(ctx._values(params)))
+        sql, params = memo
+        ctx.extend((sql, []))
+        ctx.add_params(params)
+
+
+class _FrozenColumn(_Frozen):
+    "Mixin of the immutable columns which memoize their SQL per alias"
+    __slots__ = ()
+
+    def _compile(self, ctx):
+        alias = self._from.alias
+        try:
+            sql = self._memo[alias]
+        except KeyError:
+            with ctx.capture() as (sql, _):
+                super()._compile(ctx)
+            sql = self._memo[alias] = ''.join(sql)
+        ctx.write(sql)
+
+
+class _FrozenList(_Frozen):
+    "Mixin of the immutable nodes which are lists"
+    __slots__ = ()
+
+    def _frozen(self, *args, **kwargs):
+        raise AttributeError("%r is frozen" % self.__class__.__name__)
+
+    append = extend = insert = remove = pop = clear = sort = reverse = (
+        __setitem__) = __delitem__ = __iadd__ = __imul__ = _frozen
+
+
+def _clause_tables(values):
+    '''
+    Return the from items of the columns of the values
+
+    The tables are None if one of the values is mutable.
+    '''
+    tables = ()
+    for value in values:
+        if isinstance(value, _Frozen):
+            tables = _merge(tables, value._tables)
+        elif isinstance(value, (_Compilable, list, dict)):
+            return None
+    return tables
+
+
+def _aliases(tables):
+    "Return the aliases of the tables or None if one has no alias"
+    aliases = []
+    for table in tables:
+        try:
+            aliases.append(table.alias if table.has_alias else None)
+        except AttributeError:
+            return None
+    return aliases
+
+
+def _alias_order(alias):
+    "Return the key sorting the aliases in order of generation"
+    return len(alias), alias
+
+
+def _compile_clause(ctx, memo, name, values, func):
+    '''
+    Compile the clause name of values with the children returned by func
+
+    The SQL and the parameters are stored into memo when all the values are
+    immutable and reused until the flavor, the aliases or the values change.
+    The tables aliased by the compilation are aliased again in the same
+    order when the SQL is reused.
+    The children are yielded to compile them in place when the clause is not
+    stored.
+    '''
+    tables = _clause_tables(values) if ctx.memoize else None
+    before = _aliases(tables) if tables is not None else None
+    if before is None:
+        children = func()
+        if children is not None:
+            yield from children
+        return
+    version = ctx.flavor._version
+    rendered = memo.get(name)
+    if rendered is not None:
+        values_, version_, before_, assigned, after, sql, params = rendered
+        if (version_ == version
+                and before_ == before
+                and len(values_) == len(values)
+                and all(a is b for a, b in zip(values_, values))):
+            for i in assigned:
+                tables[i].alias
+            # The aliases generated may differ if other tables were added
+            if _aliases(tables) == after:
+                ctx.extend((sql, []))
+                ctx.add_params(params)
+                return
+    with ctx.capture() as (sql, params):
+        children = func()
+        if children is not None:
+            ctx.run(children)
+    after = _aliases(tables)
+    assigned = sorted(
+        (i for i, (a, b) in enumerate(zip(before, after)) if a != b),
+        key=lambda i: _alias_order(after[i]))
+    params = tuple(ctx._values(params))
+    memo[name] = (values, version, before, assigned, after, sql, params)
+    ctx.extend((sql, []))
+    ctx.add_params(params)
+
+
+def _frozen_class(cls):
+    "Return the immutable class of cls"
+    try:
+        return _classes[cls]
+    except KeyError:
+        pass
+    if issubclass(cls, Column):
+        mixin = _FrozenColumn
+    elif issubclass(cls, list):
+        mixin = _FrozenList
+    else:
+        mixin = _Frozen
+    frozen = type('Frozen' + cls.__name__, (mixin, cls), {
+            '__slots__': _Frozen._hidden_slots,
+            '__module__': __name__,
+            '_mutable_class': cls,
+            })
+    return _classes.setdefault(cls, frozen)
+
+
+def _children(value):
+    "Yield the nodes to freeze contained by value"
+    if isinstance(value, _Frozen):
+        return
+    elif isinstance(value, _FREEZABLE):
+        if isinstance(value, list):
+            yield from value
+        for name in _get_slots(value.__class__):
+            try:
+                yield object.__getattribute__(value, name)
+            except AttributeError:
+                pass
+    elif (isinstance(value, (list, tuple))
+            and not isinstance(value, _Compilable)):
+        yield from value
+
+
+def _merge(tables, others):
+    "Return the union of the tables keeping the order"
+    if tables is None or others is None:
+        return None
+    tables = list(tables)
+    for table in others:
+        if not any(t is table for t in tables):
+            tables.append(table)
+    return tuple(tables)
+
+
+def _convert(value, frozen):
+    '''
+    Return the frozen value, its key and its tables
+
+    The key is None if the value can not be interned.
+    '''
+    if isinstance(value, _Frozen):
+        return value, ('node', id(value)), value._tables
+    elif isinstance(value, _FREEZABLE):
+        value = frozen[id(value)]
+        return value, ('node', id(value)), value._tables
+    elif isinstance(value, _Compilable):
+        return value, ('node', id(value)), None
+    elif isinstance(value, (list, tuple)):
+        items, keys, tables = [], [], ()
+        for item in value:
+            item, key, item_tables = _convert(item, frozen)
+            items.append(item)
+            keys.append(key)
+            tables = _merge(tables, item_tables)
+        if None in keys:
+            keys = None
+        else:
+            keys = ('sequence', tuple(keys))
+        return tuple(items), keys, tables
+    elif value is _unset:
+        return value, 'unset', ()
+    cls = value.__class__
+    if cls in _REPRESENTED:
+        key = ('value', cls, repr(value))
+    else:
+        key = ('value', cls, value)
+    try:
+        hash(key)
+    except TypeError:
+        key = None
+    return value, key, ()
+
+
+def _freeze(node, frozen):
+    "Return the immutable copy of node with its children already frozen"
+    cls = node.__class__
+    slots = _get_slots(cls)
+    values = []
+    for name in slots:
+        try:
+            values.append(object.__getattribute__(node, name))
+        except AttributeError:
+            values.append(_unset)
+    if isinstance(node, list):
+        items, key, tables = _convert(list(node), frozen)
+    else:
+        items, key, tables = (), ('sequence', ()), ()
+    values, values_key, values_tables = _convert(values, frozen)
+    if isinstance(node, Column):
+        tables = (node._from,)
+    else:
+        tables = _merge(tables, values_tables)
+    if key is not None and values_key is not None:
+        key = (cls, key, values_key)
+        interned = _interned.get(key)
+        if interned is not None:
+            return interned
+    else:
+        key = None
+
+    frozen_cls = _frozen_class(cls)
+    new = frozen_cls.__new__(frozen_cls)
+    if items:
+        list.extend(new, items)
+    for name, value in zip(slots, values):
+        if value is not _unset:
+            object.__setattr__(new, name, value)
+    object.__setattr__(new, '_memo', {})
+    object.__setattr__(new, '_tables', tables)
+    if key is not None:
+        with _lock:
+            new = _interned.setdefault(key, new)
+    return new
+
+
+def _unpickle(cls, values, items):
+    "Return the frozen node of cls with the values of the slots and items"
+    node = cls.__new__(cls)
+    for name, value in zip(_get_slots(cls), values):
+        if value is not _unset:
+            object.__setattr__(node, name, value)
+    if items:
+        list.extend(node, items)
+    return freeze(node)
+
+
+def freeze(node):
+    '''
+    Return an immutable copy of the columns, literals, operators and
+    functions of node
+
+    The identical frozen nodes are the same object. The sequences are
+    converted into tuples and the other nodes are kept.
+
+    >>> from sql import Table
+    >>> table = Table('t')
+    >>> freeze(table.c == 1) is freeze(table.c == 1)
+    True
+    '''
+    frozen = {}
+    stack = [(node, False)]
+    while stack:
+        value, visited = stack.pop()
+        if id(value) in frozen:
+            continue
+        elif visited:
+            frozen[id(value)] = _freeze(value, frozen)
+            continue
+        elif isinstance(value, _FREEZABLE) and not isinstance(value, _Frozen):
+            stack.append((value, True))
+        for child in _children(value):
+            stack.append((child, False))
+    return _convert(node, frozen)[0]
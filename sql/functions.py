@@ -2,9 +2,10 @@
 # this repository contains the full copyright notices and license terms.
 
 from enum import Enum, auto
-from itertools import chain
 
-from sql import CombiningQuery, Expression, Flavor, FromItem, Select, Window
+from sql import (
+    CombiningQuery, Expression, Flavor, FromItem, Select, Window,
+    _legacy_format)
 
 __all__ = ['Abs', 'Cbrt', 'Ceil', 'Degrees', 'Div', 'Exp', 'Floor', 'Ln',
     'Log', 'Mod', 'Pi', 'Power', 'Radians', 'Random', 'Round', 'SetSeed',
@@ -17,7 +18,7 @@ __all__ = ['Abs', 'Cbrt', 'Ceil', 'Degrees', 'Div', 'Exp', 'Floor', 'Ln',
     'DatePart', 'DateTrunc', 'Extract', 'Isfinite', 'JustifyDays',
     'JustifyHours', 'JustifyInterval', 'Localtime', 'Localtimestamp', 'Now',
     'StatementTimestamp', 'Timeofday', 'TransactionTimestamp',
-    'AtTimeZone',
+    'AtTimeZone', 'Unnest',
     'RowNumber', 'Rank', 'DenseRank', 'PercentRank', 'CumeDist', 'Ntile',
     'Lag', 'Lead', 'FirstValue', 'LastValue', 'NthValue']
 
@@ -26,10 +27,15 @@ __all__ = ['Abs', 'Cbrt', 'Ceil', 'Degrees', 'Div', 'Exp', 'Floor', 'Ln',
 
 class Function(Expression, FromItem):
     __slots__ = ('args', '_columns_definitions')
+    _parameters = ('args',)
     table = ''
     name = ''
     _function = ''
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _legacy_format(cls)
+
     def __init__(self, *args, **kwargs):
         self.args = args
         self.columns_definitions = kwargs.get('columns_definitions', [])
@@ -45,6 +51,17 @@ class Function(Expression, FromItem):
             raise ValueError("invalid columns definitions: %r" % value)
         self._columns_definitions = value
 
+    @staticmethod
+    def _compile_operand(ctx, value):
+        if isinstance(value, Expression):
+            yield value
+        elif isinstance(value, (Select, CombiningQuery)):
+            ctx.write('(')
+            yield value
+            ctx.write(')')
+        else:
+            ctx.add_param(value)
+
     @staticmethod
     def _format(value):
         if isinstance(value, Expression):
@@ -52,27 +69,29 @@ class Function(Expression, FromItem):
         elif isinstance(value, (Select, CombiningQuery)):
             return '(%s)' % value
         else:
-            return Flavor().get().param
-
-    def __str__(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(*self.args))
-        return self._function + '(' + ', '.join(
-            map(self._format, self.args)) + ')'
+            return Flavor.get().param
 
     @property
-    def params(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
+    def _mapping_args(self):
+        return self.args
+
+    def _compile(self, ctx):
+        # The frozen functions are mapped like their mutable class
+        cls = self.__class__
+        Mapping = ctx.flavor.function_mapping.get(
+            getattr(cls, '_mutable_class', cls))
         if Mapping:
-            return Mapping(*self.args).params
-        p = []
-        for arg in self.args:
-            if isinstance(arg, (Expression, Select, CombiningQuery)):
-                p.extend(arg.params)
-            else:
-                p.append(arg)
-        return tuple(p)
+            return iter((Mapping(*self._mapping_args),))
+        else:
+            return self._compile_function(ctx)
+
+    def _compile_function(self, ctx):
+        ctx.write(self._function + '(')
+        for i, arg in enumerate(self.args):
+            if i:
+                ctx.write(', ')
+            yield from self._compile_operand(ctx, arg)
+        ctx.write(')')
 
 
 class FunctionKeyword(Function):
@@ -80,26 +99,25 @@ class FunctionKeyword(Function):
     _function = ''
     _keywords = ()
 
-    def __str__(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(*self.args))
-        return (self._function + '('
-            + ' '.join(chain(*zip(
-                        self._keywords,
-                        map(self._format, self.args)))).strip()
-            + ')')
+    def _compile_function(self, ctx):
+        ctx.write(self._function + '(')
+        separator = ''
+        for keyword, arg in zip(self._keywords, self.args):
+            if keyword:
+                ctx.write(separator + keyword)
+                separator = ' '
+            ctx.write(separator)
+            yield from self._compile_operand(ctx, arg)
+            separator = ' '
+        ctx.write(')')
 
 
 class FunctionNotCallable(Function):
     __slots__ = ()
     _function = ''
 
-    def __str__(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(*self.args))
-        return self._function
+    def _compile_function(self, ctx):
+        ctx.write(self._function)
 
 
 class Abs(Function):
@@ -286,6 +304,7 @@ class Substring(FunctionKeyword):
 
 class Trim(Function):
     __slots__ = ('position', 'characters', 'string')
+    _parameters = ('characters', 'string')
     _function = 'TRIM'
 
     def __init__(self, string, position='BOTH', characters=' '):
@@ -295,33 +314,21 @@ class Trim(Function):
         self.characters = characters
         self.string = string
 
-    def __str__(self):
-        flavor = Flavor.get()
-        Mapping = flavor.function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(self.string, self.position, self.characters))
-        param = flavor.param
-
-        def format(arg):
-            if isinstance(arg, str):
-                return param
-            else:
-                return str(arg)
-        return self._function + '(%s %s FROM %s)' % (
-            self.position, format(self.characters), format(self.string))
-
     @property
-    def params(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return Mapping(self.string, self.position, self.characters).params
-        p = []
-        for arg in (self.characters, self.string):
+    def _mapping_args(self):
+        return (self.string, self.position, self.characters)
+
+    def _compile_function(self, ctx):
+        def compile_(arg):
             if isinstance(arg, str):
-                p.append(arg)
+                ctx.add_param(arg)
             else:
-                p.extend(arg.params)
-        return tuple(p)
+                yield arg
+        ctx.write(self._function + '(%s ' % self.position)
+        yield from compile_(self.characters)
+        ctx.write(' FROM ')
+        yield from compile_(self.string)
+        ctx.write(')')
 
 
 class Upper(Function):
@@ -434,18 +441,9 @@ class Extract(FunctionKeyword):
     def _keywords(self):
         return ('%s FROM' % self.field,)
 
-    def __str__(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(self.field, *self.args))
-        return super().__str__()
-
     @property
-    def params(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return Mapping(self.field, *self.args).params
-        return super().params
+    def _mapping_args(self):
+        return (self.field,) + self.args
 
 
 class Isfinite(Function):
@@ -500,33 +498,28 @@ class TransactionTimestamp(Function):
 
 class AtTimeZone(Function):
     __slots__ = ('field', 'zone')
+    _parameters = ('field', 'zone')
 
     def __init__(self, field, zone):
         self.field = field
         self.zone = zone
 
-    def __str__(self):
-        flavor = Flavor.get()
-        Mapping = flavor.function_mapping.get(self.__class__)
-        if Mapping:
-            return str(Mapping(self.field, self.zone))
-        if isinstance(self.zone, Expression):
-            zone = str(self.zone)
-        elif isinstance(self.zone, (Select, CombiningQuery)):
-            zone = '(%s)' % self.zone
-        else:
-            zone = flavor.param
-        return '%s AT TIME ZONE %s' % (str(self.field), zone)
-
     @property
-    def params(self):
-        Mapping = Flavor.get().function_mapping.get(self.__class__)
-        if Mapping:
-            return Mapping(self.field, self.zone).params
-        if isinstance(self.zone, (Expression, Select, CombiningQuery)):
-            return self.field.params + self.zone.params
-        else:
-            return self.field.params + (self.zone,)
+    def _mapping_args(self):
+        return (self.field, self.zone)
+
+    def _compile_function(self, ctx):
+        yield self.field
+        ctx.write(' AT TIME ZONE ')
+        yield from self._compile_operand(ctx, self.zone)
+
+
+# Array
+
+
+class Unnest(Function):
+    __slots__ = ()
+    _function = 'UNNEST'
 
 
 class WindowFunction(Function):
@@ -560,25 +553,18 @@ class WindowFunction(Function):
                 raise ValueError("invalid window: %r" % value)
         self._window = value
 
-    def __str__(self):
-        function = super(WindowFunction, self).__str__()
-        filter_ = ''
+    def _compile(self, ctx):
+        yield from super(WindowFunction, self)._compile(ctx) or ()
         if self.filter_:
-            filter_ = ' FILTER (WHERE %s)' % self.filter_
+            ctx.write(' FILTER (WHERE ')
+            yield self.filter_
+            ctx.write(')')
         if self.window.has_alias:
-            over = ' OVER "%s"' % self.window.alias
+            ctx.write(' OVER "%s"' % self.window.alias)
         else:
-            over = ' OVER (%s)' % self.window
-        return function + filter_ + over
-
-    @property
-    def params(self):
-        p = list(super(WindowFunction, self).params)
-        if self.filter_:
-            p.extend(self.filter_.params)
-        if not self.window.has_alias:
-            p.extend(self.window.params)
-        return tuple(p)
+            ctx.write(' OVER (')
+            yield self.window
+            ctx.write(')')
 
 
 class RowNumber(WindowFunction):
@@ -3,7 +3,8 @@
 import warnings
 from array import array
 
-from sql import CombiningQuery, Expression, Flavor, Null, Select
+from sql import (
+    CombiningQuery, Expression, Flavor, Null, Select, _legacy_format)
 
 __all__ = ['And', 'Or', 'Not', 'Less', 'Greater', 'LessEqual', 'GreaterEqual',
     'Equal', 'NotEqual', 'Between', 'NotBetween', 'IsDistinct',
@@ -15,6 +16,11 @@ __all__ = ['And', 'Or', 'Not', 'Less', 'Greater', 'LessEqual', 'GreaterEqual',
 
 class Operator(Expression):
     __slots__ = ()
+    _parameters = ('operand', 'left', 'right')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _legacy_format(cls)
 
     @property
     def table(self):
@@ -28,24 +34,39 @@ class Operator(Expression):
     def _operands(self):
         return ()
 
-    @property
-    def params(self):
-
-        def convert(operands):
-            params = []
-            for operand in operands:
-                if isinstance(operand, (Expression, Select, CombiningQuery)):
-                    params.extend(operand.params)
-                elif isinstance(operand, (list, tuple)):
-                    params.extend(convert(operand))
-                elif isinstance(operand, array):
-                    params.extend(operand)
-                else:
-                    params.append(operand)
-            return params
-        return tuple(convert(self._operands))
+    def _get_operands(self, flavor):
+        return self._operands
+
+    def _get_operator(self, flavor):
+        return self._operator
+
+    def _compile_operand(self, ctx, operand):
+        if (isinstance(operand, Expression)
+                and (not isinstance(operand, Operator)
+                    or isinstance(operand, UnaryOperator))):
+            yield operand
+        elif isinstance(operand, (Expression, Select, CombiningQuery)):
+            ctx.write('(')
+            yield operand
+            ctx.write(')')
+        elif isinstance(operand, (list, tuple)):
+            ctx.write('(')
+            for i, o in enumerate(operand):
+                if i:
+                    ctx.write(', ')
+                yield from self._compile_operand(ctx, o)
+                if ctx.streaming:
+                    yield None
+            ctx.write(')')
+        elif isinstance(operand, array):
+            ctx.write('(')
+            ctx.join(', ', operand, ctx.add_param)
+            ctx.write(')')
+        else:
+            ctx.add_param(operand)
 
     def _format(self, operand, param=None):
+        "Return the SQL of operand for the legacy subclasses"
         if param is None:
             param = Flavor.get().param
         if (isinstance(operand, Expression)
@@ -62,9 +83,6 @@ class Operator(Expression):
         else:
             return param
 
-    def __str__(self):
-        raise NotImplementedError
-
     def __and__(self, other):
         if isinstance(other, And):
             return And([self] + other)
@@ -89,8 +107,10 @@ class UnaryOperator(Operator):
     def _operands(self):
         return (self.operand,)
 
-    def __str__(self):
-        return '%s %s' % (self._operator, self._format(self.operand))
+    def _compile(self, ctx):
+        operand, = self._get_operands(ctx.flavor)
+        ctx.write(self._get_operator(ctx.flavor) + ' ')
+        yield from self._compile_operand(ctx, operand)
 
 
 class BinaryOperator(Operator):
@@ -105,10 +125,11 @@ class BinaryOperator(Operator):
     def _operands(self):
         return (self.left, self.right)
 
-    def __str__(self):
-        left, right = self._operands
-        return '%s %s %s' % (self._format(left), self._operator,
-            self._format(right))
+    def _compile(self, ctx):
+        left, right = self._get_operands(ctx.flavor)
+        yield from self._compile_operand(ctx, left)
+        ctx.write(' %s ' % self._get_operator(ctx.flavor))
+        yield from self._compile_operand(ctx, right)
 
     def __invert__(self):
         return _INVERT[self.__class__](self.left, self.right)
@@ -122,8 +143,21 @@ class NaryOperator(list, Operator):
     def _operands(self):
         return self
 
-    def __str__(self):
-        return (' %s ' % self._operator).join(map(self._format, self))
+    def _compile(self, ctx):
+        separator = ' %s ' % self._operator
+        # The operands of the same operator are flattened
+        stack, first = [iter(self)], True
+        while stack:
+            for operand in stack[-1]:
+                if operand.__class__ is self.__class__ and operand:
+                    stack.append(iter(operand))
+                    break
+                if not first:
+                    ctx.write(separator)
+                first = False
+                yield from self._compile_operand(ctx, operand)
+            else:
+                stack.pop()
 
 
 class And(NaryOperator):
@@ -183,24 +217,34 @@ class Equal(BinaryOperator):
             return (self.left,)
         return super(Equal, self)._operands
 
-    def __str__(self):
+    def _compile(self, ctx):
         if self.left is Null:
-            return '%s IS NULL' % self.right
+            yield from self._compile_null(ctx, self.right, ' IS NULL')
         elif self.right is Null:
-            return '%s IS NULL' % self.left
-        return super(Equal, self).__str__()
+            yield from self._compile_null(ctx, self.left, ' IS NULL')
+        else:
+            yield from super(Equal, self)._compile(ctx)
+
+    @staticmethod
+    def _compile_null(ctx, operand, test):
+        if isinstance(operand, Expression):
+            yield operand
+        else:
+            ctx.add_param(operand)
+        ctx.write(test)
 
 
 class NotEqual(Equal):
     __slots__ = ()
     _operator = '!='
 
-    def __str__(self):
+    def _compile(self, ctx):
         if self.left is Null:
-            return '%s IS NOT NULL' % self.right
+            yield from self._compile_null(ctx, self.right, ' IS NOT NULL')
         elif self.right is Null:
-            return '%s IS NOT NULL' % self.left
-        return super(Equal, self).__str__()
+            yield from self._compile_null(ctx, self.left, ' IS NOT NULL')
+        else:
+            yield from super(Equal, self)._compile(ctx)
 
 
 class Between(Operator):
@@ -217,13 +261,15 @@ class Between(Operator):
     def _operands(self):
         return (self.operand, self.left, self.right)
 
-    def __str__(self):
-        operator = self._operator
+    def _compile(self, ctx):
+        yield from self._compile_operand(ctx, self.operand)
+        ctx.write(' ' + self._operator)
         if self.symmetric:
-            operator += ' SYMMETRIC'
-        return '%s %s %s AND %s' % (
-            self._format(self.operand), operator,
-            self._format(self.left), self._format(self.right))
+            ctx.write(' SYMMETRIC')
+        ctx.write(' ')
+        yield from self._compile_operand(ctx, self.left)
+        ctx.write(' AND ')
+        yield from self._compile_operand(ctx, self.right)
 
     def __invert__(self):
         return _INVERT[self.__class__](
@@ -258,14 +304,14 @@ class Is(BinaryOperator):
     def _operands(self):
         return (self.left,)
 
-    def __str__(self):
+    def _compile(self, ctx):
+        yield from self._compile_operand(ctx, self.left)
         if self.right is None:
-            return '%s %s UNKNOWN' % (
-                self._format(self.left), self._operator)
+            ctx.write(' %s UNKNOWN' % self._operator)
         elif self.right is True:
-            return '%s %s TRUE' % (self._format(self.left), self._operator)
+            ctx.write(' %s TRUE' % self._operator)
         elif self.right is False:
-            return '%s %s FALSE' % (self._format(self.left), self._operator)
+            ctx.write(' %s FALSE' % self._operator)
 
 
 class IsNot(Is):
@@ -307,10 +353,11 @@ class FloorDiv(BinaryOperator):
 class Mod(BinaryOperator):
     __slots__ = ()
 
-    @property
-    def _operator(self):
-        # '%' must be escaped with format paramstyle
-        if Flavor.get().paramstyle == 'format':
+    _operator = '%'
+
+    def _get_operator(self, flavor):
+        # '%' must be escaped with format paramstyles
+        if flavor.paramstyle in {'format', 'pyformat'}:
             return '%%'
         else:
             return '%'
@@ -386,22 +433,11 @@ class Like(BinaryOperator):
             raise ValueError("invalid escape: %r" % escape)
         self.escape = escape
 
-    @property
-    def params(self):
-        params = super().params
-        if self.escape or Flavor().get().escape_empty:
-            params += (self.escape or '',)
-        return params
-
-    def __str__(self):
-        left, right = self._operands
-        if self.escape or Flavor().get().escape_empty:
-            return '%s %s %s ESCAPE %s' % (
-                self._format(left), self._operator, self._format(right),
-                self._format(self.escape or ''))
-        else:
-            return '%s %s %s' % (
-                self._format(left), self._operator, self._format(right))
+    def _compile(self, ctx):
+        yield from super()._compile(ctx)
+        if self.escape or ctx.flavor.escape_empty:
+            ctx.write(' ESCAPE ')
+            yield from self._compile_operand(ctx, self.escape or '')
 
     def __invert__(self):
         return _INVERT[self.__class__](self.left, self.right, self.escape)
@@ -414,18 +450,18 @@ class NotLike(Like):
 
 class ILike(Like):
     __slots__ = ()
+    _operator = 'ILIKE'
+    _like_operator = 'LIKE'
 
-    @property
-    def _operator(self):
-        if Flavor.get().ilike:
-            return 'ILIKE'
+    def _get_operator(self, flavor):
+        if flavor.ilike:
+            return self._operator
         else:
-            return 'LIKE'
+            return self._like_operator
 
-    @property
-    def _operands(self):
-        operands = super(ILike, self)._operands
-        if not Flavor.get().ilike:
+    def _get_operands(self, flavor):
+        operands = super(ILike, self)._get_operands(flavor)
+        if not flavor.ilike:
             from .functions import Upper
             operands = tuple(Upper(o) for o in operands)
         return operands
@@ -433,13 +469,8 @@ class ILike(Like):
 
 class NotILike(ILike):
     __slots__ = ()
-
-    @property
-    def _operator(self):
-        if Flavor.get().ilike:
-            return 'NOT ILIKE'
-        else:
-            return 'NOT LIKE'
+    _operator = 'NOT ILIKE'
+    _like_operator = 'NOT LIKE'
 
 # TODO SIMILAR
 
@@ -462,11 +493,13 @@ class Exists(UnaryOperator):
 class _ArrayOperator(UnaryOperator):
     __slots__ = ()
 
-    @property
-    def params(self):
-        if isinstance(self.operand, (list, tuple, array)):
-            return (list(self.operand),)
-        return super().params
+    def _compile_operand(self, ctx, operand):
+        if isinstance(operand, (list, tuple, array)):
+            ctx.write('(')
+            ctx.add_param(list(operand))
+            ctx.write(')')
+        else:
+            yield from super()._compile_operand(ctx, operand)
 
     def _format(self, operand, param=None):
         if param is None:
@@ -0,0 +1,583 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import array
+import datetime
+import math
+import struct
+import uuid
+from decimal import Decimal
+from itertools import chain, islice, repeat
+from operator import methodcaller
+
+from sql import Column, Query, Table
+
+__all__ = ['Copy']
+
+# The characters which must be quoted in the elements of arrays
+_ARRAY_SPECIALS = {'{', '}', ',', '"', '\\', ' ', '\t', '\n', '\r'}
+
+
+class Copy(Query):
+    '''
+    COPY FROM STDIN statement of PostgreSQL
+
+    >>> table = Table('t')
+    >>> copy = Copy(table, [table.c1, table.c2], format='csv')
+    >>> str(copy)
+    'COPY "t" ("c1", "c2") FROM STDIN WITH (FORMAT csv)'
+    >>> list(copy.iter_data_chunks([[1, 'foo'], [None, 'b,r']]))
+    [b'1,foo\\n,"b,r"\\n']
+
+    The binary format requires the types of the columns among bool, int2,
+    int4, int8, float4, float8, numeric, text, varchar, bytea, date,
+    timestamp, timestamptz and uuid or their arrays with the "[]" suffix.
+
+    >>> copy = Copy(table, [table.c], format='binary', types=['int2'])
+    >>> b''.join(copy.iter_data_chunks([[1]]))[19:-2]
+    b'\\x00\\x01\\x00\\x00\\x00\\x02\\x00\\x01'
+    '''
+    __slots__ = ('_table', '_columns', '_format', '_types')
+    _formats = {'text', 'csv', 'binary'}
+
+    def __init__(self, table, columns=None, format='text', types=None):
+        super(Copy, self).__init__()
+        self._table = None
+        self._columns = None
+        self._format = None
+        self._types = None
+        self.table = table
+        self.columns = columns
+        self.format = format
+        self.types = types
+
+    @property
+    def table(self):
+        return self._table
+
+    @table.setter
+    def table(self, value):
+        if not isinstance(value, Table):
+            raise ValueError("invalid table: %r" % value)
+        self._table = value
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @columns.setter
+    def columns(self, value):
+        if value is not None:
+            if any(not isinstance(col, Column) or col.table != self.table
+                    for col in value):
+                raise ValueError("invalid columns: %r" % value)
+        self._columns = value
+
+    @property
+    def format(self):
+        return self._format
+
+    @format.setter
+    def format(self, value):
+        if value not in self._formats:
+            raise ValueError("invalid format: %r" % value)
+        self._format = value
+
+    @property
+    def types(self):
+        return self._types
+
+    @types.setter
+    def types(self, value):
+        if value is not None:
+            if any(_type(t) is None for t in value):
+                raise ValueError("invalid types: %r" % value)
+        self._types = value
+
+    def _compile(self, ctx):
+        ctx.write('COPY ' + str(self.table))
+        if self.columns:
+            ctx.write(
+                ' (' + ', '.join(c.column_name for c in self.columns) + ')')
+        ctx.write(' FROM STDIN WITH (FORMAT %s)' % self.format)
+
+    def iter_data_chunks(
+            self, values, encoding='utf-8', size=1 << 16, columnar=False):
+        '''
+        Iterate over the chunks of the data of the values
+
+        The values are rows or, if columnar is set, the values of each
+        column. The chunks are bytes of about size bytes so the values are
+        consumed with a bounded memory.
+        '''
+        if self.format == 'binary':
+            if self.types is None:
+                raise ValueError("missing types")
+            width = len(self.columns) if self.columns else len(self.types)
+            if len(self.types) != width:
+                raise ValueError("invalid types: %r" % self.types)
+            encoder = _BinaryEncoder(self.types, encoding)
+            if columnar:
+                yield from encoder.iter_columns(values, size)
+            else:
+                yield from encoder.iter_rows(values, size)
+            return
+        if columnar:
+            values = zip(*values)
+        if self.format == 'csv':
+            encode = _csv_row
+        else:
+            encode = _text_row
+        width = len(self.columns) if self.columns else None
+        lines, length = [], 0
+        for row in values:
+            if width is not None and len(row) != width:
+                raise ValueError("invalid row: %r" % (row,))
+            line = encode(row)
+            lines.append(line)
+            length += len(line)
+            if length >= size:
+                yield ''.join(lines).encode(encoding)
+                lines, length = [], 0
+        if lines:
+            yield ''.join(lines).encode(encoding)
+
+    def write_data_to(
+            self, fp, values, encoding='utf-8', size=1 << 16,
+            columnar=False):
+        "Write the data of the values into the file-like fp by chunks"
+        for chunk in self.iter_data_chunks(values, encoding, size, columnar):
+            fp.write(chunk)
+
+
+def _float(value):
+    "Return the representation of the float for PostgreSQL"
+    if math.isfinite(value):
+        return repr(value)
+    elif math.isnan(value):
+        return 'NaN'
+    elif value > 0:
+        return 'Infinity'
+    else:
+        return '-Infinity'
+
+
+def _interval(value):
+    "Return the representation of the timedelta for PostgreSQL"
+    return '%d days %d seconds %d microseconds' % (
+        value.days, value.seconds, value.microseconds)
+
+
+def _array(value):
+    "Return the representation of the sequence as array"
+    elements = []
+    for element in value:
+        if element is None:
+            elements.append('NULL')
+            continue
+        elif isinstance(element, (list, tuple)):
+            elements.append(_array(element))
+            continue
+        element = _string(element)
+        if (not element or element.upper() == 'NULL'
+                or not _ARRAY_SPECIALS.isdisjoint(element)):
+            element = '"%s"' % element.replace(
+                '\\', '\\\\').replace('"', '\\"')
+        elements.append(element)
+    return '{' + ','.join(elements) + '}'
+
+
+def _bytea(value):
+    "Return the hexadecimal representation of the binary"
+    return '\\x' + bytes(value).hex()
+
+
+# The subclasses use the converter of their first base class
+_CONVERTERS = {
+    str: str.__str__,
+    bool: lambda v: 't' if v else 'f',
+    int: int.__repr__,
+    float: _float,
+    Decimal: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: _interval,
+    uuid.UUID: str,
+    bytes: _bytea,
+    bytearray: _bytea,
+    memoryview: _bytea,
+    }
+
+
+def _string(value):
+    "Return the representation of the not NULL value"
+    cls = value.__class__
+    if cls is str:
+        return value
+    converter = _CONVERTERS.get(cls)
+    if converter is not None:
+        return converter(value)
+    if isinstance(value, (list, tuple)):
+        return _array(value)
+    for type_, converter in _CONVERTERS.items():
+        if isinstance(value, type_):
+            return converter(value)
+    raise ValueError("unsupported value: %r" % (value,))
+
+
+def _text_value(value):
+    "Return the field of the value in the text format"
+    if value is None:
+        return '\\N'
+    value = _string(value)
+    # Testing is faster than translating
+    if '\\' in value or '\t' in value or '\n' in value or '\r' in value:
+        value = (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+    return value
+
+
+def _text_row(row):
+    "Return the line of the row in the text format"
+    return '\t'.join(map(_text_value, row)) + '\n'
+
+
+def _csv_value(value):
+    "Return the field of the value in the CSV format"
+    if value is None:
+        return ''
+    value = _string(value)
+    if (not value or value == '\\.' or ',' in value or '"' in value
+            or '\n' in value or '\r' in value):
+        value = '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _csv_row(row):
+    "Return the line of the row in the CSV format"
+    return ','.join(map(_csv_value, row)) + '\n'
+
+
+# The binary format
+
+_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+# The signature followed by the flags and the length of the extension
+_HEADER = _SIGNATURE + struct.pack('>ii', 0, 0)
+_TRAILER = struct.pack('>h', -1)
+_NULL = struct.pack('>i', -1)
+_LENGTH = struct.Struct('>i')
+_EPOCH_DATE = datetime.date(2000, 1, 1)
+_EPOCH = datetime.datetime(2000, 1, 1)
+_EPOCH_TZ = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+# The numeric special values
+_NUMERIC_NAN = 0xC000
+_NUMERIC_POSITIVE_INFINITY = 0xD000
+_NUMERIC_NEGATIVE_INFINITY = 0xF000
+_NUMERIC_NEGATIVE = 0x4000
+
+
+def _days(value):
+    "Return the number of days of the date since the epoch of PostgreSQL"
+    return (value - _EPOCH_DATE).days
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _timestamp(value):
+    "Return the microseconds of the timestamp since the epoch of PostgreSQL"
+    if value.utcoffset() is not None:
+        raise ValueError("aware timestamp: %r" % value)
+    return _microseconds(value - _EPOCH)
+
+
+def _timestamptz(value):
+    "Return the microseconds of the aware timestamp since the epoch"
+    if value.utcoffset() is None:
+        raise ValueError("naive timestamp with time zone: %r" % value)
+    return _microseconds(value - _EPOCH_TZ)
+
+
+def _numeric(value):
+    "Return the binary numeric of the Decimal"
+    if not isinstance(value, Decimal):
+        value = Decimal(repr(value) if isinstance(value, float) else value)
+    if value.is_nan():
+        return struct.pack('>hhHh', 0, 0, _NUMERIC_NAN, 0)
+    elif value.is_infinite():
+        sign = (_NUMERIC_NEGATIVE_INFINITY if value.is_signed()
+            else _NUMERIC_POSITIVE_INFINITY)
+        return struct.pack('>hhHh', 0, 0, sign, 0)
+    sign, digits, exponent = value.as_tuple()
+    digits = ''.join(map(str, digits))
+    if exponent >= 0:
+        integer, fraction = digits + '0' * exponent, ''
+    else:
+        digits = digits.rjust(-exponent, '0')
+        integer, fraction = digits[:exponent], digits[exponent:]
+    scale = len(fraction)
+    # The digits are in base 10000 aligned on the decimal point
+    integer = integer.rjust(-(-len(integer) // 4) * 4, '0')
+    fraction = fraction.ljust(-(-len(fraction) // 4) * 4, '0')
+    groups = [int(integer[i:i + 4]) for i in range(0, len(integer), 4)]
+    weight = len(groups) - 1
+    groups += [int(fraction[i:i + 4]) for i in range(0, len(fraction), 4)]
+    while groups and not groups[0]:
+        groups.pop(0)
+        weight -= 1
+    while groups and not groups[-1]:
+        groups.pop()
+    if not groups:
+        weight = 0
+    return struct.pack('>hhHh%ih' % len(groups), len(groups), weight,
+        _NUMERIC_NEGATIVE if sign and groups else 0, scale, *groups)
+
+
+def _bool(value):
+    "Return the value if it is a bool or 0 or 1"
+    if value is True or value is False:
+        return value
+    elif type(value) is int and value in {0, 1}:
+        return bool(value)
+    raise ValueError("invalid bool value: %r" % (value,))
+
+
+def _bools(values):
+    "Test if the values are all bool or 0 or 1"
+    return (set(map(type, values)) <= {bool, int}
+        and set(values) <= {0, 1})
+
+
+# The fixed size types with their OID and format
+_FIXED = {
+    'bool': (16, '?'),
+    'int2': (21, 'h'),
+    'int4': (23, 'i'),
+    'int8': (20, 'q'),
+    'float4': (700, 'f'),
+    'float8': (701, 'd'),
+    'date': (1082, 'i'),
+    'timestamp': (1114, 'q'),
+    'timestamptz': (1184, 'q'),
+    }
+# The conversions of the values of the fixed size types before packing
+_CONVERSIONS = {
+    'date': _days,
+    'timestamp': _timestamp,
+    'timestamptz': _timestamptz,
+    }
+# The checks of the values of the fixed size types packed without conversion
+# as the bool format packs the truth of any value
+_CHECKS = {
+    'bool': _bool,
+    }
+# The variable size types with their OID and the function returning the
+# data of the value or None for the encoded text
+_VARIABLE = {
+    'numeric': (1700, _numeric),
+    'text': (25, None),
+    'varchar': (1043, None),
+    'bytea': (17, lambda v: memoryview(v).tobytes()),
+    'uuid': (2950, lambda v: v.bytes),
+    }
+
+
+def _type(name):
+    "Return the base type and if it is an array or None if not supported"
+    base = name[:-2] if name.endswith('[]') else name
+    if base in _FIXED or base in _VARIABLE:
+        return base, base != name
+
+
+def _fixed(base):
+    "Return the function encoding a field of the fixed size type"
+    _, format_ = _FIXED[base]
+    field = struct.Struct('>i' + format_)
+    size = field.size - _LENGTH.size
+    conversion = _CONVERSIONS.get(base, _CHECKS.get(base))
+    if conversion is None:
+        return lambda v: field.pack(size, v)
+    return lambda v: field.pack(size, conversion(v))
+
+
+def _variable(base, encoding):
+    "Return the function encoding a field of the variable size type"
+    _, data = _VARIABLE[base]
+    if data is None:
+        data = methodcaller('encode', encoding)
+    pack = _LENGTH.pack
+
+    def encode(value):
+        value = data(value)
+        return pack(len(value)) + value
+    return encode
+
+
+def _dimensions(value):
+    "Return the dimensions of the nested sequences of value"
+    dimensions = []
+    while isinstance(value, (list, tuple, array.array)):
+        dimensions.append(len(value))
+        if not value:
+            return []
+        value = value[0]
+    return dimensions
+
+
+def _array_field(base, element):
+    "Return the function encoding a field of the array of the base type"
+    oid = (_FIXED.get(base) or _VARIABLE[base])[0]
+    fixed = base in _FIXED and base not in _CONVERSIONS
+    if fixed:
+        format_ = 'i' + _FIXED[base][1]
+        size = struct.calcsize('>' + _FIXED[base][1])
+    pack = _LENGTH.pack
+
+    def encode(value):
+        dimensions = _dimensions(value)
+        items = value if dimensions else []
+        for dimension in dimensions[1:]:
+            # Each sub-sequence must have the length of its level
+            if any(not isinstance(i, (list, tuple, array.array))
+                    or len(i) != dimension for i in items):
+                raise ValueError("invalid array: %r" % (value,))
+            items = list(chain.from_iterable(items))
+        has_null = not isinstance(items, array.array) and None in items
+        data = [struct.pack('>iii', len(dimensions), has_null, oid)]
+        data.extend(struct.pack('>ii', d, 1) for d in dimensions)
+        if (fixed and not has_null
+                and (base not in _CHECKS or _bools(items))):
+            # Pack all the elements at once
+            data.append(struct.pack('>' + format_ * len(items),
+                    *chain.from_iterable(zip(repeat(size), items))))
+        else:
+            data.extend(
+                _NULL if i is None else element(i) for i in items)
+        data = b''.join(data)
+        return pack(len(data)) + data
+    return encode
+
+
+class _BinaryEncoder(object):
+    '''
+    Encode the rows in the binary format of COPY for the types
+
+    When all the types have a fixed size without conversion, the rows of a
+    chunk are packed at once.
+    '''
+    __slots__ = (
+        '_types', '_fields', '_count', '_sizes', '_format', '_bools')
+
+    def __init__(self, types, encoding):
+        self._types = list(types)
+        self._fields = []
+        formats, sizes, self._bools = [], [], []
+        for i, name in enumerate(types):
+            base, is_array = _type(name)
+            if base in _FIXED:
+                field = _fixed(base)
+            else:
+                field = _variable(base, encoding)
+            if is_array:
+                field = _array_field(base, field)
+            self._fields.append(field)
+            if not is_array and base in _FIXED and base not in _CONVERSIONS:
+                format_ = _FIXED[base][1]
+                formats.append('i' + format_)
+                sizes.append(struct.calcsize('>' + format_))
+                if base in _CHECKS:
+                    self._bools.append(i)
+        self._count = struct.pack('>h', len(types))
+        if len(formats) == len(types):
+            self._format = 'h' + ''.join(formats)
+            self._sizes = sizes
+        else:
+            self._format = self._sizes = None
+
+    def encode(self, row):
+        "Return the tuple of the row"
+        if len(row) != len(self._fields):
+            raise ValueError("invalid row: %r" % (row,))
+        data = [self._count]
+        for name, field, value in zip(self._types, self._fields, row):
+            if value is None:
+                data.append(_NULL)
+                continue
+            try:
+                data.append(field(value))
+            except (struct.error, TypeError, AttributeError,
+                    ArithmeticError) as exception:
+                # The value does not fit the type like a str for a uuid
+                raise ValueError(
+                    "invalid %s value: %r" % (name, value)) from exception
+        return b''.join(data)
+
+    def pack(self, columns, count):
+        "Return the tuples of the count rows of the columns or None"
+        # The bool format packs NULL and the other values by their truth
+        if not all(_bools(columns[i]) for i in self._bools):
+            return None
+        values = [repeat(len(self._sizes), count)]
+        for size, column in zip(self._sizes, columns):
+            values.append(repeat(size, count))
+            values.append(column)
+        try:
+            return struct.pack('>' + self._format * count,
+                *chain.from_iterable(zip(*values)))
+        except struct.error:
+            # The columns contain NULL or invalid values
+            return None
+
+    def chunk_count(self, size):
+        "Return the number of rows per chunk of about size bytes"
+        return max(size // struct.calcsize('>' + self._format), 1)
+
+    def iter_rows(self, rows, size):
+        "Iterate over the chunks of the data of the rows"
+        yield _HEADER
+        if self._format is not None:
+            rows, count, width = iter(rows), self.chunk_count(size), len(
+                self._fields)
+            while True:
+                chunk = list(islice(rows, count))
+                if not chunk:
+                    break
+                data = None
+                if set(map(len, chunk)) == {width}:
+                    data = self.pack(list(zip(*chunk)), len(chunk))
+                if data is None:
+                    data = b''.join(map(self.encode, chunk))
+                yield data
+        else:
+            buffer = bytearray()
+            encode = self.encode
+            for row in rows:
+                buffer += encode(row)
+                if len(buffer) >= size:
+                    yield bytes(buffer)
+                    buffer.clear()
+            if buffer:
+                yield bytes(buffer)
+        yield _TRAILER
+
+    def iter_columns(self, columns, size):
+        "Iterate over the chunks of the data of the columns"
+        if len(columns) != len(self._fields):
+            raise ValueError("invalid columns")
+        if (self._format is None
+                or not all(isinstance(c, array.array) for c in columns)):
+            yield from self.iter_rows(zip(*columns), size)
+            return
+        length = len(columns[0]) if columns else 0
+        if any(len(c) != length for c in columns):
+            raise ValueError("invalid columns")
+        count = self.chunk_count(size)
+        yield _HEADER
+        for start in range(0, length, count):
+            stop = min(start + count, length)
+            data = self.pack([c[start:stop] for c in columns], stop - start)
+            if data is None:
+                raise ValueError("invalid columns")
+            yield data
+        yield _TRAILER
@@ -1,5 +1,7 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import asyncio
+import sys
 import threading
 import unittest
 
@@ -62,6 +64,21 @@ class TestAliasManager(unittest.TestCase):
         if not self.succeed1.is_set() or not self.succeed2.is_set():
             self.fail()
 
+    @unittest.skipIf(sys.version_info < (3, 7), "requires contextvars")
+    def test_tasks(self):
+        async def func(first, second):
+            with AliasManager():
+                a1 = AliasManager.get(first)
+                await asyncio.sleep(0)
+                a2 = AliasManager.get(second)
+                return a1, a2
+
+        async def main():
+            return await asyncio.gather(
+                func(self.t1, self.t2), func(self.t2, self.t1))
+
+        self.assertEqual(asyncio.run(main()), [('a', 'b'), ('a', 'b')])
+
     def test_contains(self):
         with AliasManager():
             AliasManager.get(self.t1)
@@ -76,3 +93,27 @@ class TestAliasManager(unittest.TestCase):
         with AliasManager():
             AliasManager.set(self.t1, 'foo')
             self.assertEqual(AliasManager.get(self.t1), 'foo')
+
+    def test_local(self):
+        self.assertIsNone(AliasManager.local.alias)
+        with AliasManager():
+            AliasManager.get(self.t1)
+            self.assertIn(id(self.t1), AliasManager.local.alias)
+            self.assertEqual(AliasManager.local.nested, 1)
+        self.assertIsNone(AliasManager.local.alias)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "requires contextvars")
+    def test_copied_context(self):
+        import contextvars
+
+        def func():
+            with AliasManager():
+                return AliasManager.get(self.t2), AliasManager.get(self.t1)
+
+        with AliasManager():
+            a1 = AliasManager.get(self.t1)
+            context = contextvars.copy_context()
+            self.assertEqual(context.run(func), ('a', 'b'))
+            self.assertEqual(AliasManager.get(self.t1), a1)
+            self.assertFalse(AliasManager.contains(self.t2))
+            self.assertEqual(AliasManager.local.nested, 1)
@@ -0,0 +1,181 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+
+from sql import AliasManager, Flavor, Literal, Null, Table, Window, compile
+from sql.aggregate import Min
+from sql.cache import StatementCache
+
+
+class TestStatementCache(unittest.TestCase):
+    table = Table('t')
+
+    def setUp(self):
+        self.cache = StatementCache()
+
+    def select(self, value, limit=None):
+        return self.table.select(self.table.c,
+            where=(self.table.c == value) & (self.table.d > 1),
+            limit=limit)
+
+    def assertCompile(self, query, flavor=None):
+        self.assertEqual(
+            self.cache.compile(query, flavor), compile(query, flavor))
+
+    def test_hit(self):
+        self.assertCompile(self.select('foo'))
+        self.assertCompile(self.select('bar'))
+
+        self.assertEqual(self.cache.compile(self.select('baz')),
+            ('SELECT "a"."c" FROM "t" AS "a" '
+                'WHERE ("a"."c" = %s) AND ("a"."d" > %s)', ('baz', 1)))
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_structure(self):
+        table = Table('u')
+        self.assertCompile(self.select('foo'))
+        self.assertCompile(table.select(table.c,
+                where=(table.c == 'foo') & (table.d > 1)))
+        self.assertCompile(self.select(Null))
+        self.assertCompile(self.select(self.table.e))
+        self.assertCompile(self.select('foo', limit=10))
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.misses, 5)
+
+    def test_flavor(self):
+        self.assertCompile(self.select('foo'))
+        self.assertCompile(self.select('foo'), Flavor(paramstyle='qmark'))
+        self.assertCompile(self.select('foo'), Flavor(paramstyle='qmark'))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_eviction(self):
+        self.cache.maxsize = 2
+        for name in ['t1', 't2', 't3']:
+            table = Table(name)
+            self.assertCompile(table.select())
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 2)
+
+    def test_maxsize_invalid(self):
+        with self.assertRaises(ValueError):
+            StatementCache(maxsize=-1)
+
+    def test_clear(self):
+        self.cache.compile(self.select('foo'))
+        self.cache.compile(self.select('foo'))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.misses, 0)
+
+    def test_ambiguous(self):
+        "Test parameters with identical values are not cached"
+        def query(*values):
+            return self.table.select(where=self.table.c.in_(values))
+        self.assertCompile(query(1, 1))
+        self.assertCompile(query(1, 2))
+        self.assertCompile(query(3, 4))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_derived(self):
+        "Test parameters not found in the query are not cached"
+        def query(start):
+            return self.table.select(Min(self.table.c,
+                    window=Window([], frame='ROWS', start=start)))
+        self.assertCompile(query(-1))
+        self.assertCompile(query(-2))
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_ordinal(self):
+        def query(value):
+            return self.table.select(
+                (self.table.c + value).as_('x'),
+                order_by=(self.table.c + 1).as_('x'))
+        self.assertCompile(query(1))
+        with self.assertRaises(ValueError):
+            self.cache.compile(query(2))
+
+    def test_literal(self):
+        self.assertCompile(self.table.select(where=Literal(True)),
+            Flavor(no_boolean=True))
+        self.assertCompile(self.table.select(where=Literal(False)),
+            Flavor(no_boolean=True))
+
+    def test_alias_manager(self):
+        query = self.select('foo')
+        with AliasManager():
+            AliasManager.get(Table('u'))
+            self.assertCompile(query)
+        self.assertEqual(self.cache.misses, 0)
+
+    def test_specialize(self):
+        cache = StatementCache(specialize=1)
+        query = self.select('foo')
+        self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.specialized, [(compile(query)[0], 0)])
+
+        for query in [self.select('bar'), self.select(Null),
+                self.select('foo', limit=10), self.select('')]:
+            self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.specialized, [(compile(query)[0], 1)])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 4)
+
+    def test_specialize_structure(self):
+        cache = StatementCache(specialize=2)
+        for name in ['t1', 't2', 't2']:
+            query = Table(name).select()
+            self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(
+            [h for _, h in cache.specialized], [0, 1])
+
+    def test_specialize_shared(self):
+        cache = StatementCache(specialize=1)
+        table1, table2 = Table('t'), Table('t')
+        query = table1.join(table2).select()
+        self.assertEqual(cache.compile(query), compile(query))
+        query = table1.join(table1).select()
+        self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.specialized[0][1], 0)
+
+    def test_specialize_invalid(self):
+        with self.assertRaises(ValueError):
+            StatementCache(specialize=-1)
+
+    def test_named(self):
+        cache = StatementCache(specialize=1)
+        flavor = Flavor(paramstyle='named')
+        for value in ['foo', 'bar', 'baz']:
+            query = self.select(value)
+            self.assertEqual(
+                cache.compile(query, flavor), compile(query, flavor))
+        self.assertEqual(cache.hits, 2)
+
+    def test_deduplicate(self):
+        flavor = Flavor(paramstyle='numeric', deduplicate=True)
+        for value in [1, 2]:
+            self.assertCompile(self.select(value), flavor)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_encoding(self):
+        cache = StatementCache(specialize=1)
+        sql, params = cache.compile(self.select('foo'), encoding='utf-8')
+        self.assertEqual(
+            (sql, params), compile(self.select('foo'), encoding='utf-8'))
+        sql1, params = cache.compile(self.select('bar'), encoding='utf-8')
+        sql2, _ = cache.compile(self.select('baz'), encoding='utf-8')
+        self.assertEqual(sql1, sql)
+        self.assertIs(sql2, sql1)
+        self.assertEqual(params, ('bar', 1))
+
+    def test_deep(self):
+        cache = StatementCache(specialize=1)
+        for value in ['foo', 'bar']:
+            where = self.table.c == value
+            for i in range(2000):
+                where = (where & (self.table.d == i)) | (self.table.e == i)
+            query = self.table.select(where=where)
+            self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.hits, 1)
@@ -37,6 +37,24 @@ class TestUnion(unittest.TestCase):
             'SELECT * FROM "t1" AS "c" UNION SELECT * FROM "t2" AS "d"')
         self.assertEqual(tuple(query.params), (1,))
 
+    def test_union_deep(self):
+        query = self.q1
+        for _ in range(5000):
+            query = query | self.q2
+        self.assertEqual(str(query),
+            'SELECT * FROM "t1" AS "a" '
+            + ''.join('UNION SELECT * FROM "t2" AS "b" ' * 5000)[:-1])
+
+    def test_union_derive(self):
+        query = self.q1 | self.q2
+        derived = query.with_limit(10)
+        self.assertEqual(str(derived),
+            'SELECT * FROM "t1" AS "a" UNION SELECT * FROM "t2" AS "b" '
+            'LIMIT %s')
+        self.assertEqual(derived.params, (10,))
+        self.assertIs(derived.queries, query.queries)
+        self.assertIsNone(query.limit)
+
     def test_union3(self):
         query = Union(self.q1, self.q2, self.q3)
         self.assertEqual(str(query),
@@ -0,0 +1,358 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import io
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from sql import (
+    Compiler, Expression, Flavor, Literal, Param, Table, Template, compile,
+    compile_multi, compile_parallel)
+from sql.frozen import freeze
+from sql.functions import Function
+from sql.operators import And, Between
+
+
+class TestCompile(unittest.TestCase):
+    table = Table('t')
+
+    def test_compile(self):
+        query = self.table.select(self.table.c, where=self.table.c == 'foo')
+        self.assertEqual(compile(query),
+            ('SELECT "a"."c" FROM "t" AS "a" WHERE "a"."c" = %s', ('foo',)))
+
+    def test_compile_iter(self):
+        query = self.table.select(where=self.table.c == 'foo')
+        self.assertEqual(compile(query), tuple(query))
+
+    def test_compile_flavor(self):
+        query = self.table.select(where=self.table.c == Literal(True))
+        self.assertEqual(
+            compile(query, Flavor(paramstyle='qmark', no_boolean=True)),
+            ('SELECT * FROM "t" AS "a" WHERE "a"."c" = (1 = 1)', ()))
+        self.assertEqual(Flavor.get().paramstyle, 'format')
+
+    def test_compile_flavor_restored(self):
+        flavor = Flavor()
+        Flavor.set(flavor)
+        try:
+            with self.assertRaises(NotImplementedError):
+                compile(Expression(), Flavor(paramstyle='qmark'))
+            self.assertIs(Flavor.get(), flavor)
+        finally:
+            Flavor.set(Flavor())
+
+    def test_compile_expression(self):
+        self.assertEqual(
+            compile(self.table.c + 1), ('"c" + %s', (1,)))
+
+    def test_compiler(self):
+        ctx = Compiler(Flavor(paramstyle='qmark'))
+        ctx.compile(self.table.c == 1)
+        ctx.write(' AND ')
+        ctx.add_param(2)
+        self.assertEqual(ctx.sql, '"c" = ? AND ?')
+        self.assertEqual(ctx.params, (1, 2))
+
+    def test_compiler_capture(self):
+        ctx = Compiler()
+        ctx.write('A')
+        with ctx.capture() as fragment:
+            ctx.add_param(1)
+        ctx.write('B')
+        ctx.extend(fragment)
+        self.assertEqual(ctx.sql, 'AB%s')
+        self.assertEqual(ctx.params, (1,))
+
+    def test_compiler_render(self):
+        ctx = Compiler()
+        self.assertEqual(ctx.render(self.table.c == 1), ('"c" = %s', (1,)))
+        self.assertEqual((ctx.sql, ctx.params), ('', ()))
+
+    def test_legacy_expression(self):
+        class Legacy(Expression):
+            def __str__(self):
+                return 'LEGACY(%s)' % Flavor.get().param
+
+            @property
+            def params(self):
+                return ('foo',)
+
+        query = self.table.select(where=self.table.c == Legacy())
+        self.assertEqual(
+            compile(query, Flavor(paramstyle='qmark')),
+            ('SELECT * FROM "t" AS "a" WHERE "a"."c" = LEGACY(?)', ('foo',)))
+
+    def test_legacy_str(self):
+        class Legacy(Function):
+            _function = 'LEGACY'
+
+            def __str__(self):
+                return 'LEGACY ' + super().__str__()
+
+        self.assertEqual(
+            compile(Legacy(1)), ('LEGACY LEGACY(%s)', (1,)))
+
+    def test_legacy_format_operator(self):
+        class Legacy(Between):
+            def _format(self, operand, param=None):
+                return 'LOWER(%s)' % super()._format(operand, param=param)
+
+        expression = Legacy(self.table.c, 'a', 'z')
+        self.assertEqual(compile(expression, Flavor(paramstyle='numeric')), (
+                'LOWER("c") BETWEEN LOWER(:1) AND LOWER(:2)', ('a', 'z')))
+
+    def test_legacy_format_function(self):
+        class Legacy(Function):
+            _function = 'LEGACY'
+
+            @staticmethod
+            def _format(value):
+                return 'CAST(%s AS TEXT)' % Function._format(value)
+
+        self.assertEqual(
+            compile(Legacy(self.table.c, 1), Flavor(paramstyle='qmark')),
+            ('LEGACY(CAST("c" AS TEXT), CAST(? AS TEXT))', (1,)))
+
+    def test_legacy_format_call(self):
+        class Legacy(Between):
+            def __str__(self):
+                return 'LEGACY(%s)' % self._format(self.operand)
+
+            @property
+            def params(self):
+                return (self.operand,)
+
+        self.assertEqual(compile(Legacy(1, 2, 3)), ('LEGACY(%s)', (1,)))
+
+    def test_union_limit_params(self):
+        query = self.table.select() | self.table.select()
+        query.limit = 10
+        query.offset = 20
+        self.assertEqual(compile(query), (
+                'SELECT * FROM "t" AS "a" UNION SELECT * FROM "t" AS "a" '
+                'LIMIT %s OFFSET %s', (10, 20)))
+
+    def test_paramstyle_numbered(self):
+        table = Table('u')
+        query = self.table.join(table.select(where=table.d == 'foo'),
+            condition=self.table.c == 1).select(
+            where=self.table.c == 2, limit=3)
+        for paramstyle, marker in [('numeric', ':'), ('dollar', '$')]:
+            self.assertEqual(
+                compile(query, Flavor(paramstyle=paramstyle)), (
+                    'SELECT * FROM "t" AS "a" INNER JOIN '
+                    '(SELECT * FROM "u" AS "c" WHERE "c"."d" = {0}1) AS "b" '
+                    'ON "a"."c" = {0}2 WHERE "a"."c" = {0}3 LIMIT {0}4'
+                    .format(marker), ('foo', 1, 2, 3)))
+
+    def test_paramstyle_named(self):
+        query = self.table.select(
+            where=(self.table.c == 1) & (self.table.d == Param('d')))
+        self.assertEqual(compile(query, Flavor(paramstyle='named')), (
+                'SELECT * FROM "t" AS "a" '
+                'WHERE ("a"."c" = :p1) AND ("a"."d" = :d)',
+                {'p1': 1, 'd': Param('d')}))
+        self.assertEqual(compile(query, Flavor(paramstyle='pyformat')), (
+                'SELECT * FROM "t" AS "a" '
+                'WHERE ("a"."c" = %(p1)s) AND ("a"."d" = %(d)s)',
+                {'p1': 1, 'd': Param('d')}))
+
+    def test_paramstyle_named_collision(self):
+        query = self.table.select(
+            where=(self.table.c == 5) & (self.table.d == Param('p1')))
+        for flavor, marker in [
+                (Flavor(paramstyle='named'), ':{}'),
+                (Flavor(paramstyle='pyformat'), '%({})s')]:
+            with self.subTest(paramstyle=flavor.paramstyle):
+                sql = ('SELECT * FROM "t" AS "a" '
+                    'WHERE ("a"."c" = {}) AND ("a"."d" = {})'.format(
+                        marker.format('p1_'), marker.format('p1')))
+                self.assertEqual(compile(query, flavor),
+                    (sql, {'p1_': 5, 'p1': Param('p1')}))
+                self.assertEqual(
+                    Template(query, flavor).bind(p1=9), {'p1_': 5, 'p1': 9})
+                fp = io.StringIO()
+                self.assertEqual(query.write_to(fp, flavor),
+                    {'p1_': 5, 'p1': Param('p1')})
+                self.assertEqual(fp.getvalue(), sql)
+
+    def test_paramstyle_named_collision_chunks(self):
+        query = self.table.select(where=And(
+                [self.table.c == i for i in range(1000)]
+                + [self.table.d == Param('p1')]))
+        with self.assertRaises(ValueError):
+            query.write_to(io.StringIO(), Flavor(paramstyle='named'))
+
+    def test_paramstyle_mod(self):
+        expression = (self.table.c % 2) == 0
+        self.assertEqual(compile(expression, Flavor(paramstyle='numeric')),
+            ('("c" % :1) = :2', (2, 0)))
+        self.assertEqual(compile(expression, Flavor(paramstyle='pyformat')),
+            ('("c" %% %(p1)s) = %(p2)s', {'p1': 2, 'p2': 0}))
+
+    def test_paramstyle_render(self):
+        ctx = Compiler(Flavor(paramstyle='dollar'))
+        ctx.add_param('foo')
+        self.assertEqual(ctx.render(self.table.c == 1), ('"c" = $1', (1,)))
+        self.assertEqual((ctx.sql, ctx.params), ('$1', ('foo',)))
+
+    def test_legacy_numbered(self):
+        class Legacy(Expression):
+            def __str__(self):
+                return 'LEGACY(%s, %s) %% 2' % ((Flavor.get().param,) * 2)
+
+            @property
+            def params(self):
+                return ('foo', 'bar')
+
+        query = self.table.select(
+            where=(self.table.c == 1) & (self.table.d == Legacy()))
+        self.assertEqual(compile(query, Flavor(paramstyle='numeric')), (
+                'SELECT * FROM "t" AS "a" WHERE ("a"."c" = :1) '
+                'AND ("a"."d" = LEGACY(:2, :3) % 2)', (1, 'foo', 'bar')))
+
+    def test_deduplicate(self):
+        date = datetime.date(2020, 1, 1)
+        value = object()
+        query = self.table.select(where=(
+                Between(self.table.c, date, datetime.date(2020, 1, 31))
+                & Between(self.table.d, datetime.date(2020, 1, 1), date)
+                & (self.table.e == 1) & (self.table.f == True)  # noqa: E712
+                & (self.table.g == value) & (self.table.h == value)))
+        self.assertEqual(
+            compile(query, Flavor(paramstyle='dollar', deduplicate=True)), (
+                'SELECT * FROM "t" AS "a" WHERE ('
+                '"a"."c" BETWEEN $1 AND $2) AND ("a"."d" BETWEEN $1 AND $1) '
+                'AND ("a"."e" = $3) AND ("a"."f" = $4) '
+                'AND ("a"."g" = $5) AND ("a"."h" = $5)',
+                (date, datetime.date(2020, 1, 31), 1, True, value)))
+
+    def test_deduplicate_named(self):
+        query = self.table.select(where=(self.table.c == 'foo')
+            & (self.table.d == 'bar') & (self.table.e == 'foo'))
+        self.assertEqual(
+            compile(query, Flavor(paramstyle='named', deduplicate=True)), (
+                'SELECT * FROM "t" AS "a" WHERE ("a"."c" = :p1) '
+                'AND ("a"."d" = :p2) AND ("a"."e" = :p1)',
+                {'p1': 'foo', 'p2': 'bar'}))
+
+    def test_deduplicate_format(self):
+        query = self.table.select(where=(self.table.c == 'foo')
+            & (self.table.d == 'foo'))
+        self.assertEqual(compile(query, Flavor(deduplicate=True)), (
+                'SELECT * FROM "t" AS "a" '
+                'WHERE ("a"."c" = %s) AND ("a"."d" = %s)', ('foo', 'foo')))
+
+    def test_compile_encoding(self):
+        table = Table('tablé')
+        query = table.select(where=table.c == 'é')
+        self.assertEqual(
+            compile(query, Flavor(paramstyle='dollar'), encoding='utf-8'),
+            ('SELECT * FROM "tablé" AS "a" WHERE "a"."c" = $1'
+                .encode('utf-8'), ('é',)))
+
+    def test_compile_multi(self):
+        flavors = [Flavor.postgresql(), Flavor.sqlite(), Flavor.mysql(),
+            Flavor.oracle(), Flavor.mssql(), Flavor(paramstyle='named'),
+            Flavor(paramstyle='pyformat'),
+            Flavor(paramstyle='dollar', deduplicate=True)]
+        for query in [
+                self.table.select(self.table.c,
+                    where=(self.table.c == Literal(True))
+                    & self.table.d.ilike('foo')
+                    & (self.table.e == 'foo'),
+                    order_by=[self.table.c.asc.nulls_first],
+                    limit=10, offset=20),
+                self.table.select(where=(self.table.c % 2) == 0),
+                self.table.insert([self.table.c], [[1], [2]]),
+                ]:
+            self.assertEqual(compile_multi(query, flavors),
+                [compile(query, f) for f in flavors])
+
+    def test_compile_multi_shared(self):
+        query = self.table.select(where=self.table.c == 1)
+        flavors = [Flavor.postgresql(), Flavor.sqlite(), Flavor.mysql(),
+            Flavor(paramstyle='numeric')]
+        compiled = []
+
+        class Counter(Expression):
+            def _compile(self, ctx):
+                compiled.append(ctx.flavor)
+                ctx.write('x')
+
+        query.columns = [Counter()]
+        self.assertEqual(compile_multi(query, flavors), [
+                ('SELECT x FROM "t" AS "a" WHERE "a"."c" = %s', (1,)),
+                ('SELECT x FROM "t" AS "a" WHERE "a"."c" = ?', (1,)),
+                ('SELECT x FROM "t" AS "a" WHERE "a"."c" = %s', (1,)),
+                ('SELECT x FROM "t" AS "a" WHERE "a"."c" = :1', (1,)),
+                ])
+        self.assertEqual(len(compiled), 1)
+
+    def test_compile_multi_legacy(self):
+        class Legacy(Expression):
+            def __str__(self):
+                return 'LEGACY(%s)' % Flavor.get().param
+
+            @property
+            def params(self):
+                return ('foo',)
+
+        query = self.table.select(where=self.table.d == Legacy())
+        flavors = [Flavor(), Flavor(paramstyle='qmark'),
+            Flavor(paramstyle='numeric')]
+        self.assertEqual(compile_multi(query, flavors),
+            [compile(query, f) for f in flavors])
+
+    def test_compile_multi_encoding(self):
+        query = self.table.select(where=self.table.c == 'foo')
+        self.assertEqual(
+            compile_multi(query, [Flavor.sqlite()], encoding='utf-8'),
+            [compile(query, Flavor.sqlite(), encoding='utf-8')])
+
+    def test_compile_parallel(self):
+        queries = []
+        for i in range(20):
+            queries.append(self.table.insert(
+                    [self.table.c, self.table.d], [[i, 'foo'], [i, 'bar']]))
+            queries.append(self.table.update(
+                    [self.table.d], ['foo'], where=self.table.c == i))
+            queries.append(self.table.select(
+                    where=freeze(self.table.c == i), limit=i))
+        for flavor in [None, Flavor.sqlite(), Flavor(paramstyle='named')]:
+            self.assertEqual(
+                list(compile_parallel(
+                        iter(queries), workers=2, flavor=flavor, chunksize=7)),
+                [compile(q, flavor) for q in queries])
+
+    def test_compile_parallel_context(self):
+        query = self.table.select(where=self.table.c == 1)
+        with Flavor.use(Flavor.sqlite()):
+            self.assertEqual(
+                list(compile_parallel([query], workers=1, encoding='utf-8')),
+                [compile(query, Flavor.sqlite(), encoding='utf-8')])
+        self.assertEqual(list(compile_parallel([], workers=1)), [])
+
+    def test_compile_parallel_invalid(self):
+        for kwargs in [{'workers': 0}, {'chunksize': 0}]:
+            with self.assertRaises(ValueError):
+                next(compile_parallel([self.table.select()], **kwargs))
+
+    def test_compile_threads(self):
+        table = Table('u')
+        query = self.table.join(table,
+            condition=self.table.c == table.c).select(
+            where=self.table.d.ilike('foo'), limit=10, offset=20)
+        flavors = [Flavor.postgresql(), Flavor.sqlite(), Flavor.oracle(),
+            Flavor.mssql()] * 25
+        expected = [compile(query, f) for f in flavors]
+
+        def compile_(flavor):
+            with Flavor.use(flavor):
+                return compile(query), str(query), query.params
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(compile_, flavors))
+        self.assertEqual(results,
+            [(r, r[0], r[1]) for r in expected])
@@ -2,12 +2,36 @@
 # this repository contains the full copyright notices and license terms.
 import unittest
 
-from sql import Delete, Table, With
+from sql import Delete, Table, With, compile
+from sql.frozen import freeze
 
 
 class TestDelete(unittest.TestCase):
     table = Table('t')
 
+    def test_delete_derive(self):
+        query = self.table.delete()
+        derived = query.with_where(self.table.c == 'foo')
+        self.assertEqual(str(derived), 'DELETE FROM "t" WHERE "c" = %s')
+        self.assertEqual(derived.params, ('foo',))
+        self.assertEqual(str(query), 'DELETE FROM "t"')
+
+    def test_delete_rendered(self):
+        query = self.table.delete(where=freeze(self.table.c == 'foo'),
+            returning=[freeze(self.table.c)])
+        expected = (
+            'DELETE FROM "t" WHERE "c" = %s RETURNING "c"', ('foo',))
+        self.assertEqual(compile(query), expected)
+        rendered = dict(query._rendered)
+        self.assertEqual(set(rendered), {'where', 'returning'})
+        self.assertEqual(compile(query), expected)
+        for name in rendered:
+            self.assertIs(query._rendered[name], rendered[name])
+
+        query.returning = None
+        self.assertNotIn('returning', query._rendered)
+        self.assertEqual(str(query), 'DELETE FROM "t" WHERE "c" = %s')
+
     def test_delete1(self):
         query = self.table.delete()
         self.assertEqual(str(query), 'DELETE FROM "t"')
@@ -0,0 +1,89 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+
+from sql import Column, Null, Table, _structure
+from sql.conditionals import Coalesce
+from sql.functions import Trim
+
+
+class TestFingerprint(unittest.TestCase):
+    table = Table('t')
+
+    def select(self, value, table=None):
+        if table is None:
+            table = self.table
+        return table.select(table.c, where=table.c == value)
+
+    def test_fingerprint(self):
+        fingerprint = self.select('foo').fingerprint()
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(self.select('bar').fingerprint(), fingerprint)
+        self.assertNotEqual(
+            self.select('foo', Table('u')).fingerprint(), fingerprint)
+        self.assertNotEqual(self.select(Null).fingerprint(), fingerprint)
+
+    def test_structurally_equal(self):
+        query = self.select('foo')
+        self.assertTrue(query.structurally_equal(self.select('bar')))
+        self.assertTrue(query.structurally_equal(self.select('foo')))
+        self.assertFalse(query.structurally_equal(self.select(1)))
+        self.assertFalse(query.structurally_equal(self.select('')))
+        self.assertFalse(query.structurally_equal(
+                self.select('foo', Table('u'))))
+        self.assertFalse(query.structurally_equal(
+                self.select(self.table.d)))
+        self.assertFalse(query.structurally_equal('foo'))
+
+    def test_expression(self):
+        self.assertTrue(
+            (self.table.c + 1).structurally_equal(self.table.c + 2))
+        self.assertFalse(
+            (self.table.c + 1).structurally_equal(self.table.c - 1))
+        self.assertTrue(Trim('foo').structurally_equal(Trim('bar')))
+        self.assertFalse(Trim('foo').structurally_equal(
+                Trim('foo', 'LEADING')))
+
+    def test_value_after_node(self):
+        self.assertTrue(Coalesce(self.table.c, 1).structurally_equal(
+                Coalesce(self.table.c, 2)))
+        self.assertFalse(Coalesce(self.table.c, 1).structurally_equal(
+                Coalesce(self.table.c, 'foo')))
+
+        def insert(value):
+            return self.table.insert(
+                [self.table.c, self.table.d], [[self.table.e, value]])
+        self.assertEqual(insert(1).fingerprint(), insert(2).fingerprint())
+        self.assertNotEqual(
+            insert(1).fingerprint(), insert('foo').fingerprint())
+
+    def test_unset_slot(self):
+        class Custom(Table):
+            __slots__ = ('_extra',)
+
+        tokens = _structure(Custom('t').select())
+        self.assertNotIn(Column, tokens)
+        self.assertEqual(Custom('t').select().fingerprint(),
+            Custom('t').select().fingerprint())
+
+    def test_shared(self):
+        table1, table2 = Table('t'), Table('t')
+        self.assertTrue(table1.join(table2).select().structurally_equal(
+                Table('t').join(Table('t')).select()))
+        self.assertFalse(table1.join(table2).select().structurally_equal(
+                table1.join(table1).select()))
+
+    def test_limit(self):
+        self.assertTrue(self.table.select(limit=1).structurally_equal(
+                self.table.select(limit=2)))
+        self.assertFalse(self.table.select(limit=1).structurally_equal(
+                self.table.select()))
+
+    def test_deep(self):
+        def query(value):
+            where = self.table.c == value
+            for i in range(2000):
+                where &= (self.table.d == i) | (self.table.e == i)
+            return self.table.select(where=where)
+        self.assertEqual(
+            query(1).fingerprint(), query(2).fingerprint())
@@ -1,9 +1,15 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-
+import asyncio
+import copy
+import pickle
+import sys
 import unittest
 
-from sql import Flavor
+from sql import Flavor, Table, compile
+from sql.cache import StatementCache
+from sql.frozen import freeze
+from sql.functions import Function
 
 
 class TestFlavor(unittest.TestCase):
@@ -41,6 +47,119 @@ class TestFlavor(unittest.TestCase):
         self.assertEqual(flavor.paramstyle, 'qmark')
         self.assertEqual(flavor.param, '?')
 
+    def test_paramstyle_numbered(self):
+        for paramstyle, param in [
+                ('numeric', ':%i'), ('dollar', '$%i'),
+                ('named', ':%s'), ('pyformat', '%%(%s)s')]:
+            flavor = Flavor(paramstyle=paramstyle)
+
+            self.assertEqual(flavor.paramstyle, paramstyle)
+            self.assertEqual(flavor.param, param)
+
     def test_invalid_paramstyle(self):
         with self.assertRaises(ValueError):
             Flavor(paramstyle='foo')
+
+    def test_presets(self):
+        for name, paramstyle in [
+                ('postgresql', 'format'), ('sqlite', 'qmark'),
+                ('mysql', 'format'), ('oracle', 'numeric'),
+                ('mssql', 'qmark')]:
+            with self.subTest(name=name):
+                flavor = getattr(Flavor, name)()
+                self.assertIsInstance(flavor, Flavor)
+                self.assertEqual(flavor.paramstyle, paramstyle)
+                self.assertIs(getattr(Flavor, name)(), flavor)
+
+    def test_preset_options(self):
+        class Foo(Function):
+            _function = 'FOO'
+
+        class Bar(Function):
+            _function = 'BAR'
+
+        flavor = Flavor.sqlite(function_mapping={Foo: Bar})
+        self.assertIs(Flavor.sqlite(function_mapping={Foo: Bar}), flavor)
+        self.assertNotEqual(flavor, Flavor.sqlite())
+        self.assertEqual(compile(Foo(1), flavor), ('BAR(?)', (1,)))
+
+    def test_preset_immutable(self):
+        flavor = Flavor.postgresql()
+        with self.assertRaises(AttributeError):
+            flavor.ilike = False
+        with self.assertRaises(AttributeError):
+            del flavor.ilike
+        with self.assertRaises(TypeError):
+            flavor.function_mapping[Function] = Function
+        self.assertEqual(hash(flavor), hash(Flavor.postgresql()))
+
+    def test_preset_copy(self):
+        flavor = copy.copy(Flavor.sqlite())
+        flavor.paramstyle = 'format'
+        flavor.function_mapping[Function] = Function
+        self.assertEqual(Flavor.sqlite().paramstyle, 'qmark')
+        self.assertEqual(Flavor.sqlite().function_mapping, {})
+        self.assertIs(copy.deepcopy(Flavor.sqlite()), Flavor.sqlite())
+
+    def test_version(self):
+        flavor = Flavor()
+        versions = {flavor._version}
+        for modify in [
+                lambda: setattr(flavor, 'paramstyle', 'qmark'),
+                lambda: flavor.function_mapping.update({Function: Function}),
+                lambda: flavor.function_mapping.pop(Function),
+                lambda: setattr(flavor, 'function_mapping', {}),
+                ]:
+            modify()
+            self.assertNotIn(flavor._version, versions)
+            versions.add(flavor._version)
+        self.assertNotIn(copy.copy(flavor)._version, versions)
+        self.assertNotIn(
+            pickle.loads(pickle.dumps(flavor))._version, versions)
+        self.assertEqual(
+            Flavor.sqlite()._version, copy.deepcopy(Flavor.sqlite())._version)
+
+    def test_preset_pickle(self):
+        for flavor in [Flavor.sqlite(), Flavor.postgresql(paramstyle='named')]:
+            self.assertIs(pickle.loads(pickle.dumps(flavor)), flavor)
+
+    def test_preset_compile(self):
+        table = Table('t')
+        query = table.select(
+            where=freeze(table.c == 1) & table.d.ilike('foo'), limit=10)
+        self.assertEqual(compile(query, Flavor.mssql()), (
+                'SELECT * FROM "t" AS "a" '
+                'WHERE ("a"."c" = ?) AND (UPPER("a"."d") LIKE UPPER(?)) '
+                'FETCH FIRST (?) ROWS ONLY', (1, 'foo', 10)))
+        cache = StatementCache()
+        for _ in range(2):
+            self.assertEqual(
+                cache.compile(query, Flavor.oracle()),
+                compile(query, Flavor.oracle()))
+        self.assertEqual(cache.hits, 1)
+
+    def test_use(self):
+        flavor = Flavor(paramstyle='qmark')
+        current = Flavor.get()
+        with Flavor.use(flavor):
+            self.assertIs(Flavor.get(), flavor)
+        self.assertIs(Flavor.get(), current)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "requires contextvars")
+    def test_tasks(self):
+        table = Table('t')
+        query = table.select(where=table.c == 1)
+
+        async def compile_(flavor):
+            with Flavor.use(flavor):
+                await asyncio.sleep(0)
+                return str(query)
+
+        async def main():
+            return await asyncio.gather(
+                compile_(Flavor(paramstyle='qmark')),
+                compile_(Flavor(paramstyle='format')))
+
+        self.assertEqual(asyncio.run(main()), [
+                'SELECT * FROM "t" AS "a" WHERE "a"."c" = ?',
+                'SELECT * FROM "t" AS "a" WHERE "a"."c" = %s'])
@@ -0,0 +1,144 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import copy
+import pickle
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from sql import Flavor, Literal, Table, compile
+from sql.cache import StatementCache
+from sql.frozen import freeze
+from sql.functions import Abs, Upper
+from sql.operators import And, Equal
+
+
+class TestFrozen(unittest.TestCase):
+    table = Table('t')
+
+    def expression(self):
+        return ((self.table.c == 1)
+            & (Upper(Literal('foo')) == 'FOO')
+            & self.table.d.in_([1, 2]))
+
+    def test_compile(self):
+        expression = freeze(self.expression())
+        query = self.table.select(where=expression)
+        for flavor in [Flavor(), Flavor(paramstyle='numeric')]:
+            self.assertEqual(compile(query, flavor), compile(
+                    self.table.select(where=self.expression()), flavor))
+            self.assertEqual(compile(query, flavor), compile(
+                    self.table.select(where=self.expression()), flavor))
+
+    def test_interned(self):
+        self.assertIs(freeze(self.expression()), freeze(self.expression()))
+        function = freeze(Abs(1))
+        self.assertIs(freeze(Abs(1)), function)
+        self.assertIsNot(freeze(Literal(1)), freeze(Literal(True)))
+        self.assertIsNot(freeze(Literal(1)), freeze(Literal(1.0)))
+        self.assertIsNot(
+            freeze(self.table.c == 1), freeze(Table('t').c == 1))
+
+    def test_shared(self):
+        expression = freeze(self.expression())
+        equal = freeze(Upper(Literal('foo')) == 'FOO')
+        self.assertIs(expression[0][1], equal)
+
+    def test_unhashable(self):
+        expression = freeze(self.table.c == {'foo': 'bar'})
+        self.assertIsNot(expression, freeze(self.table.c == {'foo': 'bar'}))
+        self.assertEqual(expression.params, ({'foo': 'bar'},))
+
+    def test_immutable(self):
+        expression = freeze(self.expression())
+        with self.assertRaises(AttributeError):
+            expression.append(self.table.e)
+        with self.assertRaises(AttributeError):
+            expression[0][1].left = self.table.e
+        self.assertIsInstance(expression, And)
+        self.assertIsInstance(expression[0][1], Equal)
+
+    def test_copy(self):
+        expression = freeze(self.expression())
+        self.assertIs(copy.copy(expression), expression)
+        independent = freeze(Upper(Literal('foo')) == 'FOO')
+        self.assertIs(copy.deepcopy(independent), independent)
+
+    def test_deepcopy_tables(self):
+        query = self.table.select(where=freeze(self.table.c == 1))
+        copied = copy.deepcopy(query)
+        self.assertIsNot(copied.where, query.where)
+        self.assertIs(copied.where.left.table, copied.from_[0])
+        self.assertEqual(
+            (str(copied), copied.params), (str(query), query.params))
+
+    def test_pickle(self):
+        expression = freeze(Upper(Literal('foo')) == 'FOO')
+        self.assertIs(pickle.loads(pickle.dumps(expression)), expression)
+        query = self.table.select(where=freeze(self.expression()))
+        copied = pickle.loads(pickle.dumps(query))
+        self.assertIsInstance(copied.where, And)
+        self.assertIs(copied.where, freeze(copied.where))
+        self.assertEqual(compile(copied), compile(query))
+
+    def test_not_frozen(self):
+        query = self.table.select(self.table.c)
+        expression = freeze(self.table.c.in_(query))
+        self.assertIs(expression.right, query)
+
+    def test_memo_flavor(self):
+        expression = freeze(Literal(True) & Literal(False))
+        flavor = Flavor()
+        self.assertEqual(compile(expression, flavor), ('%s AND %s',
+                (True, False)))
+        flavor.no_boolean = True
+        self.assertEqual(compile(expression, flavor), (
+                '(1 = 1) AND (1 != 1)', ()))
+
+    def test_memo_function_mapping(self):
+        expression = freeze(Abs(Literal(-1)))
+        flavor = Flavor()
+        self.assertEqual(compile(expression, flavor), ('ABS(%s)', (-1,)))
+        flavor.function_mapping[Abs] = Upper
+        self.assertEqual(compile(expression, flavor), ('UPPER(%s)', (-1,)))
+        del flavor.function_mapping[Abs]
+        self.assertEqual(compile(expression, flavor), ('ABS(%s)', (-1,)))
+
+    def test_memo_flavor_copy(self):
+        expression = freeze(Abs(Literal(-1)))
+        flavor = Flavor()
+        compile(expression, flavor)
+        for other in [
+                copy.copy(flavor),
+                copy.deepcopy(flavor),
+                pickle.loads(pickle.dumps(flavor)),
+                ]:
+            other.function_mapping[Abs] = Upper
+            self.assertEqual(
+                compile(expression, other), ('UPPER(%s)', (-1,)))
+        self.assertEqual(compile(expression, flavor), ('ABS(%s)', (-1,)))
+
+    def test_memo_alias(self):
+        column = freeze(self.table.c)
+        self.assertEqual(str(self.table.select(column)),
+            'SELECT "a"."c" FROM "t" AS "a"')
+        self.assertEqual(str(column), '"c"')
+
+    def test_cache(self):
+        cache = StatementCache()
+        for value in [1, 2]:
+            query = self.table.select(where=freeze(self.table.c == value))
+            self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.hits, 1)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            freeze(self.table.c == 1).fingerprint(),
+            freeze(self.table.c == 2).fingerprint())
+
+    def test_threads(self):
+        def freeze_(_):
+            return freeze(self.expression())
+
+        with ThreadPoolExecutor(4) as executor:
+            expressions = list(executor.map(freeze_, range(100)))
+        self.assertTrue(all(e is expressions[0] for e in expressions))
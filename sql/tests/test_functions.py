@@ -5,7 +5,7 @@ import unittest
 from sql import AliasManager, Flavor, Table, Window
 from sql.functions import (
     Abs, AtTimeZone, CurrentTime, Div, Extract, Function, FunctionKeyword,
-    FunctionNotCallable, Overlay, Rank, Trim, WindowFunction)
+    FunctionNotCallable, Overlay, Rank, Trim, Unnest, WindowFunction)
 
 
 class TestFunctions(unittest.TestCase):
@@ -113,6 +113,12 @@ class TestFunctions(unittest.TestCase):
             '(SELECT "a"."tz" FROM "t" AS "a" WHERE "a"."c1" = %s)')
         self.assertEqual(time_zone.params, ('foo',))
 
+    def test_unnest(self):
+        query = Unnest([1, 2], ['foo', 'bar']).select()
+        self.assertEqual(tuple(query),
+            ('SELECT * FROM UNNEST(%s, %s) AS "a"',
+                ([1, 2], ['foo', 'bar'])))
+
     def test_at_time_zone_mapping(self):
         class MyAtTimeZone(Function):
             _function = 'MY_TIMEZONE'
@@ -1,8 +1,13 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import pickle
 import unittest
 
-from sql import Conflict, Excluded, Insert, Table, With
+from sql import (
+    Conflict, Excluded, Flavor, Insert, Literal, Param, Table, With, compile,
+    trusted)
+from sql.cache import StatementCache
+from sql.frozen import freeze
 from sql.functions import Abs
 
 
@@ -17,6 +22,13 @@ class TestInsert(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.table.insert(['foo'], [['foo']])
 
+    def test_insert_trusted_columns(self):
+        column = Table('t').c
+        with trusted():
+            self.table.insert([column], [['foo']])
+        with self.assertRaises(ValueError):
+            self.table.insert([column], [['foo']])
+
     def test_insert_invalid_values(self):
         with self.assertRaises(ValueError):
             self.table.insert([self.table.c], 'foo')
@@ -221,6 +233,30 @@ class TestInsert(unittest.TestCase):
             'ON CONFLICT DO UPDATE SET "c1" = ("EXCLUDED"."c1" + %s)')
         self.assertEqual(tuple(query.params), (1, 2))
 
+    def test_upsert_rendered(self):
+        conflict = Conflict(self.table,
+            indexed_columns=[self.table.c1],
+            index_where=freeze(self.table.c2 == 'bar'),
+            columns=[self.table.c1], values=[freeze(Literal('foo'))],
+            where=freeze(self.table.c2 == 'baz'))
+        query = self.table.insert([self.table.c1], [['qux']],
+            on_conflict=conflict, returning=[freeze(self.table.c1)])
+        expected = ('INSERT INTO "t" AS "a" ("c1") VALUES (%s) '
+            'ON CONFLICT ("c1") WHERE "a"."c2" = %s '
+            'DO UPDATE SET "c1" = (%s) WHERE "a"."c2" = %s '
+            'RETURNING "a"."c1"', ('qux', 'bar', 'foo', 'baz'))
+        self.assertEqual(compile(query), expected)
+        rendered = dict(conflict._rendered)
+        self.assertEqual(set(rendered), {'index_where', 'values', 'where'})
+        self.assertIn('returning', query._rendered)
+        self.assertEqual(compile(query), expected)
+        for name in rendered:
+            self.assertIs(conflict._rendered[name], rendered[name])
+
+        conflict.values = [freeze(Literal('quux'))]
+        self.assertNotIn('values', conflict._rendered)
+        self.assertEqual(query.params, ('qux', 'bar', 'quux', 'baz'))
+
     def test_conflict_invalid_table(self):
         with self.assertRaises(ValueError):
             Conflict('foo')
@@ -233,6 +269,192 @@ class TestInsert(unittest.TestCase):
         with self.assertRaises(ValueError):
             Conflict(self.table, indexed_columns=[Table('t').c])
 
+    def test_insert_executemany_form(self):
+        query = self.table.insert([self.table.c1, self.table.c2])
+        rows = [[1, 'foo'], (2, 'bar')]
+        sql, params = query.executemany_form(iter(rows))
+        self.assertEqual(sql, 'INSERT INTO "t" ("c1", "c2") VALUES (%s, %s)')
+        self.assertEqual(list(params), [(1, 'foo'), (2, 'bar')])
+
+    def test_insert_executemany_form_params(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            returning=[self.table.c1 + 1])
+        sql, params = query.executemany_form(
+            [[1, 'foo'], [2, 'bar']], Flavor(paramstyle='numeric'))
+        self.assertEqual(sql,
+            'INSERT INTO "t" AS "a" ("c1", "c2") VALUES (:1, :2) '
+            'RETURNING "a"."c1" + :3')
+        self.assertEqual(list(params), [(1, 'foo', 1), (2, 'bar', 1)])
+
+    def test_insert_executemany_form_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.insert().executemany_form([])
+
+    def test_insert_chunked(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[i, str(i)] for i in range(5)])
+        chunks = list(query.chunked(max_params=4))
+        self.assertEqual(chunks, [
+                ('INSERT INTO "t" ("c1", "c2") VALUES (%s, %s), (%s, %s)',
+                    (0, '0', 1, '1')),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (%s, %s), (%s, %s)',
+                    (2, '2', 3, '3')),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (%s, %s)', (4, '4')),
+                ])
+        self.assertIs(chunks[0][0], chunks[1][0])
+
+    def test_insert_chunked_params(self):
+        t1 = Table('t1')
+        w = With(query=t1.select(where=t1.c == 'foo'))
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[i, str(i)] for i in range(5)],
+            returning=[self.table.c1 + 1], with_=[w])
+        flavor = Flavor(paramstyle='numeric')
+        self.assertEqual(
+            list(query.chunked(max_params=6, flavor=flavor)),
+            [compile(query.table.insert(query.columns, values,
+                        returning=query.returning, with_=[w]), flavor)
+                for values in [query.values[:2], query.values[2:4],
+                    query.values[4:]]])
+
+    def test_insert_chunked_max_rows(self):
+        query = self.table.insert(
+            [self.table.c], [[i] for i in range(5)])
+        self.assertEqual(
+            [p for _, p in query.chunked(max_rows=3, max_params=10)],
+            [(0, 1, 2), (3, 4)])
+
+    def test_insert_chunked_max_bytes(self):
+        query = self.table.insert(
+            [self.table.c], [[i] for i in range(5)])
+        chunks = list(query.chunked(
+                max_bytes=len('INSERT INTO "t" ("c") VALUES ($1), ($2)'),
+                encoding='utf-8', flavor=Flavor(paramstyle='dollar')))
+        self.assertEqual(chunks, [
+                (b'INSERT INTO "t" ("c") VALUES ($1), ($2)', (0, 1)),
+                (b'INSERT INTO "t" ("c") VALUES ($1), ($2)', (2, 3)),
+                (b'INSERT INTO "t" ("c") VALUES ($1)', (4,)),
+                ])
+        with self.assertRaises(ValueError):
+            query.chunked(max_bytes=10)
+
+    def test_insert_chunked_expression(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[1, 'foo'], [Abs(-2), 'bar'], [3, 'baz'], [4, Literal(4)]])
+        flavor = Flavor(paramstyle='named')
+        self.assertEqual(list(query.chunked(max_params=3, flavor=flavor)), [
+                ('INSERT INTO "t" ("c1", "c2") VALUES (:p1, :p2)',
+                    {'p1': 1, 'p2': 'foo'}),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (ABS(:p1), :p2)',
+                    {'p1': -2, 'p2': 'bar'}),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (:p1, :p2)',
+                    {'p1': 3, 'p2': 'baz'}),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (:p1, :p2)',
+                    {'p1': 4, 'p2': 4}),
+                ])
+
+    def test_insert_chunked_named(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[i, str(i)] for i in range(5)],
+            returning=[self.table.c1 + Param('p3')])
+        for paramstyle in ['named', 'pyformat']:
+            flavor = Flavor(paramstyle=paramstyle)
+            with self.subTest(paramstyle=paramstyle):
+                chunks = list(query.chunked(max_params=5, flavor=flavor))
+                self.assertEqual(chunks,
+                    [compile(query._derive(values=values), flavor)
+                        for values in [query.values[:2], query.values[2:4],
+                            query.values[4:]]])
+                self.assertIs(chunks[0][0], chunks[1][0])
+
+    def test_insert_chunked_deduplicate(self):
+        "Test the statements are compiled with the values"
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[1, 1], [1, 2], [3, 3]])
+        flavor = Flavor(paramstyle='numeric', deduplicate=True)
+        self.assertEqual(list(query.chunked(max_rows=2, flavor=flavor)), [
+                ('INSERT INTO "t" ("c1", "c2") VALUES (:1, :1), (:1, :2)',
+                    (1, 2)),
+                ('INSERT INTO "t" ("c1", "c2") VALUES (:1, :1)', (3,)),
+                ])
+
+    def test_insert_chunked_row_too_large(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [[1, 'foo'], [Abs(-2), Literal(2) + Literal(3)]])
+        chunks = query.chunked(max_params=2)
+        self.assertEqual(next(chunks),
+            ('INSERT INTO "t" ("c1", "c2") VALUES (%s, %s)', (1, 'foo')))
+        with self.assertRaises(ValueError):
+            next(chunks)
+
+    def test_insert_chunked_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.insert([self.table.c], Table('t1').select()).chunked()
+        with self.assertRaises(ValueError):
+            self.table.insert([self.table.c], [[1]]).chunked(max_rows=0)
+        with self.assertRaises(ValueError):
+            self.table.insert().chunked()
+        self.assertEqual(
+            list(self.table.insert([self.table.c], []).chunked()), [])
+
+    def test_bulk_insert(self):
+        query = self.table.bulk_insert([self.table.c1, self.table.c2],
+            iter([[1, 'foo'], [2, 'bar']]), types=['INTEGER', 'TEXT'])
+        self.assertEqual(tuple(query), (
+                'INSERT INTO "t" ("c1", "c2") SELECT * FROM '
+                'UNNEST(CAST(%s AS INTEGER[]), CAST(%s AS TEXT[])) AS "a"',
+                ([1, 2], ['foo', 'bar'])))
+
+    def test_bulk_insert_columnar(self):
+        query = self.table.bulk_insert([self.table.c1, self.table.c2],
+            [range(3), ['foo', 'bar', 'baz']], columnar=True)
+        self.assertEqual(tuple(query), (
+                'INSERT INTO "t" ("c1", "c2") SELECT * FROM '
+                'UNNEST(%s, %s) AS "a"',
+                ([0, 1, 2], ['foo', 'bar', 'baz'])))
+
+    def test_bulk_insert_empty(self):
+        query = self.table.bulk_insert([self.table.c1, self.table.c2], [])
+        self.assertEqual(query.params, ([], []))
+
+    def test_bulk_insert_conflict(self):
+        query = self.table.bulk_insert([self.table.c1, self.table.c2],
+            [[1, 'foo']], types=['INTEGER', 'TEXT'],
+            on_conflict=Conflict(self.table,
+                indexed_columns=[self.table.c1],
+                columns=[self.table.c2], values=[Excluded.c2]),
+            returning=[self.table.id])
+        self.assertEqual(tuple(query), (
+                'INSERT INTO "t" AS "b" ("c1", "c2") SELECT * FROM '
+                'UNNEST(CAST(%s AS INTEGER[]), CAST(%s AS TEXT[])) AS "a" '
+                'ON CONFLICT ("c1") DO UPDATE SET "c2" = ("EXCLUDED"."c2") '
+                'RETURNING "b"."id"', ([1], ['foo'])))
+
+    def test_bulk_insert_cache(self):
+        cache = StatementCache()
+        for count in [1, 10, 100]:
+            query = self.table.bulk_insert([self.table.c1, self.table.c2],
+                [[i, str(i)] for i in range(count)])
+            self.assertEqual(cache.compile(query), compile(query))
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(len(set(
+                    self.table.bulk_insert([self.table.c], [[i]] * i)
+                    .fingerprint() for i in range(1, 3))), 1)
+
+    def test_bulk_insert_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.bulk_insert([self.table.c1], [[1, 2]])
+        with self.assertRaises(ValueError):
+            self.table.bulk_insert([self.table.c1], [[1]], types=[])
+
+    def test_insert_pickle(self):
+        query = self.table.insert([self.table.c1, self.table.c2],
+            [['foo', 1], ['bar', None]],
+            on_conflict=Conflict(self.table, columns=[self.table.c1],
+                values=[Excluded.c2], where=self.table.c2 > 0))
+        self.assertEqual(
+            tuple(pickle.loads(pickle.dumps(query))), tuple(query))
+
     def test_conflict_invalid_index_where(self):
         with self.assertRaises(ValueError):
             Conflict(self.table, index_where='foo')
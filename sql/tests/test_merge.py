@@ -6,6 +6,7 @@ import unittest
 from sql import (
     Literal, Matched, MatchedDelete, MatchedUpdate, Merge, NotMatched,
     NotMatchedInsert, Table, With)
+from sql.frozen import freeze
 
 
 class TestMerge(unittest.TestCase):
@@ -22,6 +23,21 @@ class TestMerge(unittest.TestCase):
             'WHEN MATCHED THEN DO NOTHING')
         self.assertEqual(query.params, ())
 
+    def test_merge_rendered(self):
+        query = self.target.merge(self.source,
+            freeze(self.target.c1 == self.source.c2), Matched())
+        expected = str(query)
+        rendered = query._rendered['condition']
+        self.assertEqual(str(query), expected)
+        self.assertIs(query._rendered['condition'], rendered)
+
+        query.condition = freeze(self.target.c1 == self.source.c3)
+        self.assertNotIn('condition', query._rendered)
+        self.assertEqual(str(query),
+            'MERGE INTO "t" AS "a" USING "s" AS "b" '
+            'ON "a"."c1" = "b"."c3" '
+            'WHEN MATCHED THEN DO NOTHING')
+
     def test_merge_invalid_target(self):
         with self.assertRaises(ValueError):
             Merge('foo', self.source, Literal(True))
@@ -39,22 +39,56 @@ class TestOperators(unittest.TestCase):
     def test_operator_operators(self):
         and_ = And((Literal(True), self.table.c1))
         and2 = and_ & And((Literal(True), self.table.c2))
-        self.assertEqual(str(and2), '(%s AND "c1") AND %s AND "c2"')
+        self.assertEqual(str(and2), '%s AND "c1" AND %s AND "c2"')
         self.assertEqual(and2.params, (True, True))
 
         and3 = and_ & Literal(True)
-        self.assertEqual(str(and3), '(%s AND "c1") AND %s')
+        self.assertEqual(str(and3), '%s AND "c1" AND %s')
         self.assertEqual(and3.params, (True, True))
 
         or_ = Or((Literal(True), self.table.c1))
         or2 = or_ | Or((Literal(True), self.table.c2))
-        self.assertEqual(str(or2), '(%s OR "c1") OR %s OR "c2"')
+        self.assertEqual(str(or2), '%s OR "c1" OR %s OR "c2"')
         self.assertEqual(or2.params, (True, True))
 
         or3 = or_ | Literal(True)
-        self.assertEqual(str(or3), '(%s OR "c1") OR %s')
+        self.assertEqual(str(or3), '%s OR "c1" OR %s')
         self.assertEqual(or3.params, (True, True))
 
+    def test_and_flatten(self):
+        and_ = And((And((self.table.c1, self.table.c2)), self.table.c3))
+        self.assertEqual(str(and_), '"c1" AND "c2" AND "c3"')
+
+        and_ = And((Or((self.table.c1, self.table.c2)), self.table.c3))
+        self.assertEqual(str(and_), '("c1" OR "c2") AND "c3"')
+
+    def test_deep(self):
+        and_ = self.table.c1
+        for i in range(5000):
+            and_ = (and_ & (self.table.c2 == i)) | self.table.c3
+        self.assertEqual(len(and_.params), 5000)
+
+        not_ = self.table.c1
+        for _ in range(5000):
+            not_ = Not(not_)
+        self.assertEqual(str(not_), 'NOT ' * 5000 + '"c1"')
+
+    def test_deep_subquery(self):
+        for nest in [
+                lambda q: self.table.select(
+                    self.table.c1, where=In(self.table.c1, q)),
+                lambda q: self.table.select(
+                    self.table.c1, where=self.table.c2 == q),
+                lambda q: self.table.select(q.as_('c1')),
+                lambda q: q.select(q.c1),
+                ]:
+            query = self.table.select(self.table.c1, where=self.table.c2 == 0)
+            for _ in range(3000):
+                query = nest(query)
+            sql, params = tuple(query)
+            self.assertEqual(sql.count('SELECT'), 3001)
+            self.assertEqual(params, (0,))
+
     def test_operator_compat_column(self):
         and_ = And((self.table.c1, self.table.c2))
         self.assertEqual(and_.table, '')
@@ -0,0 +1,304 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import array
+import datetime
+import enum
+import io
+import unittest
+import uuid
+from decimal import Decimal
+
+from sql import Table
+from sql.pgcopy import Copy
+
+
+class TestCopy(unittest.TestCase):
+    table = Table('t')
+
+    def data(self, rows, format='text', **kwargs):
+        copy = self.table.copy_from(format=format)
+        return b''.join(copy.iter_data_chunks(rows, **kwargs))
+
+    def test_copy(self):
+        copy = self.table.copy_from([self.table.c1, self.table.c2])
+        self.assertIsInstance(copy, Copy)
+        self.assertEqual(tuple(copy), (
+                'COPY "t" ("c1", "c2") FROM STDIN WITH (FORMAT text)', ()))
+
+    def test_copy_csv(self):
+        copy = Copy(Table('t', 's'), format='csv')
+        self.assertEqual(
+            str(copy), 'COPY "s"."t" FROM STDIN WITH (FORMAT csv)')
+
+    def test_copy_invalid(self):
+        with self.assertRaises(ValueError):
+            Copy('t')
+        with self.assertRaises(ValueError):
+            Copy(self.table, [Table('u').c])
+        with self.assertRaises(ValueError):
+            Copy(self.table, format='xml')
+
+    def test_text(self):
+        self.assertEqual(self.data([
+                    ['foo', None, 'a\tb\\c\nd\re', ''],
+                    [True, False, 42, -1.5],
+                    ]),
+            b'foo\t\\N\ta\\tb\\\\c\\nd\\re\t\n'
+            b't\tf\t42\t-1.5\n')
+
+    def test_text_values(self):
+        tz = datetime.timezone(datetime.timedelta(hours=2))
+        self.assertEqual(self.data([[
+                        Decimal('1.10'), float('nan'), float('inf'),
+                        float('-inf'),
+                        datetime.date(2020, 1, 2),
+                        datetime.datetime(2020, 1, 2, 3, 4, 5, 6),
+                        datetime.datetime(2020, 1, 2, 3, 4, tzinfo=tz),
+                        datetime.time(3, 4, 5),
+                        datetime.timedelta(days=-1, seconds=1),
+                        uuid.UUID(int=1),
+                        b'\x00\xff',
+                        ]]),
+            b'1.10\tNaN\tInfinity\t-Infinity\t2020-01-02\t'
+            b'2020-01-02T03:04:05.000006\t2020-01-02T03:04:00+02:00\t'
+            b'03:04:05\t-1 days 1 seconds 0 microseconds\t'
+            b'00000000-0000-0000-0000-000000000001\t\\\\x00ff\n')
+
+    def test_text_array(self):
+        self.assertEqual(self.data([[
+                        [1, None, 3],
+                        ['a b', '', 'null', 'x"y\\z', ['c', 'd']],
+                        ]]),
+            b'{1,NULL,3}\t'
+            b'{"a b","","null","x\\\\"y\\\\\\\\z",{c,d}}\n')
+
+    def test_subclass(self):
+        class Number(enum.IntEnum):
+            one = 1
+
+        class DateTime(datetime.datetime):
+            pass
+
+        self.assertEqual(
+            self.data([[Number.one, DateTime(2020, 1, 2, 3, 4)]]),
+            b'1\t2020-01-02T03:04:00\n')
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            self.data([[{'foo': 'bar'}]])
+
+    def test_csv(self):
+        self.assertEqual(self.data([
+                    ['foo', None, '', 'a,b', 'x"y', 'a\nb', '\\.'],
+                    [True, 1.5, b'\x01', [1, 2]],
+                    ], format='csv'),
+            b'foo,,"","a,b","x""y","a\nb","\\."\n'
+            b't,1.5,\\x01,"{1,2}"\n')
+
+    def test_chunks(self):
+        copy = self.table.copy_from([self.table.c])
+        rows = [['foo']] * 10
+        chunks = list(copy.iter_data_chunks(iter(rows), size=10))
+        self.assertEqual(chunks, [b'foo\nfoo\nfoo\n'] * 3 + [b'foo\n'])
+
+    def test_encoding(self):
+        self.assertEqual(
+            self.data([['é']], encoding='latin-1'), 'é\n'.encode('latin-1'))
+
+    def test_invalid_row(self):
+        copy = self.table.copy_from([self.table.c1, self.table.c2])
+        with self.assertRaises(ValueError):
+            list(copy.iter_data_chunks([['foo']]))
+
+    def test_write_data_to(self):
+        fp = io.BytesIO()
+        self.table.copy_from(format='csv').write_data_to(
+            fp, [['foo', 1], ['bar', 2]])
+        self.assertEqual(fp.getvalue(), b'foo,1\nbar,2\n')
+
+
+class TestBinaryCopy(unittest.TestCase):
+    table = Table('t')
+    header = b'PGCOPY\n\xff\r\n\x00' + bytes(8)
+    trailer = b'\xff\xff'
+
+    def data(self, types, values, **kwargs):
+        copy = self.table.copy_from(format='binary', types=types)
+        return b''.join(copy.iter_data_chunks(values, **kwargs))
+
+    def assertData(self, types, rows, expected):
+        self.assertEqual(self.data(types, rows),
+            self.header + bytes.fromhex(expected) + self.trailer)
+
+    def test_statement(self):
+        copy = self.table.copy_from(
+            [self.table.c], format='binary', types=['int4'])
+        self.assertEqual(
+            str(copy), 'COPY "t" ("c") FROM STDIN WITH (FORMAT binary)')
+
+    def test_empty(self):
+        self.assertEqual(self.data(['int4'], []),
+            b'PGCOPY\n\xff\r\n\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+            b'\xff\xff')
+
+    def test_fixed(self):
+        self.assertData(
+            ['int2', 'int4', 'int8', 'float4', 'float8', 'bool'],
+            [[-2, 1, 2 ** 40, 1.5, -0.5, True]],
+            '0006'
+            '00000002fffe'
+            '0000000400000001'
+            '000000080000010000000000'
+            '000000043fc00000'
+            '00000008bfe0000000000000'
+            '0000000101')
+
+    def test_bool_int(self):
+        self.assertData(['bool', 'bool[]'], [[0, [1, True]]],
+            '0002' '0000000100'
+            '0000001e' '00000001' '00000000' '00000010' '0000000200000001'
+            '0000000101' '0000000101')
+
+    def test_null(self):
+        self.assertData(['int4', 'bool', 'text'], [[None, None, None]],
+            '0003' 'ffffffff' 'ffffffff' 'ffffffff')
+        self.assertData(['int4', 'bool'], [[1, True], [2, None]],
+            '0002' '0000000400000001' '0000000101'
+            '0002' '0000000400000002' 'ffffffff')
+
+    def test_variable(self):
+        self.assertData(['text', 'varchar', 'bytea', 'uuid'],
+            [['é', '', b'\x00\xff', uuid.UUID(int=1)]],
+            '0004'
+            '00000002c3a9'
+            '00000000'
+            '0000000200ff'
+            '00000010' '00000000000000000000000000000001')
+
+    def test_encoding(self):
+        self.assertEqual(
+            self.data(['text'], [['é']], encoding='latin-1'),
+            self.header + bytes.fromhex('000100000001e9') + self.trailer)
+
+    def test_dates(self):
+        tz = datetime.timezone(datetime.timedelta(hours=1))
+        self.assertData(['date', 'date', 'timestamp', 'timestamptz'], [[
+                    datetime.date(2000, 1, 2),
+                    datetime.date(1999, 12, 31),
+                    datetime.datetime(2000, 1, 1, 0, 0, 1, 5),
+                    datetime.datetime(2000, 1, 1, 1, tzinfo=tz),
+                    ]],
+            '0004'
+            '0000000400000001'
+            '00000004ffffffff'
+            '0000000800000000000f4245'
+            '000000080000000000000000')
+
+    def test_numeric(self):
+        for value, expected in [
+                (Decimal('1234.5678'), '000200000000000404d2162e'),
+                (Decimal('-0.001'), '0001ffff40000003000a'),
+                (Decimal('100000'), '0001000100000000000a'),
+                (Decimal('12345678.9'), '000300010000000104d2162e2328'),
+                (Decimal('1.10'), '0002000000000002000103e8'),
+                (Decimal('0.00'), '0000000000000002'),
+                (Decimal('-0'), '0000000000000000'),
+                (Decimal('NaN'), '00000000c0000000'),
+                (Decimal('Infinity'), '00000000d0000000'),
+                (Decimal('-Infinity'), '00000000f0000000'),
+                (42, '0001000000000000002a'),
+                (1.5, '000200000000000100011388'),
+                ]:
+            with self.subTest(value=value):
+                length = '%08x' % (len(expected) // 2)
+                self.assertData(['numeric'], [[value]],
+                    '0001' + length + expected)
+
+    def test_array(self):
+        self.assertData(['int4[]', 'text[]', 'float8[]'], [[
+                    [[1, 2], [3, 4]],
+                    ['a', None],
+                    [],
+                    ]],
+            '0003'
+            '0000003c'
+            '00000002' '00000000' '00000017'
+            '00000002' '00000001' '00000002' '00000001'
+            '0000000400000001' '0000000400000002'
+            '0000000400000003' '0000000400000004'
+            '0000001d'
+            '00000001' '00000001' '00000019'
+            '00000002' '00000001'
+            '0000000161' 'ffffffff'
+            '0000000c'
+            '00000000' '00000000' '000002bd')
+
+    def test_array_array(self):
+        self.assertEqual(
+            self.data(['int8[]'], [[array.array('q', [1, 2])]]),
+            self.data(['int8[]'], [[[1, 2]]]))
+
+    def test_columns(self):
+        types = ['int4', 'float8', 'bool']
+        rows = [(i, i / 2, bool(i % 2)) for i in range(10)]
+        columns = [
+            array.array('i', range(10)),
+            array.array('d', [i / 2 for i in range(10)]),
+            array.array('b', [i % 2 for i in range(10)]),
+            ]
+        self.assertEqual(
+            self.data(types, columns, columnar=True, size=50),
+            self.data(types, rows))
+        self.assertEqual(
+            self.data(types, [list(c) for c in columns], columnar=True),
+            self.data(types, rows))
+
+    def test_chunks(self):
+        copy = self.table.copy_from(format='binary', types=['int4', 'text'])
+        rows = [(i, str(i)) for i in range(10)]
+        chunks = list(copy.iter_data_chunks(rows, size=20))
+        self.assertGreater(len(chunks), 3)
+        self.assertTrue(all(len(c) < 40 for c in chunks))
+        self.assertEqual(b''.join(chunks), self.data(['int4', 'text'], rows))
+
+    def test_write_data_to(self):
+        fp = io.BytesIO()
+        self.table.copy_from(format='binary', types=['int4']).write_data_to(
+            fp, [[1]])
+        self.assertEqual(fp.getvalue(), self.data(['int4'], [[1]]))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.copy_from(format='binary', types=['int3'])
+        with self.assertRaises(ValueError):
+            self.data(None, [[1]])
+        copy = self.table.copy_from(
+            [self.table.c], format='binary', types=['int4', 'int4'])
+        with self.assertRaises(ValueError):
+            list(copy.iter_data_chunks([[1]]))
+        for types, row in [
+                (['int4'], [1, 2]),
+                (['int2'], [2 ** 16]),
+                (['int4'], [1.5]),
+                (['timestamptz'], [datetime.datetime(2000, 1, 1)]),
+                (['timestamp'], [datetime.datetime(
+                            2000, 1, 1, tzinfo=datetime.timezone.utc)]),
+                (['int4[]'], [[[1, 2], [3]]]),
+                (['int4[]'], [[[[1, 2], [3]], [[4, 5, 6, 7], [8]]]]),
+                (['int4[]'], [[[1, 2], 3]]),
+                (['bool'], ['false']),
+                (['bool'], [2]),
+                (['int4', 'bool'], [1, 'false']),
+                (['bool[]'], [[True, 'false']]),
+                (['text'], [1]),
+                (['varchar'], [b'foo']),
+                (['uuid'], ['x']),
+                (['bytea'], ['x']),
+                (['bytea'], [3]),
+                (['date'], ['x']),
+                (['numeric'], ['x']),
+                (['numeric[]'], [['x']]),
+                ]:
+            with self.subTest(types=types, row=row):
+                with self.assertRaises(ValueError):
+                    self.data(types, [row])
@@ -1,13 +1,16 @@
 # This file is part of python-sql.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import pickle
 import unittest
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 
 from sql import (
-    Cube, Flavor, For, Grouping, Join, Literal, Rollup, Select, Table, Union,
-    Window, With)
+    Cube, Expression, Flavor, For, Grouping, Join, Literal, Rollup, Select,
+    Table, Union, Window, With, compile, trusted)
 from sql.aggregate import Max, Min
+from sql.frozen import freeze
 from sql.functions import DatePart, Function, Now, Rank
 
 
@@ -59,6 +62,110 @@ class TestSelect(unittest.TestCase):
         with self.assertRaises(ValueError):
             Select(['foo'])
 
+    def test_select_trusted(self):
+        with trusted():
+            Select(['foo'], order_by=['bar'])
+        with self.assertRaises(ValueError):
+            Select(['foo'])
+
+    def test_select_trusted_where(self):
+        "Test trusted mode validates the values which are not sequences"
+        with trusted(), self.assertRaises(ValueError):
+            self.table.select(where='foo')
+
+    def test_select_derive(self):
+        query = self.table.select(self.table.c,
+            where=self.table.c > 1, order_by=[self.table.c])
+        derived = (query
+            .with_where(query.where & (self.table.d == 2))
+            .with_order_by([self.table.d])
+            .with_limit(10)
+            .with_offset(20))
+        self.assertEqual(str(query),
+            'SELECT "a"."c" FROM "t" AS "a" WHERE "a"."c" > %s '
+            'ORDER BY "a"."c"')
+        self.assertEqual(str(derived),
+            'SELECT "a"."c" FROM "t" AS "a" '
+            'WHERE ("a"."c" > %s) AND ("a"."d" = %s) '
+            'ORDER BY "a"."d" LIMIT %s OFFSET %s')
+        self.assertEqual(derived.params, (1, 2, 10, 20))
+        self.assertIs(derived.columns, query.columns)
+        self.assertIs(derived.where[0], query.where)
+
+    def test_select_derive_clauses(self):
+        query = self.table.select(self.table.c)
+        derived = (query
+            .with_columns(self.table.d)
+            .with_from(self.table + Table('u'))
+            .with_group_by([self.table.d])
+            .with_having(self.table.d > 1))
+        self.assertEqual(str(derived),
+            'SELECT "a"."d" FROM "t" AS "a", "u" AS "b" '
+            'GROUP BY "a"."d" HAVING "a"."d" > %s')
+        self.assertEqual(str(query), 'SELECT "a"."c" FROM "t" AS "a"')
+
+    def test_select_derive_copy_lists(self):
+        query = self.table.select(order_by=[self.table.c])
+        derived = query.with_limit(1)
+        derived.order_by.append(self.table.d)
+        derived.from_.append(Table('u'))
+        self.assertEqual(str(query),
+            'SELECT * FROM "t" AS "a" ORDER BY "a"."c"')
+
+    def test_select_derive_invalid(self):
+        with self.assertRaises(ValueError):
+            self.table.select().with_limit('foo')
+
+    def test_select_rendered(self):
+        query = self.table.select(freeze(self.table.c),
+            where=freeze((self.table.c > 1) & (self.table.d == 'foo')),
+            order_by=[freeze(self.table.c)])
+        for limit in [10, 20]:
+            query.limit = limit
+            self.assertEqual(tuple(query), (
+                    'SELECT "a"."c" FROM "t" AS "a" '
+                    'WHERE ("a"."c" > %s) AND ("a"."d" = %s) '
+                    'ORDER BY "a"."c" LIMIT %s', (1, 'foo', limit)))
+            if limit == 10:
+                rendered = dict(query._rendered)
+        self.assertIs(query._rendered['where'], rendered['where'])
+        self.assertIs(query._rendered['columns'], rendered['columns'])
+        self.assertIs(query._rendered['order_by'], rendered['order_by'])
+
+    def test_select_rendered_invalidate(self):
+        query = self.table.select(where=freeze(self.table.c == 1))
+        self.assertEqual(str(query),
+            'SELECT * FROM "t" AS "a" WHERE "a"."c" = %s')
+        query.where = freeze(self.table.c == 2)
+        self.assertNotIn('where', query._rendered)
+        self.assertEqual(query.params, (2,))
+
+    def test_select_rendered_mutable(self):
+        query = self.table.select(where=self.table.c == 1)
+        str(query)
+        query.where.right = 2
+        self.assertEqual(query.params, (2,))
+        self.assertNotIn('where', query._rendered)
+
+    def test_select_rendered_flavor(self):
+        query = self.table.select(
+            where=freeze(self.table.c == 1), limit=10, offset=20)
+        self.assertEqual(str(query),
+            'SELECT * FROM "t" AS "a" WHERE "a"."c" = %s LIMIT %s OFFSET %s')
+        flavor = Flavor(limitstyle='fetch', paramstyle='qmark')
+        self.assertEqual(compile(query, flavor), (
+                'SELECT * FROM "t" AS "a" WHERE "a"."c" = ? '
+                'OFFSET (?) ROWS FETCH FIRST (?) ROWS ONLY', (1, 20, 10)))
+
+    def test_select_rendered_alias(self):
+        query = self.table.select(where=freeze(self.table.c == 1))
+        other = Table('u')
+        self.assertEqual(str(query),
+            'SELECT * FROM "t" AS "a" WHERE "a"."c" = %s')
+        query.from_ = other + self.table
+        self.assertEqual(str(query),
+            'SELECT * FROM "u" AS "a", "t" AS "b" WHERE "b"."c" = %s')
+
     def test_select_invalid_where(self):
         with self.assertRaises(ValueError):
             self.table.select(where='foo')
@@ -452,6 +559,52 @@ class TestSelect(unittest.TestCase):
         finally:
             Flavor.set(Flavor())
 
+    def test_select_rownum_not_modified(self):
+        query = self.table.select(limit=50, offset=10,
+            for_=For('UPDATE'))
+        seen = []
+
+        class Inspect(Expression):
+            def _compile(self, ctx):
+                seen.append((query.limit, query.offset, query.for_))
+                ctx.write('1')
+
+        query.where = Inspect()
+        with Flavor.use(Flavor(limitstyle='rownum')):
+            self.assertEqual(str(query),
+                'SELECT "a".* FROM ('
+                    'SELECT "b".*, ROWNUM AS "rnum" FROM ('
+                        'SELECT * FROM "t" AS "c" WHERE 1) AS "b" '
+                    'WHERE ROWNUM <= %s) AS "a" '
+                'WHERE "rnum" > %s FOR UPDATE')
+        self.assertEqual(seen, [(50, 10, query.for_)])
+        self.assertEqual(
+            (query.limit, query.offset, len(query.for_)), (50, 10, 1))
+
+    def test_select_rownum_cached(self):
+        query = self.table.select(limit=50, offset=10)
+        self.assertIs(query._rownum(), query._rownum())
+
+        rownum = query._rownum()
+        query.limit = 20
+        self.assertIsNot(query._rownum(), rownum)
+        with Flavor.use(Flavor(limitstyle='rownum')):
+            self.assertEqual(query.params, (30, 10))
+
+    def test_select_rownum_threads(self):
+        query = self.table.select(where=self.table.c == 1, limit=50)
+        flavor = Flavor(limitstyle='rownum')
+        expected = compile(query, flavor)
+
+        def compile_():
+            return [compile(query, flavor) for _ in range(100)]
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: compile_(), range(4)))
+        for result in results:
+            self.assertEqual(result, [expected] * 100)
+        self.assertEqual(query.limit, 50)
+
     def test_select_for(self):
         c = self.table.c
         query = self.table.select(c, for_=For('UPDATE'))
@@ -470,6 +623,16 @@ class TestSelect(unittest.TestCase):
         self.assertEqual(str(copy_query), 'SELECT * FROM "t" AS "a"')
         self.assertEqual(tuple(copy_query.params), ())
 
+    def test_pickle(self):
+        w = With(query=self.table.select(self.table.c1))
+        query = w.select(w.c1, where=freeze(w.c1 == 1), with_=[w])
+        expected = compile(query)
+        self.assertIn('where', query._rendered)
+        query = pickle.loads(pickle.dumps(query))
+        self.assertEqual(query._rendered, {})
+        self.assertEqual(compile(query), expected)
+        self.assertIs(query.with_[0], query.from_[0])
+
     def test_with(self):
         w = With(query=self.table.select(self.table.c1))
 
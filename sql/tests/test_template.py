@@ -0,0 +1,53 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import unittest
+
+from sql import Flavor, Param, Table, Template
+
+
+class TestTemplate(unittest.TestCase):
+    table = Table('t')
+
+    def test_param(self):
+        param = Param('id')
+        self.assertEqual(str(param), '%s')
+        self.assertEqual(param.params, (param,))
+        self.assertEqual(param.name, 'id')
+
+    def test_param_flavor(self):
+        query = self.table.select(where=self.table.id == Param('id'))
+        template = Template(query, Flavor(paramstyle='qmark'))
+        self.assertEqual(template.sql,
+            'SELECT * FROM "t" AS "a" WHERE "a"."id" = ?')
+
+    def test_bind(self):
+        query = self.table.select(
+            where=(self.table.id == Param('id'))
+            & (self.table.name == 'foo')
+            & (self.table.parent != Param('id')))
+        template = Template(query)
+
+        self.assertEqual(template.sql,
+            'SELECT * FROM "t" AS "a" WHERE ("a"."id" = %s) '
+            'AND ("a"."name" = %s) AND ("a"."parent" != %s)')
+        self.assertEqual(template.names, {'id'})
+        self.assertEqual(
+            template.bind(id=42), (42, 'foo', 42))
+        self.assertEqual(
+            template.bind(id=43), (43, 'foo', 43))
+
+    def test_bind_missing(self):
+        template = Template(
+            self.table.select(where=self.table.id == Param('id')))
+        with self.assertRaises(ValueError):
+            template.bind(name='foo')
+
+    def test_bind_named(self):
+        query = self.table.select(
+            where=(self.table.id == Param('id'))
+            & (self.table.name == 'foo'))
+        template = Template(query, Flavor(paramstyle='named'))
+        self.assertEqual(template.sql,
+            'SELECT * FROM "t" AS "a" WHERE ("a"."id" = :id) '
+            'AND ("a"."name" = :p2)')
+        self.assertEqual(template.bind(id=42), {'id': 42, 'p2': 'foo'})
@@ -2,12 +2,49 @@
 # this repository contains the full copyright notices and license terms.
 import unittest
 
-from sql import Literal, Table, With
+from sql import Flavor, From, Literal, Param, Table, With, compile
+from sql.frozen import freeze
 
 
 class TestUpdate(unittest.TestCase):
     table = Table('t')
 
+    def test_update_derive(self):
+        query = self.table.update([self.table.c], ['foo'])
+        derived = query.with_where(self.table.b == 1)
+        self.assertEqual(str(derived),
+            'UPDATE "t" AS "a" SET "c" = %s WHERE "a"."b" = %s')
+        self.assertEqual(derived.params, ('foo', 1))
+        self.assertEqual(str(query), 'UPDATE "t" AS "a" SET "c" = %s')
+
+    def test_update_rendered(self):
+        query = self.table.update([self.table.c], [freeze(Literal('foo'))],
+            where=freeze(self.table.b == 1), returning=[freeze(self.table.c)])
+        expected = ('UPDATE "t" AS "a" SET "c" = %s WHERE "a"."b" = %s '
+            'RETURNING "a"."c"', ('foo', 1))
+        self.assertEqual(compile(query), expected)
+        rendered = dict(query._rendered)
+        self.assertEqual(set(rendered), {'values', 'where', 'returning'})
+        self.assertEqual(compile(query), expected)
+        for name in rendered:
+            self.assertIs(query._rendered[name], rendered[name])
+
+        query.where = freeze(self.table.b == 2)
+        self.assertNotIn('where', query._rendered)
+        self.assertEqual(query.params, ('foo', 2))
+
+        # The table is aliased after the from items
+        query.from_ = From([Table('u')])
+        self.assertEqual(str(query),
+            'UPDATE "t" AS "b" SET "c" = %s FROM "u" AS "a" '
+            'WHERE "b"."b" = %s RETURNING "b"."c"')
+
+    def test_update_rendered_columns(self):
+        query = self.table.update([self.table.c], [freeze(Literal('foo'))])
+        str(query)
+        query.columns[0] = self.table.d
+        self.assertEqual(str(query), 'UPDATE "t" AS "a" SET "d" = %s')
+
     def test_update1(self):
         query = self.table.update([self.table.c], ['foo'])
         self.assertEqual(str(query), 'UPDATE "t" AS "a" SET "c" = %s')
@@ -65,6 +102,24 @@ class TestUpdate(unittest.TestCase):
             'WHERE ("a"."c1" = "b"."c") AND ("a"."c2" = %s))')
         self.assertEqual(query.params, ('foo', 'bar'))
 
+    def test_update_executemany_form(self):
+        query = self.table.update([self.table.c], [None],
+            where=(self.table.id == Param('id')) & (self.table.d > 1))
+        sql, params = query.executemany_form(iter([['foo', 1], ['bar', 2]]))
+        self.assertEqual(sql,
+            'UPDATE "t" AS "a" SET "c" = %s '
+            'WHERE ("a"."id" = %s) AND ("a"."d" > %s)')
+        self.assertEqual(list(params), [('foo', 1, 1), ('bar', 2, 1)])
+
+    def test_update_executemany_form_named(self):
+        query = self.table.update([self.table.c], [None],
+            where=self.table.id == Param('id'))
+        sql, params = query.executemany_form(
+            [['foo', 1]], Flavor(paramstyle='named'))
+        self.assertEqual(sql,
+            'UPDATE "t" AS "a" SET "c" = :c WHERE "a"."id" = :id')
+        self.assertEqual(list(params), [{'c': 'foo', 'id': 1}])
+
     def test_with(self):
         t1 = Table('t1')
         w = With(query=t1.select(t1.c1))
@@ -3,6 +3,7 @@
 import unittest
 
 from sql import Table, Window
+from sql.frozen import freeze
 
 
 class TestWindow(unittest.TestCase):
@@ -25,6 +26,20 @@ class TestWindow(unittest.TestCase):
         self.assertEqual(str(window), 'PARTITION BY "c" ORDER BY "c"')
         self.assertEqual(window.params, ())
 
+    def test_window_rendered(self):
+        t = Table('t')
+        window = Window([freeze(t.c1)], order_by=[freeze(t.c2)])
+        str(window)
+        rendered = dict(window._rendered)
+        self.assertEqual(set(rendered), {'partition', 'order_by'})
+        self.assertEqual(str(window), 'PARTITION BY "c1" ORDER BY "c2"')
+        for name in rendered:
+            self.assertIs(window._rendered[name], rendered[name])
+
+        window.partition = [freeze(t.c3)]
+        self.assertNotIn('partition', window._rendered)
+        self.assertEqual(str(window), 'PARTITION BY "c3" ORDER BY "c2"')
+
     def test_window_invalid_order(self):
         with self.assertRaises(ValueError):
             Window([Table('t').c], order_by='foo')
@@ -0,0 +1,122 @@
+# This file is part of python-sql.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import io
+import unittest
+
+from sql import AliasManager, Expression, Flavor, Table, Values, With, compile
+from sql.functions import Now
+
+
+class TestWrite(unittest.TestCase):
+    table = Table('t')
+
+    def insert(self, rows=1000, **kwargs):
+        return self.table.insert([self.table.c, self.table.d],
+            [[i, str(i)] for i in range(rows)], **kwargs)
+
+    def chunks(self, query, flavor=None, encoding=None):
+        iterator = query.iter_sql_chunks(flavor, encoding)
+        chunks = list(iterator)
+        return chunks, iterator.params
+
+    def test_write_to(self):
+        query = self.insert()
+        fp = io.StringIO()
+        params = query.write_to(fp)
+        self.assertEqual((fp.getvalue(), params), compile(query))
+
+    def test_write_to_encoding(self):
+        query = self.insert()
+        fp = io.BytesIO()
+        params = query.write_to(fp, encoding='utf-8')
+        self.assertEqual(
+            (fp.getvalue(), params), compile(query, encoding='utf-8'))
+
+    def test_iter_sql_chunks(self):
+        query = self.insert()
+        chunks, params = self.chunks(query)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(chunks[0].startswith('INSERT INTO "t" ("c", "d")'))
+        self.assertEqual((''.join(chunks), params), compile(query))
+
+    def test_iter_sql_chunks_lazy(self):
+        compiled = []
+
+        class Counter(Expression):
+            __slots__ = ()
+
+            def _compile(self, ctx):
+                compiled.append(self)
+                ctx.write('1')
+
+        query = Values([[Counter(), i] for i in range(5000)])
+        iterator = query.iter_sql_chunks(Flavor(paramstyle='named'))
+        next(iterator)
+        self.assertLess(len(compiled), 5000)
+        self.assertEqual(Flavor.get().paramstyle, 'format')
+        self.assertFalse(AliasManager._active())
+        with self.assertRaises(ValueError):
+            iterator.params
+        self.assertGreater(len(list(iterator)), 1)
+        self.assertEqual(len(iterator.params), 5000)
+
+    def test_iter_sql_chunks_select(self):
+        compiled = []
+
+        class Counter(Expression):
+            __slots__ = ()
+
+            def _compile(self, ctx):
+                compiled.append(self)
+                ctx.write('1')
+
+        query = self.table.select(
+            where=self.table.c.in_([Counter() for _ in range(5000)]))
+        iterator = query.iter_sql_chunks()
+        chunk = next(iterator)
+        self.assertLess(len(compiled), 5000)
+        self.assertEqual(
+            (chunk + ''.join(iterator), iterator.params), compile(query))
+
+    def test_iter_sql_chunks_for(self):
+        query = self.insert()
+        iterator = query.iter_sql_chunks()
+        sql = ''
+        for chunk in iterator:
+            sql += chunk
+        self.assertEqual((sql, iterator.params), compile(query))
+
+    def test_iter_sql_chunks_numbered(self):
+        for paramstyle in ['numeric', 'named']:
+            flavor = Flavor(paramstyle=paramstyle)
+            query = self.insert()
+            chunks, params = self.chunks(query, flavor)
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(
+                (''.join(chunks), params), compile(query, flavor))
+
+    def test_insert_returning(self):
+        query = self.insert(returning=[self.table.c])
+        chunks, params = self.chunks(query)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual((''.join(chunks), params), compile(query))
+
+    def test_insert_expression(self):
+        query = self.table.insert([self.table.c, self.table.d],
+            [[i, Now()] for i in range(1000)], returning=[self.table.c])
+        chunks, params = self.chunks(query)
+        self.assertEqual((''.join(chunks), params), compile(query))
+
+    def test_select(self):
+        query = self.table.select(
+            where=self.table.c.in_(list(range(2000))))
+        chunks, params = self.chunks(query)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual((''.join(chunks), params), compile(query))
+
+    def test_select_with(self):
+        with_ = With(query=self.table.select(self.table.c))
+        query = with_.select(
+            where=with_.c.in_(list(range(2000))), with_=[with_])
+        chunks, params = self.chunks(query)
+        self.assertEqual((''.join(chunks), params), compile(query))